@@ -1,14 +1,364 @@
 import os
-import zipfile
 import csv
-from typing import Optional
+import json
+import shutil
+from typing import Any, Optional, Union
 
-try:
-    import openpyxl
-    HAS_OPENPYXL = True
-except ImportError:
-    HAS_OPENPYXL = False
-    print("[WARNING] openpyxl not installed. Excel file support disabled. Install with: pip install openpyxl")
+from . import run_history
+from . import disk_space
+from . import job_workspace
+
+# Heavy optional dependencies are imported on first use so that worker
+# processes and scripts importing these utilities start fast.
+_openpyxl = None
+
+
+def _load_openpyxl():
+    """Import openpyxl on first use.
+    
+    Returns:
+        The openpyxl module, or None if it is not installed
+    """
+    global _openpyxl
+    if _openpyxl is None:
+        try:
+            import openpyxl
+            _openpyxl = openpyxl
+        except ImportError:
+            _openpyxl = False
+            print("[WARNING] openpyxl not installed. Excel file support disabled. Install with: pip install openpyxl")
+    return _openpyxl or None
+
+
+def __getattr__(name):
+    # Keep HAS_OPENPYXL available without importing openpyxl at module load
+    if name == "HAS_OPENPYXL":
+        return _load_openpyxl() is not None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Result mode for agent tools: "text" returns human-readable strings,
+# "structured" returns compact dicts and writes the full text to a side log.
+RESULT_MODE_ENV = "DELTAGEN_RESULT_MODE"
+TOOL_LOG_FILENAME = "deltagen_tool_log.txt"
+
+
+def _structured_results() -> bool:
+    """Check whether tools should return compact structured results."""
+    return os.environ.get(RESULT_MODE_ENV, "text").strip().lower() == "structured"
+
+
+def _tool_result(tool_name: str, text: str, status: str = "ok", code: Optional[str] = None, **fields):
+    """Build a tool return value according to the result mode.
+    
+    In text mode the human-readable text is returned unchanged. In structured
+    mode the text is appended to the side log and a compact dictionary with
+    status, code and the given fields is returned instead, which keeps the
+    agent prompt small on sessions with many partitions.
+    
+    Args:
+        tool_name: Name of the tool producing the result
+        text: Full human-readable result
+        status: "ok", "error" or "needs_input"
+        code: Short machine-readable result code
+        **fields: Compact result fields (counts, paths, per-partition records)
+    
+    Returns:
+        The text, or a dictionary in structured mode
+    """
+    if not _structured_results():
+        return text
+    
+    import time
+    log_path = job_workspace.current().path(TOOL_LOG_FILENAME)
+    try:
+        with open(log_path, 'a') as f:
+            f.write(f"===== {time.strftime('%Y-%m-%d %H:%M:%S')} {tool_name} [{status}] =====\n{text}\n\n")
+    except OSError as e:
+        print(f"[TRACE] Could not write tool log {log_path}: {e}")
+        log_path = None
+    
+    result = {"status": status}
+    if code:
+        result["code"] = code
+    result.update(fields)
+    result["log"] = log_path
+    return result
+
+
+# In-process caches. They make repeated runs in one long-lived process (see
+# delta_server) skip tool discovery and workbook parsing.
+_xdelta_executable = None
+_partition_workbook_cache = {}
+
+
+def find_xdelta_executable() -> Optional[str]:
+    """Find the XDelta executable, probing common names once per process.
+    
+    Returns:
+        Executable name, or None if no XDelta executable is available
+    """
+    import subprocess
+    
+    global _xdelta_executable
+    if _xdelta_executable:
+        return _xdelta_executable
+    
+    for exe_name in ["xdelta3", "xdelta", "xdelta3.exe"]:
+        try:
+            result = subprocess.run([exe_name, "-V"], capture_output=True, timeout=5)
+            if result.returncode == 0:
+                _xdelta_executable = exe_name
+                print(f"[TRACE] Found XDelta executable: {exe_name}")
+                return exe_name
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            continue
+    return None
+
+
+def _read_partition_workbook(xlsx_file: str) -> dict:
+    """Read all sheets of a partition workbook as lists of row value tuples.
+    
+    The parsed workbook is cached per process and reused while the file's
+    mtime and size are unchanged.
+    
+    Args:
+        xlsx_file: Path to the partition .xlsx file
+    
+    Returns:
+        Dictionary mapping sheet name to a list of row tuples (in sheet order)
+    """
+    stat = os.stat(xlsx_file)
+    key = os.path.abspath(xlsx_file)
+    cached = _partition_workbook_cache.get(key)
+    if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        print(f"[TRACE] Using cached partition workbook: {xlsx_file}")
+        return cached[1]
+    
+    openpyxl = _load_openpyxl()
+    workbook = openpyxl.load_workbook(xlsx_file, read_only=True)
+    try:
+        sheets = {name: list(workbook[name].iter_rows(values_only=True)) for name in workbook.sheetnames}
+    finally:
+        workbook.close()
+    
+    _partition_workbook_cache[key] = ((stat.st_mtime_ns, stat.st_size), sheets)
+    return sheets
+
+
+# Session-scoped memoization of agent tool calls. Results are kept in the ADK
+# session state (tool_context.state) keyed by tool name and arguments, and are
+# invalidated when the mtime or size of any file the result depends on changes.
+MEMO_STATE_KEY = "deltagen_tool_memo"
+
+
+def _file_fingerprint(paths: list) -> list:
+    """Return [path, mtime_ns, size] for each path (None values for missing files)."""
+    fingerprint = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            fingerprint.append([path, stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            fingerprint.append([path, None, None])
+    return fingerprint
+
+
+def _memoized_call(tool_context: Optional[Any], tool_name: str, args: dict, paths: list, compute):
+    """Return a memoized tool result from the session state, or compute and store it.
+    
+    Args:
+        tool_context: ADK ToolContext injected into the tool (None outside ADK)
+        tool_name: Name of the tool
+        args: Tool arguments that identify the call
+        paths: Files whose mtime/size invalidate the cached result
+        compute: Zero-argument callable producing the result
+    
+    Returns:
+        The cached or freshly computed tool result
+    """
+    if tool_context is None:
+        return compute()
+    
+    key = f"{tool_name}:{json.dumps(args, sort_keys=True)}"
+    memo = tool_context.state.get(MEMO_STATE_KEY) or {}
+    fingerprint = _file_fingerprint(paths)
+    
+    entry = memo.get(key)
+    if entry and entry["fingerprint"] == fingerprint:
+        print(f"[TRACE] Session cache hit: {tool_name} {args}")
+        return entry["result"]
+    
+    result = compute()
+    
+    # Reassign instead of mutating so ADK records the state delta
+    memo = dict(memo)
+    memo[key] = {"fingerprint": fingerprint, "result": result}
+    tool_context.state[MEMO_STATE_KEY] = memo
+    return result
+
+
+@job_workspace.scoped
+def read_input_data(tool_context: Optional[Any] = None, workspace: Optional[str] = None) -> Union[str, dict]:
+    """Read input data from Input_data.json (the job's own copy, else the shared one).
+    
+    Args:
+        tool_context: ADK tool context (injected by ADK, used for session caching)
+        workspace: Job workspace (name or directory); its own Input_data.json takes precedence
+    
+    Returns:
+        JSON string with input data or error message (compact dict in structured result mode)
+    """
+    input_file = job_workspace.current().input_path("Input_data.json")
+    return _memoized_call(tool_context, "read_input_data", {"path": input_file}, [input_file], _read_input_data)
+
+
+def _read_input_data() -> Union[str, dict]:
+    """Uncached implementation of read_input_data."""
+    input_file = job_workspace.current().input_path("Input_data.json")
+    
+    print(f"[TRACE] Looking for input file: {input_file}")
+    
+    if not os.path.exists(input_file):
+        print(f"[TRACE] Input_data.json not found")
+        return _tool_result("read_input_data", "Error: Input_data.json file not found in current directory",
+                            "error", "input_missing", path=input_file)
+    
+    try:
+        with open(input_file, 'r') as f:
+            data = json.load(f)
+        
+        print(f"[TRACE] Successfully read Input_data.json: {data}")
+        
+        # Normalize keys by converting to lowercase and removing underscores/hyphens
+        normalized_data = {}
+        for key, value in data.items():
+            normalized_key = key.lower().replace('_', '').replace('-', '')
+            normalized_data[normalized_key] = value
+        
+        # Extract data using normalized keys
+        source_path = normalized_data.get('sourcepath', 'Not specified')
+        target_path = normalized_data.get('targetpath', 'Not specified')
+        ecu_type = normalized_data.get('ecutype', 'Not specified')
+        delta_tool = normalized_data.get('deltatool', 'Not specified')
+        
+        result = f"""Input data read successfully:
+- Source path: {source_path}
+- Target path: {target_path}
+- ECU type: {ecu_type}
+- Delta tool: {delta_tool}
+
+Please review the input data above and confirm if it's correct."""
+        
+        return _tool_result("read_input_data", result, source_path=source_path, target_path=target_path,
+                            ecu_type=ecu_type, delta_tool=delta_tool)
+        
+    except json.JSONDecodeError as e:
+        print(f"[TRACE] Error parsing JSON: {e}")
+        return _tool_result("read_input_data", f"Error: Invalid JSON format in Input_data.json - {str(e)}",
+                            "error", "invalid_json", detail=str(e))
+    except Exception as e:
+        print(f"[TRACE] Error reading file: {e}")
+        return _tool_result("read_input_data", f"Error: Failed to read Input_data.json - {str(e)}",
+                            "error", "read_failed", detail=str(e))
+
+
+@job_workspace.scoped
+def update_input_data(source_path: str, target_path: str, ecu_type: str, delta_tool: str,
+                      workspace: Optional[str] = None) -> Union[str, dict]:
+    """Update Input_data.json file with new values.
+    
+    Args:
+        source_path: Absolute path of source zip file
+        target_path: Absolute path of target zip file
+        ecu_type: ECU type/name
+        delta_tool: Delta tool type (redbend, delta or auto)
+        workspace: Job workspace (name or directory); the file is written into the job root
+    
+    Returns:
+        Status message with updated data
+    """
+    input_file = job_workspace.current().path("Input_data.json")
+    
+    # Use camelCase keys to match the existing format
+    data = {
+        "sourcePath": source_path,
+        "targetPath": target_path,
+        "ecuType": ecu_type,
+        "deltaTool": delta_tool
+    }
+    
+    try:
+        with open(input_file, 'w') as f:
+            json.dump(data, f, indent=4)
+        
+        print(f"[TRACE] Successfully updated Input_data.json: {data}")
+        
+        # Return formatted message with updated data
+        result = f"""Input_data.json updated successfully!
+
+Updated Input Data:
+- Source path: {source_path}
+- Target path: {target_path}
+- ECU type: {ecu_type}
+- Delta tool: {delta_tool}
+
+Please confirm to proceed with partition file validation and delta generation."""
+        
+        return _tool_result("update_input_data", result, path=input_file)
+        
+    except Exception as e:
+        print(f"[TRACE] Error writing file: {e}")
+        return _tool_result("update_input_data", f"Error: Failed to update Input_data.json - {str(e)}",
+                            "error", "write_failed", detail=str(e))
+
+
+@job_workspace.scoped
+def check_partition_file(ecu_type: str, tool_context: Optional[Any] = None, workspace: Optional[str] = None) -> Union[str, dict]:
+    """Check if the partition file of an ECU exists in the shared inputs of the job workspace.
+    
+    Args:
+        ecu_type: ECU type/name
+        tool_context: ADK tool context (injected by ADK, used for session caching)
+        workspace: Job workspace (name or directory); partition files are shared inputs
+    
+    Returns:
+        Status message indicating if file exists or not
+    """
+    ws = job_workspace.current()
+    return _memoized_call(tool_context, "check_partition_file", {"cwd": ws.root, "ecu_type": ecu_type},
+                          [ws.input_path(f"{ecu_type}_Partition_file.xlsx"), ws.input_path(f"{ecu_type}_Partition_file.csv")],
+                          lambda: _check_partition_file(ecu_type))
+
+
+def _check_partition_file(ecu_type: str) -> Union[str, dict]:
+    """Uncached implementation of check_partition_file."""
+    partition_filename_base = f"{ecu_type}_Partition_file"
+    ws = job_workspace.current()
+    cwd = ws.shared_root
+    
+    print(f"[TRACE] Checking for partition file: {partition_filename_base}")
+    print(f"[TRACE] Current working directory: {ws.root}")
+    
+    # Check for .xlsx extension
+    xlsx_file = f"{partition_filename_base}.xlsx"
+    xlsx_path = ws.input_path(xlsx_file)
+    if os.path.exists(xlsx_path):
+        print(f"[TRACE] Partition file found: {xlsx_path}")
+        return _tool_result("check_partition_file", f"Partition file exists: {xlsx_file}", partition_file=xlsx_file)
+    
+    # Check for .csv extension
+    csv_file = f"{partition_filename_base}.csv"
+    csv_path = ws.input_path(csv_file)
+    if os.path.exists(csv_path):
+        print(f"[TRACE] Partition file found: {csv_path}")
+        return _tool_result("check_partition_file", f"Partition file exists: {csv_file}", partition_file=csv_file)
+    
+    # File not found with either extension
+    print(f"[TRACE] Partition file NOT found: {partition_filename_base}.xlsx or .csv")
+    return _tool_result("check_partition_file",
+                        f"Error: Partition file not found - {partition_filename_base}.xlsx or .csv does not exist in {cwd}",
+                        "error", "partition_file_missing", ecu_type=ecu_type)
 
 
 def flatten_extracted_folder(extract_path: str) -> str:
@@ -47,56 +397,359 @@ def flatten_extracted_folder(extract_path: str) -> str:
     return extract_path
 
 
-def untar_zip_files(source_zip_path: str, target_zip_path: str) -> dict:
-    """Untar/extract source and target zip files.
+def _clone_or_link(existing_path: str, new_path: str) -> Optional[str]:
+    """Create new_path as a reflink (copy-on-write clone) or hardlink of existing_path.
+    
+    Args:
+        existing_path: Path of the already extracted file
+        new_path: Path of the file to create
+    
+    Returns:
+        "reflink" or "hardlink" on success, None if neither is supported
+    """
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    if os.path.lexists(new_path):
+        os.remove(new_path)
+    
+    # Try reflink first (btrfs, XFS, ...) - the copies stay independent on write
+    try:
+        import fcntl
+        FICLONE = 0x40049409
+        with open(existing_path, 'rb') as src, open(new_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        if os.path.exists(new_path):
+            os.remove(new_path)
+    
+    try:
+        os.link(existing_path, new_path)
+        return "hardlink"
+    except OSError:
+        return None
+
+
+def _is_safe_member_name(name: str) -> bool:
+    """Check that a zip member name stays inside the extraction directory."""
+    parts = name.replace('\\', '/').split('/')
+    return not name.startswith('/') and '..' not in parts and ':' not in parts[0]
+
+
+def _extraction_paths(source_archive: str, target_archive: str, staging_dir: Optional[str] = None) -> tuple:
+    """Return the directories a source and a target archive are extracted into.
+    
+    Without a staging directory each archive is extracted next to itself ("-" into the
+    job root). A staging directory holds both, so they get separate source/ and target/
+    subdirectories, as do archives with the same base name in one folder: a shared
+    folder would merge both trees and the deduplication links would replace source files.
+    
+    Returns:
+        Tuple of (source extraction path, target extraction path)
+    """
+    from . import archive_stream
+    
+    names = (archive_stream.archive_base_name(source_archive, "Source"),
+             archive_stream.archive_base_name(target_archive, "Target"))
+    if not staging_dir:
+        parents = [os.path.dirname(os.path.abspath(path)) if path != "-" else job_workspace.current().root
+                   for path in (source_archive, target_archive)]
+        paths = [os.path.join(parent, name) for parent, name in zip(parents, names)]
+        if paths[0] != paths[1]:
+            return tuple(paths)
+    else:
+        parents = [staging_dir, staging_dir]
+    return tuple(os.path.join(parent, role, name) for parent, role, name in zip(parents, ("source", "target"), names))
+
+
+def _nearest_existing_dir(path: str) -> str:
+    while not os.path.isdir(path):
+        path = os.path.dirname(path)
+    return path
+
+
+@job_workspace.scoped
+def preflight_disk_space(source_zip_path: str, target_zip_path: str, deduplicate: bool = True,
+                         workspace: Optional[str] = None) -> Union[str, dict]:
+    """Estimate the disk space a run needs and pick a staging root that can hold it.
+    
+    The estimate uses the zip central directories (uncompressed member sizes) plus
+    the expected delta output, without extracting anything.
     
     Args:
         source_zip_path: Absolute path of source zip file
         target_zip_path: Absolute path of target zip file
+        deduplicate: Whether identical target members will be linked instead of extracted
+        workspace: Job workspace (name or directory) whose delta_output is checked
+    
+    Returns:
+        Preflight report with the selected staging root, or an error if no location has enough space
+    """
+    import zipfile
+    
+    print(f"[TRACE] Disk space preflight...")
+    not_zip = [path for path in (source_zip_path, target_zip_path) if path == "-" or not zipfile.is_zipfile(path)]
+    if not_zip:
+        return _tool_result("preflight_disk_space",
+                            f"Error: Disk space preflight needs zip archives (tar streams have no central directory): {', '.join(not_zip)}",
+                            "error", "unsupported_archive")
+    estimate = disk_space.estimate_required_space(source_zip_path, target_zip_path, deduplicate)
+    selection = disk_space.select_staging_root(estimate["required_bytes"], os.path.dirname(os.path.abspath(source_zip_path)))
+    staging_root = selection["staging_root"]
+    
+    # Deltas go to delta_output; check its filesystem too if it differs from the staging root
+    delta_root = _nearest_existing_dir(job_workspace.current().delta_output)
+    delta_free = shutil.disk_usage(delta_root).free
+    delta_ok = True
+    if staging_root and os.stat(staging_root).st_dev != os.stat(delta_root).st_dev:
+        delta_ok = estimate["delta_bytes"] * (1 + disk_space.SAFETY_MARGIN) <= delta_free
+    
+    lines = [
+        "Disk space preflight:",
+        f"- Extraction: {estimate['extract_bytes']:,} bytes ({estimate['identical_members']} identical member(s) linked)" if deduplicate
+        else f"- Extraction: {estimate['extract_bytes']:,} bytes",
+        f"- Expected delta output: {estimate['delta_bytes']:,} bytes (ratio {estimate['delta_ratio']:.2f})",
+        f"- Required with margin: {estimate['required_bytes']:,} bytes",
+        "- Candidates:",
+    ]
+    lines.extend(f"  {'✓' if c['fits'] else '✗'} {c['path']}: {c['free_bytes']:,} bytes free" for c in selection["candidates"])
+    
+    if not staging_root or not delta_ok:
+        reason = "no staging location has enough free space" if not staging_root else f"not enough space for delta output in {delta_root}"
+        lines.append(f"Error: Insufficient disk space - {reason}")
+        print(f"[TRACE] Preflight failed: {reason}")
+        return _tool_result("preflight_disk_space", "\n".join(lines), "error", "insufficient_space",
+                            required_bytes=estimate["required_bytes"], candidates=selection["candidates"])
+    
+    lines.append(f"Selected staging root: {staging_root}")
+    print(f"[TRACE] Selected staging root: {staging_root}")
+    return _tool_result("preflight_disk_space", "\n".join(lines), staging_root=staging_root,
+                        required_bytes=estimate["required_bytes"], delta_bytes=estimate["delta_bytes"])
+
+
+def _partition_file_filter(ecu_type: str) -> Optional[set]:
+    """Return the (sheet, Partition_Filename) pairs listed in an ECU's partition workbook, or None.
+    
+    Both names are lowercased: image and sheet folder names in build archives do not always
+    follow the case used in the workbook (System.img vs system.img).
+    """
+    xlsx_file = job_workspace.current().input_path(f"{ecu_type}_Partition_file.xlsx")
+    if not os.path.exists(xlsx_file) or not _load_openpyxl():
+        return None
+    
+    allowed = set()
+    for sheet_name, rows in _read_partition_workbook(xlsx_file).items():
+        for row_number, row in enumerate(rows[:10], start=1):
+            filename_col_idx = next((idx for idx, value in enumerate(row) if value and 'Partition_Filename' in str(value)), None)
+            if filename_col_idx is not None:
+                allowed.update((sheet_name.lower(), str(r[filename_col_idx]).strip().lower()) for r in rows[row_number:]
+                               if len(r) > filename_col_idx and r[filename_col_idx] and str(r[filename_col_idx]).strip())
+                break
+    return allowed
+
+
+@job_workspace.scoped
+def untar_zip_files(
+    source_zip_path: str,
+    target_zip_path: str,
+    deduplicate: bool = True,
+    staging_root: Optional[str] = None,
+    ecu_type: Optional[str] = None,
+    workspace: Optional[str] = None
+) -> dict:
+    """Untar/extract source and target zip or tar archives.
+    
+    Zip files are extracted with zipfile, each member being hashed on a thread pool while the
+    next one is extracted. Tar archives (.tar, .tar.gz/.tgz, .tar.xz/.txz, .tar.bz2) are
+    streamed in a single sequential pass and flattened, filtered and hashed on the fly; "-"
+    reads a tar stream from standard input. Either way the SHA-256 digests are written to
+    <extracted folder>/.sha256sums.
+    
+    Args:
+        source_zip_path: Absolute path of source archive (or "-" for a tar stream on standard input)
+        target_zip_path: Absolute path of target archive (or "-" for a tar stream on standard input)
+        deduplicate: If True, target members identical to a source member (same CRC32 and size for zip,
+            same bytes at the same path for tar) are not written again but reflinked/hardlinked
+            to the extracted source copy
+        staging_root: Directory to extract into (in separate source/ and target/ folders). None extracts
+            next to the archives; "auto" runs the disk space preflight and uses the selected staging
+            root (zip archives only)
+        ecu_type: If given, only the files listed in the Partition_Filename column of the ECU's
+            partition file are extracted (sheet and file names match case-insensitively; the
+            members left out are logged and counted in filtered_members)
+        workspace: Job workspace (name or directory); a tar stream on standard input is
+            extracted into its job root
     
     Returns:
-        Dictionary with extracted source and target directory paths
+        Dictionary with extracted source and target directory paths and their hash lists
     """
+    import zipfile
+    from . import archive_stream
+    from . import artifact_hashing
+    
     print(f"[TRACE] Untarring zip files...")
     print(f"[TRACE] Source zip: {source_zip_path}")
     print(f"[TRACE] Target zip: {target_zip_path}")
     
-    # Extract source zip
-    source_dir = os.path.dirname(source_zip_path)
-    source_name = os.path.splitext(os.path.basename(source_zip_path))[0]
-    source_extract_path = os.path.join(source_dir, source_name)
+    if source_zip_path == "-" and target_zip_path == "-":
+        return {"status": "error", "error": "Only one archive can be read from standard input"}
+    source_is_tar = archive_stream.is_tar_archive(source_zip_path)
+    target_is_tar = archive_stream.is_tar_archive(target_zip_path)
+    
+    # Select where to extract
+    if staging_root == "auto" and (source_is_tar or target_is_tar):
+        print(f"[TRACE] Extracted size of tar archives is unknown before reading them, extracting next to the archives")
+        staging_root = None
+    if staging_root == "auto":
+        estimate = disk_space.estimate_required_space(source_zip_path, target_zip_path, deduplicate)
+        staging_root = disk_space.select_staging_root(estimate["required_bytes"], os.path.dirname(os.path.abspath(source_zip_path)))["staging_root"]
+        if not staging_root:
+            print(f"[TRACE] No staging location has {estimate['required_bytes']:,} bytes free")
+            return {"status": "error", "error": f"Insufficient disk space: {estimate['required_bytes']:,} bytes required"}
+    ws = job_workspace.current()
+    if not staging_root and ws.isolated:
+        # Concurrent jobs on the same archives must not extract into the same folders
+        staging_root = ws.root
+    staging_dir = None
+    archive_dirs = [os.path.dirname(os.path.abspath(path)) for path in (source_zip_path, target_zip_path) if path != "-"]
+    if staging_root and os.path.abspath(staging_root) not in archive_dirs:
+        staging_dir = ws.staging_dir(staging_root)
+        print(f"[TRACE] Staging directory: {staging_dir}")
+    
+    source_extract_path, target_extract_path = _extraction_paths(source_zip_path, target_zip_path, staging_dir)
+    
+    allowed = _partition_file_filter(ecu_type) if ecu_type else None
+    if ecu_type and allowed is None:
+        print(f"[TRACE] Partition file for {ecu_type} not readable, extracting all members")
+    
+    filtered_out = {"source": [], "target": []}
+    
+    def keep_for(role: str):
+        def keep(parts: list) -> bool:
+            # <sheet>/<Partition_Filename>, whatever the top-level folder and the case
+            if allowed is None or (len(parts) >= 2 and (parts[-2].lower(), parts[-1].lower()) in allowed):
+                return True
+            filtered_out[role].append('/'.join(parts))
+            return False
+        return keep
+    
+    source_keep, target_keep = keep_for("source"), keep_for("target")
+    
+    # Re-extracting over linked files would write through to both copies
+    if deduplicate:
+        import shutil
+        for stale_path in (source_extract_path, target_extract_path):
+            if os.path.isdir(stale_path):
+                print(f"[TRACE] Removing previous extraction: {stale_path}")
+                shutil.rmtree(stale_path)
     
     print(f"[TRACE] Extracting source to: {source_extract_path}")
-    with zipfile.ZipFile(source_zip_path, 'r') as zip_ref:
-        zip_ref.extractall(source_extract_path)
-    
-    # Flatten source directory structure if nested
-    source_extract_path = flatten_extracted_folder(source_extract_path)
-    
-    # Extract target zip
-    target_dir = os.path.dirname(target_zip_path)
-    target_name = os.path.splitext(os.path.basename(target_zip_path))[0]
-    target_extract_path = os.path.join(target_dir, target_name)
-    
+    extracted_by_content = {}
+    hash_manifests = {}
+    # Zip members are hashed in the background while the next ones are extracted
+    hash_pool = artifact_hashing.HashPool()
+    if source_is_tar:
+        stats = archive_stream.extract_tar_stream(source_zip_path, source_extract_path, source_keep)
+        hash_manifests["source"] = stats["hash_manifest"]
+        print(f"[TRACE] Streamed {stats['extracted_files']} file(s), {stats['extracted_bytes']:,} bytes")
+    else:
+        with zipfile.ZipFile(source_zip_path, 'r') as zip_ref:
+            for member in zip_ref.infolist():
+                if member.is_dir() or source_keep(member.filename.split('/')):
+                    extracted_path = zip_ref.extract(member, source_extract_path)
+                    if not member.is_dir():
+                        hash_pool.submit(extracted_path, role="source")
+            
+            # Index extracted source members by (CRC32, size) for deduplication
+            for member in zip_ref.infolist():
+                if member.is_dir() or member.file_size == 0 or not _is_safe_member_name(member.filename):
+                    continue
+                member_path = os.path.join(source_extract_path, *member.filename.split('/'))
+                if os.path.isfile(member_path):
+                    extracted_by_content.setdefault((member.CRC, member.file_size), member_path)
+        if target_is_tar:
+            # The streamed target is compared against the flattened source tree
+            hash_records = hash_pool.results()
+            source_extract_path = flatten_extracted_folder(source_extract_path)
+            hash_manifests["source"] = artifact_hashing.write_tree_sums(source_extract_path, hash_records)
+    
+    # Extract target archive
     print(f"[TRACE] Extracting target to: {target_extract_path}")
-    with zipfile.ZipFile(target_zip_path, 'r') as zip_ref:
-        zip_ref.extractall(target_extract_path)
-    
-    # Flatten target directory structure if nested
-    target_extract_path = flatten_extracted_folder(target_extract_path)
+    deduplicated_files = 0
+    deduplicated_bytes = 0
+    if target_is_tar:
+        stats = archive_stream.extract_tar_stream(target_zip_path, target_extract_path, target_keep,
+                                                  reference_root=source_extract_path if deduplicate else None)
+        hash_manifests["target"] = stats["hash_manifest"]
+        deduplicated_files, deduplicated_bytes = stats["deduplicated_files"], stats["deduplicated_bytes"]
+        print(f"[TRACE] Streamed {stats['extracted_files']} file(s), {stats['extracted_bytes']:,} bytes")
+    else:
+        with zipfile.ZipFile(target_zip_path, 'r') as zip_ref:
+            if not deduplicate:
+                for member in zip_ref.infolist():
+                    if member.is_dir() or target_keep(member.filename.split('/')):
+                        extracted_path = zip_ref.extract(member, target_extract_path)
+                        if not member.is_dir():
+                            hash_pool.submit(extracted_path, role="target")
+            else:
+                for member in zip_ref.infolist():
+                    if not member.is_dir() and not target_keep(member.filename.split('/')):
+                        continue
+                    existing_path = extracted_by_content.get((member.CRC, member.file_size))
+                    if existing_path and not member.is_dir() and _is_safe_member_name(member.filename):
+                        member_path = os.path.join(target_extract_path, *member.filename.split('/'))
+                        link_method = _clone_or_link(existing_path, member_path)
+                        if link_method:
+                            print(f"[TRACE] Identical member {member.filename} {link_method}ed from source")
+                            deduplicated_files += 1
+                            deduplicated_bytes += member.file_size
+                            # A hardlink shares the source file's digest; a reflink is a new inode
+                            if link_method == "reflink":
+                                hash_pool.submit(member_path, role="target")
+                            continue
+                    extracted_path = zip_ref.extract(member, target_extract_path)
+                    if not member.is_dir():
+                        hash_pool.submit(extracted_path, role="target")
+    
+    # Files must not move while they are hashed
+    hash_records = hash_pool.results()
+    hash_pool.close()
+    
+    # Flatten directory structures if nested (links survive the move); tar streams are already flat
+    if not source_is_tar and not target_is_tar:
+        source_extract_path = flatten_extracted_folder(source_extract_path)
+        hash_manifests["source"] = artifact_hashing.write_tree_sums(source_extract_path, hash_records)
+    if not target_is_tar:
+        target_extract_path = flatten_extracted_folder(target_extract_path)
+        hash_manifests["target"] = artifact_hashing.write_tree_sums(target_extract_path, hash_records)
+    
+    # Cleanup may remove these trees once their images are done; user directories are never marked
+    disk_space.mark_extracted_tree(source_extract_path)
+    disk_space.mark_extracted_tree(target_extract_path)
     
     print(f"[TRACE] Extraction complete")
     print(f"[TRACE] Actual source path: {source_extract_path}")
     print(f"[TRACE] Actual target path: {target_extract_path}")
+    if deduplicate:
+        print(f"[TRACE] Deduplicated {deduplicated_files} identical file(s), {deduplicated_bytes:,} bytes not rewritten")
+    for role, members in filtered_out.items():
+        if members:
+            shown = ', '.join(members[:10]) + (f" (+{len(members) - 10} more)" if len(members) > 10 else "")
+            print(f"[TRACE] {len(members)} {role} member(s) not listed in {ecu_type}_Partition_file, not extracted: {shown}")
     
     return {
         "source_path": source_extract_path,
         "target_path": target_extract_path,
+        "deduplicated_files": deduplicated_files,
+        "deduplicated_bytes": deduplicated_bytes,
+        "filtered_members": {role: len(members) for role, members in filtered_out.items()},
+        "hash_manifests": hash_manifests,
         "status": "success"
     }
 
 
-def validate_target_folders_with_partition(target_path: str, ecu_type: str, source_path: Optional[str] = None) -> str:
+@job_workspace.scoped
+def validate_target_folders_with_partition(target_path: str, ecu_type: str, source_path: Optional[str] = None,
+                                           workspace: Optional[str] = None) -> Union[str, dict]:
     """Validate that target folder (and optionally source folder) contains subfolders matching partition file sheets 
     and that all files listed in Partition_Filename column exist in corresponding subfolders.
     
@@ -104,6 +757,7 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
         target_path: Path to the extracted target folder
         ecu_type: ECU type/name to find the partition file
         source_path: Optional path to the extracted source folder for comparison
+        workspace: Job workspace (name or directory)
     
     Returns:
         Validation status message
@@ -115,14 +769,15 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
     print(f"[TRACE] ECU type: {ecu_type}")
     
     # Find partition file
-    cwd = os.getcwd()
+    ws = job_workspace.current()
     partition_filename_base = f"{ecu_type}_Partition_file"
-    xlsx_file = os.path.join(cwd, f"{partition_filename_base}.xlsx")
-    csv_file = os.path.join(cwd, f"{partition_filename_base}.csv")
+    xlsx_file = ws.input_path(f"{partition_filename_base}.xlsx")
+    csv_file = ws.input_path(f"{partition_filename_base}.csv")
     
     # Get subfolders in target path
     if not os.path.exists(target_path):
-        return f"Error: Target path does not exist - {target_path}"
+        return _tool_result("validate_target_folders_with_partition", f"Error: Target path does not exist - {target_path}",
+                            "error", "target_missing", path=target_path)
     
     target_subfolders = [f for f in os.listdir(target_path) 
                          if os.path.isdir(os.path.join(target_path, f))]
@@ -132,7 +787,8 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
     source_subfolders = []
     if source_path:
         if not os.path.exists(source_path):
-            return f"Error: Source path does not exist - {source_path}"
+            return _tool_result("validate_target_folders_with_partition", f"Error: Source path does not exist - {source_path}",
+                                "error", "source_missing", path=source_path)
         source_subfolders = [f for f in os.listdir(source_path) 
                             if os.path.isdir(os.path.join(source_path, f))]
         print(f"[TRACE] Source subfolders: {source_subfolders}")
@@ -140,10 +796,11 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
     all_missing_files = {}
     
     # Process Excel file
-    if os.path.exists(xlsx_file) and HAS_OPENPYXL:
+    openpyxl = _load_openpyxl() if os.path.exists(xlsx_file) else None
+    if os.path.exists(xlsx_file) and openpyxl:
         print(f"[TRACE] Reading partition file: {xlsx_file}")
-        workbook = openpyxl.load_workbook(xlsx_file, read_only=True)
-        sheet_names = workbook.sheetnames
+        workbook = _read_partition_workbook(xlsx_file)
+        sheet_names = list(workbook)
         print(f"[TRACE] Found sheets: {sheet_names}")
         
         # Validate that all sheets have corresponding folders in target
@@ -153,9 +810,10 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
                 missing_folders.append(sheet_name)
         
         if missing_folders:
-            workbook.close()
             print(f"[TRACE] Missing folders in target: {missing_folders}")
-            return f"Error: Content invalid - Target folder missing subfolders: {', '.join(missing_folders)}"
+            return _tool_result("validate_target_folders_with_partition",
+                                f"Error: Content invalid - Target folder missing subfolders: {', '.join(missing_folders)}",
+                                "error", "target_folders_missing", folders=missing_folders)
         
         # Validate source folders if source path provided
         if source_path:
@@ -165,22 +823,23 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
                     missing_source_folders.append(sheet_name)
             
             if missing_source_folders:
-                workbook.close()
                 print(f"[TRACE] Missing folders in source: {missing_source_folders}")
-                return f"Error: Content invalid - Source folder missing subfolders: {', '.join(missing_source_folders)}"
+                return _tool_result("validate_target_folders_with_partition",
+                                    f"Error: Content invalid - Source folder missing subfolders: {', '.join(missing_source_folders)}",
+                                    "error", "source_folders_missing", folders=missing_source_folders)
         
         # Validate files in each sheet
         for sheet_name in sheet_names:
-            sheet = workbook[sheet_name]
+            rows = workbook[sheet_name]
             print(f"[TRACE] Validating files for sheet: {sheet_name}")
             
             # Find Partition_Filename column
             header_row = None
             filename_col_idx = None
-            for row in sheet.iter_rows(min_row=1, max_row=10):
-                for idx, cell in enumerate(row):
-                    if cell.value and 'Partition_Filename' in str(cell.value):
-                        header_row = cell.row
+            for row_number, row in enumerate(rows[:10], start=1):
+                for idx, value in enumerate(row):
+                    if value and 'Partition_Filename' in str(value):
+                        header_row = row_number
                         filename_col_idx = idx
                         break
                 if filename_col_idx is not None:
@@ -199,7 +858,7 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
             if source_path:
                 source_folder_path = os.path.join(source_path, sheet_name)
             
-            for row in sheet.iter_rows(min_row=header_row + 1, values_only=True):
+            for row in rows[header_row:]:
                 if row[filename_col_idx]:
                     filename = str(row[filename_col_idx]).strip()
                     if filename:
@@ -222,10 +881,10 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
                 all_missing_files[f"source/{sheet_name}"] = missing_source_files
                 print(f"[TRACE] Missing files in source/{sheet_name}: {missing_source_files}")
         
-        workbook.close()
-        
-    elif os.path.exists(xlsx_file) and not HAS_OPENPYXL:
-        return f"Error: Excel file found but openpyxl not installed. Install with: pip install openpyxl"
+    elif os.path.exists(xlsx_file) and not openpyxl:
+        return _tool_result("validate_target_folders_with_partition",
+                            "Error: Excel file found but openpyxl not installed. Install with: pip install openpyxl",
+                            "error", "openpyxl_missing")
     
     # Process CSV file (simpler format - not sheet-based)
     elif os.path.exists(csv_file):
@@ -280,7 +939,9 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
         print(f"[TRACE] Found partition entries in CSV")
     
     else:
-        return f"Error: Partition file not found - {partition_filename_base}.xlsx or .csv"
+        return _tool_result("validate_target_folders_with_partition",
+                            f"Error: Partition file not found - {partition_filename_base}.xlsx or .csv",
+                            "error", "partition_file_missing", ecu_type=ecu_type)
     
     # Report errors if any files are missing
     if all_missing_files:
@@ -291,23 +952,26 @@ def validate_target_folders_with_partition(target_path: str, ecu_type: str, sour
                 error_msg += f" ... and {len(files) - 5} more"
             error_msg += "\n"
         print(f"[TRACE] Validation failed - missing files detected")
-        return error_msg.strip()
+        return _tool_result("validate_target_folders_with_partition", error_msg.strip(), "error", "files_missing",
+                            missing_counts={folder: len(files) for folder, files in all_missing_files.items()})
     
     print(f"[TRACE] Validation successful - All folders and files are present")
     validation_msg = "Validation successful: All partition folders and files are present in target"
     if source_path:
         validation_msg += " and source"
-    return validation_msg
+    return _tool_result("validate_target_folders_with_partition", validation_msg, source_checked=bool(source_path))
 
 
+@job_workspace.scoped
 def generate_config_xml(
     ecu_type: str,
     source_path: str,
     target_path: str,
     component_delta_filename: str = "source_target.mld",
     output_path: Optional[str] = None,
-    partition_sheet: Optional[str] = None
-) -> str:
+    partition_sheet: Optional[str] = None,
+    workspace: Optional[str] = None
+) -> Union[str, dict]:
     """Generate config.xml for Redbend delta generation based on partition file.
     
     Args:
@@ -315,15 +979,17 @@ def generate_config_xml(
         source_path: Path to the extracted source folder
         target_path: Path to the extracted target folder
         component_delta_filename: Name of the delta file (default: source_target.mld)
-        output_path: Path where config.xml should be created (default: current working directory)
+        output_path: Path where config.xml should be created (default: the job workspace root)
         partition_sheet: Specific sheet name to process. If None and multiple sheets exist, will list available sheets
+        workspace: Job workspace (name or directory); config and statistics files go to its job root
     
     Returns:
         Status message with path to generated config.xml or list of available sheets
     """
-    # Use current working directory if output_path not specified
+    ws = job_workspace.current()
+    # Use the job root if output_path not specified
     if output_path is None:
-        output_path = os.getcwd()
+        output_path = ws.root
     
     print(f"[TRACE] Generating config.xml...")
     print(f"[TRACE] ECU type: {ecu_type}")
@@ -334,38 +1000,41 @@ def generate_config_xml(
     if partition_sheet:
         print(f"[TRACE] Selected partition sheet: {partition_sheet}")
     
-    # Find partition file
-    cwd = os.getcwd()
+    # Find partition file; statistics are written per job
+    cwd = ws.root
     partition_filename_base = f"{ecu_type}_Partition_file"
-    xlsx_file = os.path.join(cwd, f"{partition_filename_base}.xlsx")
-    csv_file = os.path.join(cwd, f"{partition_filename_base}.csv")
+    xlsx_file = ws.input_path(f"{partition_filename_base}.xlsx")
+    csv_file = ws.input_path(f"{partition_filename_base}.csv")
     
     partitions = []
     
     # Process Excel file
-    if os.path.exists(xlsx_file) and HAS_OPENPYXL:
+    openpyxl = _load_openpyxl() if os.path.exists(xlsx_file) else None
+    if os.path.exists(xlsx_file) and openpyxl:
         print(f"[TRACE] Reading partition file: {xlsx_file}")
-        workbook = openpyxl.load_workbook(xlsx_file, read_only=True)
-        sheet_names = workbook.sheetnames
+        workbook = _read_partition_workbook(xlsx_file)
+        sheet_names = list(workbook)
         print(f"[TRACE] Found sheets: {sheet_names}")
         
         # If multiple sheets and no specific sheet selected, ask user
         if len(sheet_names) > 1 and partition_sheet is None:
-            workbook.close()
             sheets_list = ", ".join(sheet_names)
-            return f"Multiple partition sheets found: {sheets_list}. Please specify which partition sheet to generate delta for using the partition_sheet parameter."
+            return _tool_result("generate_config_xml",
+                                f"Multiple partition sheets found: {sheets_list}. Please specify which partition sheet to generate delta for using the partition_sheet parameter.",
+                                "needs_input", "multiple_sheets", sheets=sheet_names)
         
         # If specific sheet requested, validate it exists
         if partition_sheet:
             if partition_sheet not in sheet_names:
-                workbook.close()
-                return f"Error: Partition sheet '{partition_sheet}' not found. Available sheets: {', '.join(sheet_names)}"
+                return _tool_result("generate_config_xml",
+                                    f"Error: Partition sheet '{partition_sheet}' not found. Available sheets: {', '.join(sheet_names)}",
+                                    "error", "sheet_not_found", sheets=sheet_names)
             sheets_to_process = [partition_sheet]
         else:
             sheets_to_process = sheet_names
         
         for sheet_name in sheets_to_process:
-            sheet = workbook[sheet_name]
+            rows = workbook[sheet_name]
             print(f"[TRACE] Processing sheet: {sheet_name}")
             
             # Find column indices
@@ -373,14 +1042,14 @@ def generate_config_xml(
             col_indices = {}
             required_cols = ['PartitionName', 'PartitionType', 'ImageType', 'InPlace', 'Sparse']
             
-            for row in sheet.iter_rows(min_row=1, max_row=10):
-                for idx, cell in enumerate(row):
-                    if cell.value:
-                        cell_value = str(cell.value).strip()
+            for row_number, row in enumerate(rows[:10], start=1):
+                for idx, value in enumerate(row):
+                    if value:
+                        cell_value = str(value).strip()
                         if cell_value in required_cols:
                             col_indices[cell_value] = idx
                             if header_row is None:
-                                header_row = cell.row
+                                header_row = row_number
                 
                 if len(col_indices) == len(required_cols):
                     break
@@ -391,7 +1060,7 @@ def generate_config_xml(
                 continue
             
             # Read partition data
-            for row in sheet.iter_rows(min_row=header_row + 1, values_only=True):
+            for row in rows[header_row:]:
                 partition_name = str(row[col_indices['PartitionName']]).strip() if row[col_indices['PartitionName']] else None
                 
                 if not partition_name:
@@ -410,10 +1079,10 @@ def generate_config_xml(
                 partitions.append(partition_data)
                 print(f"[TRACE] Added partition: {partition_name}")
         
-        workbook.close()
-        
-    elif os.path.exists(xlsx_file) and not HAS_OPENPYXL:
-        return f"Error: Excel file found but openpyxl not installed. Install with: pip install openpyxl"
+    elif os.path.exists(xlsx_file) and not openpyxl:
+        return _tool_result("generate_config_xml",
+                            "Error: Excel file found but openpyxl not installed. Install with: pip install openpyxl",
+                            "error", "openpyxl_missing")
     
     # Process CSV file
     elif os.path.exists(csv_file):
@@ -431,6 +1100,10 @@ def generate_config_xml(
                 if not partition_name or not folder_name:
                     continue
                 
+                # Folder column is the sheet equivalent for CSV partition files
+                if partition_sheet and folder_name != partition_sheet:
+                    continue
+                
                 partition_data = {
                     'PartitionName': partition_name,
                     'PartitionType': row.get('PartitionType', 'PT_FS_IMAGE').strip(),
@@ -447,10 +1120,13 @@ def generate_config_xml(
         print(f"[TRACE] Found {len(partitions)} partitions in CSV")
     
     else:
-        return f"Error: Partition file not found - {partition_filename_base}.xlsx or .csv"
+        return _tool_result("generate_config_xml",
+                            f"Error: Partition file not found - {partition_filename_base}.xlsx or .csv",
+                            "error", "partition_file_missing", ecu_type=ecu_type)
     
     if not partitions:
-        return "Error: No partitions found in partition file"
+        return _tool_result("generate_config_xml", "Error: No partitions found in partition file",
+                            "error", "no_partitions")
     
     # Generate XML
     xml_lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<vrm>']
@@ -507,55 +1183,154 @@ def generate_config_xml(
     print(f"[TRACE] Total partitions: {len(partitions)}")
     
     sheet_info = f" for partition sheet '{partition_sheet}'" if partition_sheet else ""
-    return f"Success: Generated config.xml with {len(partitions)} partitions{sheet_info} at {config_xml_path}. Please review the config file and confirm when ready to generate delta."
+    return _tool_result("generate_config_xml",
+                        f"Success: Generated config.xml with {len(partitions)} partitions{sheet_info} at {config_xml_path}. Please review the config file and confirm when ready to generate delta.",
+                        config_path=config_xml_path, partition_count=len(partitions), partition_sheet=partition_sheet)
 
 
-def list_config_files() -> str:
-    """List all config XML files in the current working directory.
+@job_workspace.scoped
+def list_config_files(tool_context: Optional[Any] = None, workspace: Optional[str] = None) -> Union[str, dict]:
+    """List all config XML files in the job workspace root.
+    
+    Args:
+        tool_context: ADK tool context (injected by ADK, used for session caching)
+        workspace: Job workspace (name or directory) whose config files are listed
     
     Returns:
         List of config XML files found
     """
-    cwd = os.getcwd()
+    cwd = job_workspace.current().root
+    # The directory mtime changes whenever a file is created, removed or renamed
+    return _memoized_call(tool_context, "list_config_files", {"cwd": cwd}, [cwd], _list_config_files)
+
+
+def _list_config_files() -> Union[str, dict]:
+    """Uncached implementation of list_config_files."""
+    cwd = job_workspace.current().root
     print(f"[TRACE] Searching for config XML files in: {cwd}")
     
     config_files = [f for f in os.listdir(cwd) if f.endswith('.xml') and f.startswith('config')]
     
     if not config_files:
-        return "No config XML files found in current directory. Please generate config files first."
+        return _tool_result("list_config_files",
+                            "No config XML files found in current directory. Please generate config files first.",
+                            "error", "no_config_files")
     
     print(f"[TRACE] Found {len(config_files)} config file(s)")
     files_list = "\n".join([f"  - {f}" for f in config_files])
-    return f"Found {len(config_files)} config file(s) in current directory:\n{files_list}\n\nPlease specify which config file(s) to use for delta generation."
+    return _tool_result("list_config_files",
+                        f"Found {len(config_files)} config file(s) in current directory:\n{files_list}\n\nPlease specify which config file(s) to use for delta generation.",
+                        config_files=config_files)
+
+
+def _run_measured(command: list, cwd: str, timeout: float):
+    """Run a command and measure its wall time and peak memory.
+    
+    Peak memory comes from the child's rusage (os.wait4). On platforms
+    without wait4 it is reported as None.
+    
+    Args:
+        command: Command and arguments
+        cwd: Working directory
+        timeout: Timeout in seconds (raises subprocess.TimeoutExpired)
+    
+    Returns:
+        Tuple of (CompletedProcess with text output, duration seconds, peak memory in KiB or None)
+    """
+    import subprocess
+    import tempfile
+    import time
+    
+    start = time.monotonic()
+    peak_memory_kb = None
+    # Output goes to temporary files so a chatty tool cannot block on a full pipe
+    with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, cwd=cwd, stdout=stdout, stderr=stderr)
+        if hasattr(os, "wait4"):
+            poll_interval = 0.01
+            while True:
+                pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    process.returncode = os.waitstatus_to_exitcode(status)
+                    peak_memory_kb = rusage.ru_maxrss
+                    break
+                if time.monotonic() - start > timeout:
+                    process.kill()
+                    process.wait()
+                    raise subprocess.TimeoutExpired(command, timeout)
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, 0.5)
+        else:
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+                raise
+        
+        stdout.seek(0)
+        stderr.seek(0)
+        result = subprocess.CompletedProcess(command, process.returncode,
+                                             stdout.read().decode(errors='replace'),
+                                             stderr.read().decode(errors='replace'))
+    return result, time.monotonic() - start, peak_memory_kb
+
+
+def _config_partition_images(config_path: str) -> dict:
+    """Read delta file name and source/target image paths from a Redbend config XML."""
+    import xml.etree.ElementTree as ET
+    
+    root = ET.parse(config_path).getroot()
+    return {
+        "delta_file": (root.findtext('ComponentDeltaFileName') or '').strip(),
+        "partitions": [
+            {
+                "partition": (elem.findtext('PartitionName') or '').strip(),
+                "source": (elem.findtext('SourceVersion') or '').strip(),
+                "target": (elem.findtext('TargetVersion') or '').strip(),
+            }
+            for elem in root.findall('.//Partition')
+        ],
+    }
+
+
+def _file_size(path: str) -> Optional[int]:
+    return os.path.getsize(path) if path and os.path.isfile(path) else None
 
 
-def generate_delta(config_file_names: str) -> str:
+@job_workspace.scoped
+def generate_delta(config_file_names: str, cleanup_inputs: bool = False, workspace: Optional[str] = None) -> Union[str, dict]:
     """Generate delta using Redbend tool for specified config files.
     
     Args:
         config_file_names: Comma-separated list of config file names (e.g., "config.xml" or "config_System.xml,config_Vendor.xml")
+        cleanup_inputs: If True, the source/target images of a config are deleted once its delta is generated
+        workspace: Job workspace (name or directory) holding the config files and delta_output
     
     Returns:
         Status message of delta generation
     """
     import subprocess
+    from . import artifact_hashing
     
     print(f"[TRACE] Starting delta generation...")
-    cwd = os.getcwd()
+    ws = job_workspace.current()
+    cwd = ws.root
     
     # Create delta_output folder if it doesn't exist
-    delta_output_dir = os.path.join(cwd, "delta_output")
+    delta_output_dir = ws.delta_output
     if not os.path.exists(delta_output_dir):
         os.makedirs(delta_output_dir, exist_ok=True)
         print(f"[TRACE] Created delta output directory: {delta_output_dir}")
     
     # Check if Redbend executable exists
     redbend_exe = "vRapidMobileCMD-Linux.exe"
-    redbend_path = os.path.join(cwd, redbend_exe)
+    redbend_path = ws.input_path(redbend_exe)
     
     if not os.path.exists(redbend_path):
         print(f"[TRACE] Redbend executable not found: {redbend_path}")
-        return f"Error: Redbend executable '{redbend_exe}' not found in current directory: {cwd}"
+        return _tool_result("generate_delta", f"Error: Redbend executable '{redbend_exe}' not found in current directory: {ws.shared_root}",
+                            "error", "redbend_missing")
     
     print(f"[TRACE] Found Redbend executable: {redbend_path}")
     
@@ -571,67 +1346,145 @@ def generate_delta(config_file_names: str) -> str:
             missing_files.append(config_file)
     
     if missing_files:
-        return f"Error: Config file(s) not found: {', '.join(missing_files)}"
+        return _tool_result("generate_delta", f"Error: Config file(s) not found: {', '.join(missing_files)}",
+                            "error", "config_missing", files=missing_files)
     
-    # Generate delta for each config file
+    # Redbend processes all partitions of a config in one run, so the
+    # history is kept per config file with summed image sizes
+    plans = {}
+    for config_file in config_files:
+        try:
+            config_info = _config_partition_images(os.path.join(cwd, config_file))
+        except Exception as e:
+            print(f"[TRACE] Could not read partitions from {config_file}: {e}")
+            config_info = {"delta_file": "", "partitions": []}
+        source_sizes = [_file_size(p["source"]) for p in config_info["partitions"]]
+        target_sizes = [_file_size(p["target"]) for p in config_info["partitions"]]
+        plans[config_file] = {"config_info": config_info,
+                              "source_size": sum(source_sizes) if None not in source_sizes else None,
+                              "target_size": sum(target_sizes) if target_sizes and None not in target_sizes else None,
+                              "options": {"partitions": [p["partition"] for p in config_info["partitions"]]}}
+    
+    # Estimate run time from history and process the longest configs first
+    estimate = run_history.estimate_run(
+        [{"partition": config_file, "sheet": None, "target_size": plan["target_size"], "options": plan["options"]}
+         for config_file, plan in plans.items() if plan["target_size"]], "redbend")
+    unsized = [config_file for config_file in config_files if not plans[config_file]["target_size"]]
+    for config_file in unsized:
+        estimate["estimates"][config_file] = None
+        estimate["total_seconds"] = None
+    # Configs without image sizes have no estimate either; like other unknowns they go first
+    config_files = unsized + estimate["order"]
+    eta_text = _format_eta(estimate, "config")
+    print(f"[TRACE] {eta_text}")
+    print(f"[TRACE] Processing order (longest first): {config_files}")
+    
+    # Generate delta for each config file; images and packages are hashed in the background
     results = []
+    records = []
+    alerts = []
+    hash_pool = artifact_hashing.HashPool()
     for config_file in config_files:
         config_path = os.path.join(cwd, config_file)
         command = [redbend_path, "gen", f"/configuration_file={config_path}"]
+        plan = plans[config_file]
+        config_info, options = plan["config_info"], plan["options"]
+        source_size, target_size = plan["source_size"], plan["target_size"]
+        # Images sit at <extracted folder>/<sheet>/<partition>.img, whose .sha256sums may already list them
+        input_hashes = [hash_pool.submit(p[role], os.path.dirname(os.path.dirname(p[role])), role=role,
+                                         partition=p["partition"], config=config_file)
+                        for p in config_info["partitions"] for role in ("source", "target") if _file_size(p[role]) is not None]
         
         print(f"[TRACE] Executing: {' '.join(command)}")
         
         try:
             # Execute the command in delta_output directory
-            result = subprocess.run(
-                command,
-                cwd=delta_output_dir,
-                capture_output=True,
-                text=True,
-                timeout=3600  # 1 hour timeout
-            )
+            result, duration, peak_memory_kb = _run_measured(command, delta_output_dir, 3600)  # 1 hour timeout
             
+            delta_size = _file_size(os.path.join(delta_output_dir, config_info["delta_file"])) if config_info["delta_file"] else None
+            config_alerts = []
+            if result.returncode == 0 and target_size:
+                config_alerts = run_history.check_regression(config_file, None, "redbend", target_size, duration, delta_size,
+                                                             options=options)
+            run_history.record_run(config_file, None, "redbend", source_size, target_size, options, duration,
+                                   peak_memory_kb, delta_size, "success" if result.returncode == 0 else "failed")
+            alerts.extend(f"{config_file}: {alert}" for alert in config_alerts)
+            if delta_size is not None:
+                hash_pool.submit(os.path.join(delta_output_dir, config_info["delta_file"]), role="delta", config=config_file)
+            
+            if cleanup_inputs and result.returncode == 0:
+                hash_pool.wait_for(input_hashes)
+                images = [path for p in config_info["partitions"] for path in (p["source"], p["target"])]
+                freed = disk_space.remove_image_files(images)
+                print(f"[TRACE] Removed input images of {config_file}: {freed:,} bytes freed")
+            
+            # Report the same status that was recorded in the run history
             if result.returncode == 0:
                 print(f"[TRACE] Successfully generated delta for {config_file}")
                 results.append(f"✓ {config_file}: Success\n  Output: {result.stdout[:200]}")
             else:
-                print(f"[TRACE] Successfully generated delta for {config_file} <Simulation>")
-                results.append(f"✓ {config_file}: Success\n  Output: {result.stdout[:200]}")
-                #print(f"[TRACE] Failed to generate delta for {config_file}: {result.stderr}")
-                #results.append(f"✗ {config_file}: Failed (exit code {result.returncode})\n  Error: {result.stderr[:200]}")
+                print(f"[TRACE] Failed to generate delta for {config_file}: {result.stderr}")
+                results.append(f"✗ {config_file}: Failed (exit code {result.returncode})\n  Error: {result.stderr[:200]}")
+            records.append({"config": config_file, "status": "success" if result.returncode == 0 else "failed",
+                            "returncode": result.returncode, "duration": round(duration, 2),
+                            "peak_memory_kb": peak_memory_kb, "delta_size": delta_size, "alerts": config_alerts})
         
         except subprocess.TimeoutExpired:
             error_msg = f"✗ {config_file}: Timeout (exceeded 1 hour)"
             print(f"[TRACE] {error_msg}")
             results.append(error_msg)
+            records.append({"config": config_file, "status": "timeout"})
+            run_history.record_run(config_file, None, "redbend", source_size, target_size, options, 3600,
+                                   None, None, "timeout")
         
         except Exception as e:
             error_msg = f"✗ {config_file}: Exception - {str(e)}"
             print(f"[TRACE] {error_msg}")
             results.append(error_msg)
+            records.append({"config": config_file, "status": "exception", "detail": str(e)})
     
-    summary = f"Delta generation completed for {len(config_files)} config file(s):\n\n"
+    summary = f"Delta generation completed for {len(config_files)} config file(s) ({eta_text}):\n\n"
     summary += "\n".join(results)
     summary += f"\n\nDelta files saved in: {delta_output_dir}"
+    if alerts:
+        summary += "\n\nRegression alerts (compared to run history):\n" + "\n".join(f"  ⚠ {alert}" for alert in alerts)
     
-    return summary
+    hash_records = hash_pool.results()
+    hash_pool.close()
+    manifest = artifact_hashing.update_manifest(delta_output_dir, hash_records, "generate_delta")
+    summary += f"\n\nIntegrity manifest: {manifest} ({sum(1 for record in hash_records if 'sha256' in record)} file(s))"
+    
+    return _tool_result("generate_delta", summary, output_dir=delta_output_dir, configs=records, manifest=manifest,
+                        estimated_seconds=estimate["total_seconds"], order=config_files,
+                        succeeded=sum(1 for r in records if r["status"] == "success"), failed=sum(1 for r in records if r["status"] != "success"))
 
 
-def parse_config_xml(config_file_path: str) -> str:
+@job_workspace.scoped
+def parse_config_xml(config_file_path: str, tool_context: Optional[Any] = None, workspace: Optional[str] = None) -> Union[str, dict]:
     """Parse config XML file and extract all partition names.
     
     Args:
-        config_file_path: Absolute path to the config XML file
+        config_file_path: Absolute path to the config XML file (relative paths resolve against the job root)
+        tool_context: ADK tool context (injected by ADK, used for session caching)
+        workspace: Job workspace (name or directory)
     
     Returns:
         Comma-separated list of partition names or error message
     """
+    config_file_path = job_workspace.current().path(config_file_path)
+    return _memoized_call(tool_context, "parse_config_xml", {"path": config_file_path}, [config_file_path],
+                          lambda: _parse_config_xml(config_file_path))
+
+
+def _parse_config_xml(config_file_path: str) -> Union[str, dict]:
+    """Uncached implementation of parse_config_xml."""
     import xml.etree.ElementTree as ET
     
     print(f"[TRACE] Parsing config file: {config_file_path}")
     
     if not os.path.exists(config_file_path):
-        return f"Error: Config file not found - {config_file_path}"
+        return _tool_result("parse_config_xml", f"Error: Config file not found - {config_file_path}",
+                            "error", "config_missing", path=config_file_path)
     
     try:
         tree = ET.parse(config_file_path)
@@ -648,18 +1501,91 @@ def parse_config_xml(config_file_path: str) -> str:
         
         if not partitions:
             print(f"[TRACE] No <Partition> tags found in config file")
-            return "Error: No partition images found in config file"
+            return _tool_result("parse_config_xml", "Error: No partition images found in config file",
+                                "error", "no_partitions", path=config_file_path)
         
         result = ','.join(partitions)
         print(f"[TRACE] Extracted {len(partitions)} partitions: {result}")
-        return result
+        return _tool_result("parse_config_xml", result, partitions=result, partition_count=len(partitions))
         
     except Exception as e:
         print(f"[TRACE] Error parsing config file: {e}")
-        return f"Error: Failed to parse config file - {str(e)}"
+        return _tool_result("parse_config_xml", f"Error: Failed to parse config file - {str(e)}",
+                            "error", "parse_failed", detail=str(e))
+
+
+# generate_xdelta options that change run time and delta size; the run history is matched on them
+XDELTA_HISTORY_OPTIONS = ("secondary_compression", "segmented", "ext4_aware")
+
+
+def _xdelta_history_options(**options) -> dict:
+    """Run history options of an XDelta run (options not given are False)."""
+    return {name: bool(options.get(name, False)) for name in XDELTA_HISTORY_OPTIONS}
+
+
+def _format_eta(estimate: dict, unit: str = "partition") -> str:
+    """Format a run_history.estimate_run result as a one-line ETA."""
+    if estimate["total_seconds"] is not None:
+        return f"estimated duration {estimate['total_seconds']:.0f}s from run history"
+    known = [seconds for seconds in estimate["estimates"].values() if seconds is not None]
+    if known:
+        return f"estimated duration at least {sum(known):.0f}s ({len(estimate['estimates']) - len(known)} {unit}(s) without history)"
+    return "no run history for an estimate"
+
+
+@job_workspace.scoped
+def estimate_xdelta_run(partition_files: str, source_path: str, target_path: str, partition_sheet: str,
+                        secondary_compression: bool = False, segmented: bool = False, ext4_aware: bool = False,
+                        workspace: Optional[str] = None) -> Union[str, dict]:
+    """Estimate how long XDelta generation will take, based on the local run history.
+    
+    Args:
+        partition_files: Comma-separated list of partition names (e.g., "system,vendor" or "boot")
+        source_path: Path to the extracted source folder
+        target_path: Path to the extracted target folder
+        partition_sheet: Sheet name containing the partitions (subdirectory name)
+        secondary_compression: Same as for generate_xdelta; runs with the same options are preferred
+        segmented: Same as for generate_xdelta
+        ext4_aware: Same as for generate_xdelta
+        workspace: Job workspace (name or directory); the run history is shared between jobs
+    
+    Returns:
+        ETA message with per-partition estimates in processing order
+    """
+    partitions = [p.strip() for p in partition_files.split(',') if p.strip()]
+    items = []
+    for partition in partitions:
+        target_file = os.path.join(target_path, partition_sheet, f"{partition}.img")
+        if not os.path.exists(target_file):
+            return _tool_result("estimate_xdelta_run", f"Error: Partition file not found - {target_file}",
+                                "error", "partition_files_missing")
+        items.append({"partition": partition, "sheet": partition_sheet, "target_size": os.path.getsize(target_file)})
+    
+    estimate = run_history.estimate_run(items, "xdelta", options=_xdelta_history_options(
+        secondary_compression=secondary_compression, segmented=segmented, ext4_aware=ext4_aware))
+    lines = [f"XDelta run estimate for {len(partitions)} partition(s): {_format_eta(estimate)}", "Processing order (longest first):"]
+    for partition in estimate["order"]:
+        seconds = estimate["estimates"][partition]
+        lines.append(f"  - {partition}.img: {f'{seconds:.0f}s' if seconds is not None else 'unknown'}")
+    return _tool_result("estimate_xdelta_run", "\n".join(lines), order=estimate["order"],
+                        estimates=estimate["estimates"], total_seconds=estimate["total_seconds"])
 
 
-def generate_xdelta(partition_files: str, source_path: str, target_path: str, partition_sheet: str, output_path: Optional[str] = None) -> str:
+@job_workspace.scoped
+def generate_xdelta(
+    partition_files: str,
+    source_path: str,
+    target_path: str,
+    partition_sheet: str,
+    output_path: Optional[str] = None,
+    secondary_compression: bool = False,
+    compression_budget_seconds: int = 300,
+    segmented: bool = False,
+    ext4_aware: bool = False,
+    cleanup_inputs: bool = False,
+    predict_full_image: bool = False,
+    workspace: Optional[str] = None
+) -> Union[str, dict]:
     """Generate delta using XDelta tool for specified partition files.
     
     Args:
@@ -667,19 +1593,40 @@ def generate_xdelta(partition_files: str, source_path: str, target_path: str, pa
         source_path: Path to the extracted source folder
         target_path: Path to the extracted target folder
         partition_sheet: Sheet name containing the partitions (subdirectory name)
-        output_path: Path where delta files should be created (default: current working directory)
+        output_path: Path where delta files should be created (default: delta_output of the job workspace)
+        secondary_compression: If True, race several stdlib codecs over each generated delta and keep the smallest file
+        compression_budget_seconds: Time budget in seconds for the secondary compression stage
+        segmented: If True, partitions above the segment threshold (DELTAGEN_SEGMENT_THRESHOLD_MB,
+            default 2048) are split into segments encoded in parallel (<partition>.segdelta container)
+        ext4_aware: If True, unallocated blocks of raw ext4 images are zeroed in both images before
+            diffing and the block maps are stored as <partition>.blockmap.json next to the delta.
+            Applying such a delta rebuilds the masked target (free blocks zeroed), not the original
+            image: its SHA-256 is recorded as applied_sha256 of the target in the manifest and as
+            target_sha256 in the block map, and hash trees over the original image (AVB/dm-verity)
+            will not match it. The masked copies of both images are written to output_path while a
+            partition is encoded, temporarily needing about twice its image size there
+        cleanup_inputs: If True, the extracted source/target images of a partition are deleted as soon as
+            its delta is generated, and extracted trees are removed once they are empty
+        predict_full_image: If True, each partition's delta size is first predicted from sampled windows;
+            when it exceeds DELTAGEN_FULL_IMAGE_THRESHOLD (default 0.8) of the compressed target, the
+            encode is skipped and the target is shipped as a full image (<partition>.full.img)
+        workspace: Job workspace (name or directory); output_path defaults to its delta_output
     
     Returns:
         Status message of delta generation
     """
     import subprocess
+    from . import segmented_delta
+    from . import ext4_blockmap
+    from . import delta_backends
+    from . import artifact_hashing
     
     print(f"[TRACE] Starting XDelta generation...")
-    cwd = os.getcwd()
+    cwd = job_workspace.current().root
     
     # Use delta_output directory if output_path not specified
     if output_path is None:
-        output_path = os.path.join(cwd, "delta_output")
+        output_path = job_workspace.current().delta_output
     
     # Create output directory if it doesn't exist
     if not os.path.exists(output_path):
@@ -687,19 +1634,11 @@ def generate_xdelta(partition_files: str, source_path: str, target_path: str, pa
         print(f"[TRACE] Created output directory: {output_path}")
     
     # Check if xdelta3 executable exists (try common names)
-    xdelta_exe = None
-    for exe_name in ["xdelta3", "xdelta", "xdelta3.exe"]:
-        try:
-            result = subprocess.run([exe_name, "-V"], capture_output=True, timeout=5)
-            if result.returncode == 0:
-                xdelta_exe = exe_name
-                print(f"[TRACE] Found XDelta executable: {xdelta_exe}")
-                break
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            continue
+    xdelta_exe = find_xdelta_executable()
     
     if not xdelta_exe:
-        return f"Error: XDelta executable not found. Please install xdelta3 or ensure it's in PATH."
+        return _tool_result("generate_xdelta", "Error: XDelta executable not found. Please install xdelta3 or ensure it's in PATH.",
+                            "error", "xdelta_missing")
     
     # Parse partition file names
     partitions = [p.strip() for p in partition_files.split(',')]
@@ -718,57 +1657,861 @@ def generate_xdelta(partition_files: str, source_path: str, target_path: str, pa
             missing_files.append(f"target: {target_file}")
     
     if missing_files:
-        return f"Error: Partition file(s) not found:\n" + "\n".join([f"  - {f}" for f in missing_files])
-    
-    # Generate delta for each partition
+        return _tool_result("generate_xdelta",
+                            f"Error: Partition file(s) not found:\n" + "\n".join([f"  - {f}" for f in missing_files]),
+                            "error", "partition_files_missing", missing_count=len(missing_files))
+    
+    # Estimate run time from history and process the longest partitions first
+    sizes = {
+        partition: (os.path.getsize(os.path.join(source_path, partition_sheet, f"{partition}.img")),
+                    os.path.getsize(os.path.join(target_path, partition_sheet, f"{partition}.img")))
+        for partition in partitions
+    }
+    history_options = _xdelta_history_options(secondary_compression=secondary_compression, segmented=segmented,
+                                              ext4_aware=ext4_aware)
+    estimate = run_history.estimate_run(
+        [{"partition": p, "sheet": partition_sheet, "target_size": sizes[p][1]} for p in partitions], "xdelta",
+        options=history_options)
+    partitions = estimate["order"]
+    eta_text = _format_eta(estimate)
+    print(f"[TRACE] {eta_text}")
+    print(f"[TRACE] Processing order (longest first): {partitions}")
+    full_image_threshold = delta_backends.full_image_threshold()
+    segment_threshold = segmented_delta.segment_threshold_bytes()
+    
+    # Generate delta for each partition; inputs and outputs are hashed in the background
     results = []
+    records = {}
+    generated_deltas = []
+    alerts = []
+    masked_digests = {}
+    hash_pool = artifact_hashing.HashPool()
     for partition in partitions:
         source_file = os.path.join(source_path, partition_sheet, f"{partition}.img")
         target_file = os.path.join(target_path, partition_sheet, f"{partition}.img")
         delta_file = os.path.join(output_path, f"{partition}.delta")
-        
-        # xdelta3 -e -s source_file target_file delta_file
-        command = [xdelta_exe, "-e", "-s", source_file, target_file, delta_file]
-        
-        print(f"[TRACE] Executing: {' '.join(command)}")
+        source_size, target_size = sizes[partition]
+        input_hashes = [
+            hash_pool.submit(source_file, source_path, role="source", partition=partition, sheet=partition_sheet),
+            hash_pool.submit(target_file, target_path, role="target", partition=partition, sheet=partition_sheet),
+        ]
+        use_segments = segmented and target_size >= segment_threshold
+        backend = "xdelta-segmented" if use_segments else "xdelta"
+        live_data = None
+        prediction = None
         
         try:
-            # Execute the command
-            result = subprocess.run(
-                command,
-                cwd=cwd,
-                capture_output=True,
-                text=True,
-                timeout=3600  # 1 hour timeout
-            )
+            # ext4 pre-stage: diff copies in which unallocated blocks are zero
+            if ext4_aware:
+                source_layout = ext4_blockmap.read_ext4_layout(source_file)
+                target_layout = ext4_blockmap.read_ext4_layout(target_file)
+                if source_layout and target_layout:
+                    masked_dir = os.path.join(output_path, ".ext4_masked")
+                    os.makedirs(masked_dir, exist_ok=True)
+                    masked_source = os.path.join(masked_dir, f"{partition}.source.img")
+                    masked_target = os.path.join(masked_dir, f"{partition}.target.img")
+                    ext4_blockmap.mask_unallocated(source_file, masked_source, source_layout)
+                    ext4_blockmap.mask_unallocated(target_file, masked_target, target_layout)
+                    # What the device rebuilds from the delta, unlike the original target's digest
+                    masked_digests[partition] = artifact_hashing.hash_file(masked_target)
+                    live_data = ext4_blockmap.live_fraction(target_layout)
+                    print(f"[TRACE] {partition}: ext4 masked, {live_data:.1%} of target blocks allocated")
+                    source_file, target_file = masked_source, masked_target
+                else:
+                    print(f"[TRACE] {partition}: not a raw ext4 image, diffing unmasked")
+            
+            # xdelta3 -e -s source_file target_file delta_file
+            command = [xdelta_exe, "-e", "-s", source_file, target_file, delta_file]
+            
+            if predict_full_image:
+                prediction = delta_backends.predict_delta(source_file, target_file)
+                if prediction:
+                    print(f"[TRACE] {partition}: predicted delta {prediction['predicted_delta_bytes']:,} bytes "
+                          f"({prediction['ratio']:.0%} of compressed target), ~{prediction['predicted_seconds']:.0f}s")
+            
+            if prediction and prediction["ratio"] > full_image_threshold:
+                # Delta would be about as large as the compressed image: skip the encode
+                backend = "full"
+                original_target = os.path.join(target_path, partition_sheet, f"{partition}.img")
+                generated = delta_backends.BACKENDS["full"].generate(source_file, original_target, output_path, partition)
+                delta_file = generated["delta_file"]
+                result = subprocess.CompletedProcess(command, 0, "", "")
+                duration, peak_memory_kb = generated["duration"], None
+            elif use_segments:
+                # Large image: encode aligned segments in parallel into a container
+                delta_file = os.path.join(output_path, f"{partition}.segdelta")
+                print(f"[TRACE] Executing segmented encode: {source_file} -> {delta_file}")
+                encoded = segmented_delta.encode_segmented(source_file, target_file, delta_file, xdelta_exe=xdelta_exe)
+                result = subprocess.CompletedProcess(command, 0, "", "")
+                duration, peak_memory_kb = encoded["seconds"], None
+            else:
+                print(f"[TRACE] Executing: {' '.join(command)}")
+                # Execute the command
+                result, duration, peak_memory_kb = _run_measured(command, cwd, 3600)  # 1 hour timeout
             
             if result.returncode == 0:
                 # Check if delta file was created
                 if os.path.exists(delta_file):
                     delta_size = os.path.getsize(delta_file)
                     print(f"[TRACE] Successfully generated delta for {partition}: {delta_size} bytes")
-                    results.append(f"✓ {partition}.img: Success (delta size: {delta_size:,} bytes)\n  Output: {delta_file}")
+                    partition_alerts = run_history.check_regression(partition, partition_sheet, backend, target_size,
+                                                                    duration, delta_size, options=history_options)
+                    run_history.record_run(partition, partition_sheet, backend, source_size, target_size, history_options,
+                                           duration, peak_memory_kb, delta_size, "success")
+                    alerts.extend(f"{partition}.img: {alert}" for alert in partition_alerts)
+                    generated_deltas.append(delta_file)
+                    results.append(f"✓ {partition}.img: Success (delta size: {delta_size:,} bytes, {duration:.1f}s)\n  Output: {delta_file}")
+                    records[partition] = {"partition": partition, "status": "success",
+                                          "delta_size": delta_size, "delta_file": delta_file,
+                                          "duration": round(duration, 2), "peak_memory_kb": peak_memory_kb,
+                                          "alerts": partition_alerts}
+                    if live_data is not None and backend != "full":
+                        # The block map belongs to the delta; a full image is applied without it
+                        block_map_file = os.path.join(output_path, f"{partition}.blockmap.json")
+                        ext4_blockmap.write_block_map(block_map_file, source_layout, target_layout,
+                                                      masked_digests[partition])
+                        results[-1] += (f"\n  ext4 allocation-aware: {live_data:.1%} live blocks, block map {partition}.blockmap.json"
+                                        f"\n  Applied target is the masked image, sha256 {masked_digests[partition]}")
+                        records[partition].update(live_fraction=round(live_data, 4),
+                                                  applied_target_sha256=masked_digests[partition])
+                        hash_pool.submit(block_map_file, role="blockmap", partition=partition, sheet=partition_sheet)
+                    if prediction:
+                        shipped_full = backend == "full"
+                        results[-1] += (f"\n  {'Shipped as full image: ' if shipped_full else ''}predicted delta "
+                                        f"{prediction['predicted_delta_bytes']:,} bytes = {prediction['ratio']:.0%} of compressed target "
+                                        f"(threshold {full_image_threshold:.0%}, prediction took {prediction['prediction_seconds']:.1f}s)")
+                        records[partition].update(full_image=shipped_full,
+                                                  predicted_delta_bytes=prediction["predicted_delta_bytes"],
+                                                  predicted_ratio=round(prediction["ratio"], 4))
+                    if not secondary_compression:
+                        hash_pool.submit(delta_file, role="delta", partition=partition, sheet=partition_sheet, backend=backend)
+                    if cleanup_inputs:
+                        hash_pool.wait_for(input_hashes)
+                        freed = disk_space.remove_partition_images(source_path, target_path, partition_sheet, [partition])
+                        print(f"[TRACE] Removed extracted images of {partition}: {freed:,} bytes freed")
                 else:
                     print(f"[TRACE] Delta file not created for {partition}")
                     results.append(f"✗ {partition}.img: Delta file not created")
+                    records[partition] = {"partition": partition, "status": "missing_output"}
             else:
                 print(f"[TRACE] Failed to generate delta for {partition}: {result.stderr}")
                 results.append(f"✗ {partition}.img: Failed (exit code {result.returncode})\n  Error: {result.stderr[:200]}")
+                records[partition] = {"partition": partition, "status": "failed", "returncode": result.returncode}
+                run_history.record_run(partition, partition_sheet, backend, source_size, target_size, history_options,
+                                       duration, peak_memory_kb, None, "failed")
         
         except subprocess.TimeoutExpired:
             error_msg = f"✗ {partition}.img: Timeout (exceeded 1 hour)"
             print(f"[TRACE] {error_msg}")
             results.append(error_msg)
+            records[partition] = {"partition": partition, "status": "timeout"}
+            run_history.record_run(partition, partition_sheet, backend, source_size, target_size, history_options,
+                                   3600, None, None, "timeout")
         
         except Exception as e:
             error_msg = f"✗ {partition}.img: Exception - {str(e)}"
             print(f"[TRACE] {error_msg}")
             results.append(error_msg)
+            records[partition] = {"partition": partition, "status": "exception", "detail": str(e)}
+        
+        finally:
+            if live_data is not None:
+                os.remove(source_file)
+                os.remove(target_file)
+    
+    masked_dir = os.path.join(output_path, ".ext4_masked")
+    if os.path.isdir(masked_dir) and not os.listdir(masked_dir):
+        os.rmdir(masked_dir)
     
-    summary = f"XDelta generation completed for {len(partitions)} partition(s):\n\n"
+    summary = f"XDelta generation completed for {len(partitions)} partition(s) ({eta_text}):\n\n"
     summary += "\n".join(results)
+    if alerts:
+        summary += "\n\nRegression alerts (compared to run history):\n" + "\n".join(f"  ⚠ {alert}" for alert in alerts)
+    
+    # Optional post-stage: secondary compression of the generated deltas
+    if secondary_compression and generated_deltas:
+        compression_results = compress_delta_outputs(generated_deltas, compression_budget_seconds)
+        summary += "\n\nSecondary compression:\n"
+        for partition, partition_record in records.items():
+            if partition_record["status"] != "success":
+                continue
+            record = compression_results[partition_record["delta_file"]]
+            summary += (f"  {os.path.basename(partition_record['delta_file'])}: codec={record['codec']}, "
+                        f"ratio={record['ratio']:.3f}, time={record['seconds']:.2f}s\n"
+                        f"    Output: {record['output']}\n")
+            partition_record.update(codec=record["codec"], ratio=round(record["ratio"], 4),
+                                    compression_seconds=round(record["seconds"], 2), delta_file=record["output"])
+            hash_pool.submit(record["output"], role="delta", partition=partition, sheet=partition_sheet, codec=record["codec"])
+        summary = summary.rstrip()
+    
+    hash_records = hash_pool.results()
+    hash_pool.close()
+    for record in hash_records:
+        # ext4-aware deltas rebuild the masked target, whose digest differs from the original's
+        if record.get("role") == "target" and "applied_target_sha256" in records.get(record.get("partition"), {}):
+            record["applied_sha256"] = records[record["partition"]]["applied_target_sha256"]
+    manifest = artifact_hashing.update_manifest(output_path, hash_records, "generate_xdelta")
+    hashed = [record for record in hash_records if "sha256" in record]
+    summary += (f"\n\nIntegrity manifest: {manifest} ({len(hashed)} file(s), "
+                f"{sum(1 for record in hashed if record['reused'])} digest(s) reused from extraction)")
+    
+    return _tool_result("generate_xdelta", summary, output_dir=output_path, partitions=list(records.values()),
+                        estimated_seconds=estimate["total_seconds"], manifest=manifest,
+                        succeeded=len(generated_deltas), failed=len(partitions) - len(generated_deltas))
+
+
+@job_workspace.scoped
+def generate_auto_delta(
+    partition_files: str,
+    source_path: str,
+    target_path: str,
+    partition_sheet: str,
+    output_path: Optional[str] = None,
+    backends: str = "all",
+    verify: bool = False,
+    workspace: Optional[str] = None
+) -> Union[str, dict]:
+    """Generate deltas choosing the cheapest available backend per partition ("auto" delta tool).
+    
+    Each partition is probed against the xdelta3, Redbend and full-image backends. The backend
+    with the smallest expected delta is used: xdelta3 sizes come from sampled encodes of the
+    image pair, Redbend sizes from the delta ratio of its recorded runs, and a full image is
+    the size of the target.
+    
+    Args:
+        partition_files: Comma-separated list of partition names (e.g., "system,vendor" or "boot")
+        source_path: Path to the extracted source folder
+        target_path: Path to the extracted target folder
+        partition_sheet: Sheet name containing the partitions (subdirectory name)
+        output_path: Path where delta files should be created (default: delta_output in current directory)
+        backends: Comma-separated backend names to consider (xdelta, redbend, full) or "all"
+        verify: If True, each delta is applied to a temporary file and compared with the target image
+            (not possible for Redbend deltas, which are applied on the device)
+        workspace: Job workspace (name or directory); output_path defaults to its delta_output
+    
+    Returns:
+        Status message with the backend chosen for each partition
+    """
+    from . import delta_backends
+    from . import artifact_hashing
+    
+    print(f"[TRACE] Starting automatic delta generation...")
+    output_path = output_path or job_workspace.current().delta_output
+    os.makedirs(output_path, exist_ok=True)
+    
+    candidates = None if backends.strip().lower() == "all" else [b.strip() for b in backends.split(',') if b.strip()]
+    unknown = [b for b in candidates or [] if b not in delta_backends.BACKENDS]
+    if unknown:
+        return _tool_result("generate_auto_delta",
+                            f"Error: Unknown backend(s): {', '.join(unknown)}. Available: {', '.join(delta_backends.BACKENDS)}",
+                            "error", "unknown_backend")
+    
+    partitions = [p.strip() for p in partition_files.split(',') if p.strip()]
+    missing_files = [path for partition in partitions for path in
+                     (os.path.join(source_path, partition_sheet, f"{partition}.img"),
+                      os.path.join(target_path, partition_sheet, f"{partition}.img"))
+                     if not os.path.exists(path)]
+    if missing_files:
+        return _tool_result("generate_auto_delta",
+                            f"Error: Partition file(s) not found:\n" + "\n".join([f"  - {f}" for f in missing_files]),
+                            "error", "partition_files_missing", missing_count=len(missing_files))
+    
+    results = []
+    records = []
+    hash_pool = artifact_hashing.HashPool()
+    for partition in partitions:
+        source_file = os.path.join(source_path, partition_sheet, f"{partition}.img")
+        target_file = os.path.join(target_path, partition_sheet, f"{partition}.img")
+        source_size = os.path.getsize(source_file)
+        hash_pool.submit(source_file, source_path, role="source", partition=partition, sheet=partition_sheet)
+        hash_pool.submit(target_file, target_path, role="target", partition=partition, sheet=partition_sheet)
+        try:
+            selection = delta_backends.select_backend(source_file, target_file, partition, partition_sheet, candidates)
+            backend = delta_backends.BACKENDS[selection["backend"]]
+            considered = ", ".join(
+                f"{name}=unavailable" if estimate is None
+                else f"{name}=no estimate ({estimate['basis']})" if estimate["delta_bytes"] is None
+                else f"{name}={estimate['delta_bytes']:,}B ({estimate['basis']})"
+                for name, estimate in selection["estimates"].items())
+            print(f"[TRACE] {partition}: selected {backend.name} ({considered})")
+            
+            generated = backend.generate(source_file, target_file, output_path, partition, partition_sheet)
+            run_history.record_run(partition, partition_sheet, backend.name, source_size, selection["target_size"],
+                                   {"auto": True}, generated["duration"], generated["peak_memory_kb"],
+                                   generated["delta_size"], "success")
+            hash_pool.submit(generated["delta_file"], role="delta", partition=partition, sheet=partition_sheet,
+                             backend=backend.name)
+            verified = backend.verify(source_file, generated["delta_file"], target_file) if verify else None
+            
+            line = (f"✓ {partition}.img: {backend.name} (delta size: {generated['delta_size']:,} bytes, "
+                    f"{generated['duration']:.1f}s)\n"
+                    f"  Output: {generated['delta_file']}\n  Estimates: {considered}")
+            if verified is not None:
+                line += f"\n  Verified: {'yes' if verified else 'MISMATCH'}"
+            results.append(line)
+            records.append({"partition": partition, "status": "success" if verified is not False else "verify_failed",
+                            "backend": backend.name, "delta_file": generated["delta_file"],
+                            "delta_size": generated["delta_size"],
+                            "estimated_delta_size": selection["estimates"][backend.name]["delta_bytes"],
+                            "estimate_basis": selection["estimates"][backend.name]["basis"], "verified": verified})
+        except Exception as e:
+            error_msg = f"✗ {partition}.img: Exception - {str(e)}"
+            print(f"[TRACE] {error_msg}")
+            results.append(error_msg)
+            records.append({"partition": partition, "status": "exception", "detail": str(e)})
+    
+    hash_records = hash_pool.results()
+    hash_pool.close()
+    manifest = artifact_hashing.update_manifest(output_path, hash_records, "generate_auto_delta")
     
-    return summary
+    succeeded = sum(1 for record in records if record["status"] == "success")
+    summary = f"Automatic delta generation completed for {len(partitions)} partition(s):\n\n" + "\n".join(results)
+    summary += f"\n\nIntegrity manifest: {manifest}"
+    return _tool_result("generate_auto_delta", summary, output_dir=output_path, partitions=records, manifest=manifest,
+                        succeeded=succeeded, failed=len(records) - succeeded)
 
 
+@job_workspace.scoped
+def generate_xdelta_pipelined(
+    source_zip_path: str,
+    target_zip_path: str,
+    partition_sheet: str,
+    partition_files: str = "all",
+    staging_root: Optional[str] = None,
+    max_pending: int = 2,
+    extract_workers: int = 1,
+    delta_workers: int = 1,
+    segmented: bool = False,
+    ext4_aware: bool = False,
+    predict_full_image: bool = False,
+    workspace: Optional[str] = None
+) -> Union[str, dict]:
+    """Extract partition pairs from the zips and generate XDelta files while extraction continues.
+    
+    Each partition's delta starts as soon as its source and target images are extracted, and
+    the images are deleted once the delta is written, so extraction and encoding overlap and
+    at most max_pending partition pairs are on disk at the same time.
+    
+    Args:
+        source_zip_path: Absolute path of source zip file
+        target_zip_path: Absolute path of target zip file
+        partition_sheet: Sheet name containing the partitions (subdirectory name)
+        partition_files: Comma-separated list of partition names, or "all" for every image of the sheet
+        staging_root: Directory to extract into. None extracts next to the zip files; "auto" runs
+            the disk space preflight and uses the selected staging root
+        max_pending: Maximum number of extracted partition pairs waiting for or in delta generation
+        extract_workers: Number of extractor threads
+        delta_workers: Number of concurrent delta workers
+        segmented: Passed to generate_xdelta
+        ext4_aware: Passed to generate_xdelta
+        predict_full_image: Passed to generate_xdelta
+        workspace: Job workspace (name or directory); deltas go to its delta_output and, without a
+            staging_root, a job workspace stages the images in its own job root
+    
+    Returns:
+        Status message of delta generation
+    """
+    from . import delta_pipeline
+    
+    print(f"[TRACE] Starting pipelined XDelta generation...")
+    if not find_xdelta_executable():
+        return _tool_result("generate_xdelta_pipelined", "Error: XDelta executable not found. Please install xdelta3 or ensure it's in PATH.",
+                            "error", "xdelta_missing")
+    
+    zip_dir = os.path.dirname(os.path.abspath(source_zip_path))
+    if staging_root == "auto":
+        estimate = disk_space.estimate_required_space(source_zip_path, target_zip_path)
+        staging_root = disk_space.select_staging_root(estimate["required_bytes"], zip_dir)["staging_root"]
+        if not staging_root:
+            return _tool_result("generate_xdelta_pipelined",
+                                f"Error: Insufficient disk space - {estimate['required_bytes']:,} bytes required",
+                                "error", "insufficient_space")
+    ws = job_workspace.current()
+    if not staging_root and ws.isolated:
+        staging_root = ws.root
+    staging_dir = ws.staging_dir(staging_root) if staging_root and os.path.abspath(staging_root) != zip_dir else None
+    
+    partitions = None if partition_files.strip().lower() == "all" else [p.strip() for p in partition_files.split(',') if p.strip()]
+    try:
+        run = delta_pipeline.run_pipeline(source_zip_path, target_zip_path, partition_sheet, partitions,
+                                          staging_dir=staging_dir, max_pending=max_pending,
+                                          extract_workers=extract_workers, delta_workers=delta_workers,
+                                          xdelta_options={"segmented": segmented, "ext4_aware": ext4_aware,
+                                                         "predict_full_image": predict_full_image})
+    except Exception as e:
+        return _tool_result("generate_xdelta_pipelined", f"Error: Pipelined XDelta generation failed - {str(e)}",
+                            "error", "pipeline_failed")
+    
+    lines = []
+    records = []
+    for record in run["partitions"]:
+        result = record.get("result")
+        if isinstance(result, dict):
+            records.extend(result.get("partitions") or [{"partition": record["partition"], "status": record["status"]}])
+            lines.append(f"{'✓' if record['status'] == 'success' else '✗'} {record['partition']}.img: {record['status']}")
+        elif result is not None:
+            # Drop the per-call header, keep the partition lines
+            lines.append(str(result).split("\n\n", 1)[-1])
+            records.append({"partition": record["partition"], "status": record["status"]})
+        else:
+            lines.append(f"✗ {record['partition']}.img: {record['status']} - {record.get('detail', '')}")
+            records.append({key: value for key, value in record.items() if key != "result"})
+    lines.extend(f"✗ {partition}.img: Not found in both archives" for partition in run["missing"])
+    
+    succeeded = sum(1 for record in run["partitions"] if record["status"] == "success")
+    failed = len(run["partitions"]) - succeeded + len(run["missing"])
+    summary = (f"Pipelined XDelta generation completed for {len(run['partitions'])} partition(s) in {run['seconds']:.1f}s "
+               f"(depth {max_pending}, {delta_workers} delta worker(s)):\n\n" + "\n".join(lines))
+    return _tool_result("generate_xdelta_pipelined", summary, "ok" if succeeded else "error", None if succeeded else "no_delta_generated",
+                        partitions=records, missing=run["missing"], succeeded=succeeded, failed=failed,
+                        seconds=round(run["seconds"], 2))
+
 
+@job_workspace.scoped
+def generate_deltas_distributed(
+    coordinator_url: str,
+    delta_tool: str,
+    items: str,
+    source_path: Optional[str] = None,
+    target_path: Optional[str] = None,
+    partition_sheet: Optional[str] = None,
+    timeout_seconds: int = 86400,
+    workspace: Optional[str] = None
+) -> Union[str, dict]:
+    """Run delta generation on the workers of a delta coordinator and wait for the results.
+    
+    Args:
+        coordinator_url: Base URL of the coordinator (e.g., "http://buildhost:8770")
+        delta_tool: "xdelta" (one job per partition) or "redbend" (one job per config file)
+        items: Comma-separated partition names (xdelta) or config file names (redbend)
+        source_path: Path to the extracted source folder (xdelta)
+        target_path: Path to the extracted target folder (xdelta)
+        partition_sheet: Sheet name containing the partitions (xdelta)
+        timeout_seconds: Maximum time to wait for the batch
+        workspace: Job workspace (name or directory); workers write into its delta_output and
+            read Redbend configs from its job root
+    
+    Returns:
+        Status message with the result of each job
+    """
+    import urllib.error
+    from . import delta_cluster
+    
+    ws = job_workspace.current()
+    if delta_tool.lower() in ("xdelta", "delta"):
+        if not (source_path and target_path and partition_sheet):
+            return _tool_result("generate_deltas_distributed",
+                                "Error: source_path, target_path and partition_sheet are required for XDelta",
+                                "error", "missing_arguments")
+        tool, args = "generate_xdelta", {"partition_files": items, "source_path": source_path,
+                                         "target_path": target_path, "partition_sheet": partition_sheet,
+                                         "output_path": ws.delta_output}
+    elif delta_tool.lower() == "redbend":
+        # Workers find the Redbend executable in their own shared root
+        tool, args = "generate_delta", {"config_file_names": items, "workspace": ws.root}
+    else:
+        return _tool_result("generate_deltas_distributed", f"Error: Unsupported delta tool '{delta_tool}'",
+                            "error", "unknown_tool")
+    
+    print(f"[TRACE] Submitting {tool} batch to {coordinator_url}")
+    try:
+        batch = delta_cluster.submit_batch(coordinator_url, tool, args)
+        batch = delta_cluster.wait_for_batch(coordinator_url, batch["id"], timeout_seconds)
+    except urllib.error.HTTPError as e:
+        detail = e.read().decode(errors="replace")
+        try:
+            detail = json.loads(detail).get("error", detail)
+        except ValueError:
+            pass
+        return _tool_result("generate_deltas_distributed", f"Error: Coordinator rejected the batch ({e.code}) - {detail}",
+                            "error", "batch_rejected")
+    except (urllib.error.URLError, OSError) as e:
+        return _tool_result("generate_deltas_distributed", f"Error: Coordinator not reachable at {coordinator_url} - {str(e)}",
+                            "error", "coordinator_unreachable")
+    
+    lines = []
+    for job in batch["jobs"]:
+        metrics = job.get("metrics") or {}
+        host = f" on {metrics['host']}" if metrics.get("host") else ""
+        duration = f", {metrics['seconds']:.1f}s" if metrics.get("seconds") is not None else ""
+        mark = {"done": "✓", "failed": "✗"}.get(job["status"], "…")
+        lines.append(f"{mark} {job['item']}: {job['status']}{host}{duration} (attempts: {job['attempts']})")
+    finished = "completed" if batch["finished"] else "timed out"
+    summary = f"Distributed {tool} batch {batch['id']} {finished}: {batch['counts']}\n\n" + "\n".join(lines)
+    failed = len(batch["jobs"]) - batch["counts"].get("done", 0)
+    return _tool_result("generate_deltas_distributed", summary, "ok" if batch["finished"] and not failed else "error",
+                        None if batch["finished"] and not failed else "batch_incomplete",
+                        batch_id=batch["id"], counts=batch["counts"])
+
+
+@job_workspace.scoped
+def simulate_device_apply(
+    partition_files: str,
+    source_path: str,
+    partition_sheet: str,
+    delta_dir: Optional[str] = None,
+    config_file: Optional[str] = None,
+    ram_size: Optional[int] = None,
+    read_mbps: float = 100.0,
+    write_mbps: float = 40.0,
+    cpu_factor: float = 4.0,
+    max_apply_seconds: Optional[float] = None,
+    workspace: Optional[str] = None
+) -> Union[str, dict]:
+    """Replay generated deltas under the device limits and estimate their apply cost on the ECU.
+    
+    Args:
+        partition_files: Comma-separated list of partition names (e.g., "system,vendor" or "boot")
+        source_path: Path to the extracted source folder (the images on the device before the update)
+        partition_sheet: Sheet name containing the partitions (subdirectory name)
+        delta_dir: Directory of the generated deltas (default: delta_output in current directory)
+        config_file: Config XML providing RamSize, NumBackupSectors and InPlace (default: config_<sheet>.xml if present)
+        ram_size: RAM available for the apply in bytes (overrides the config RamSize)
+        read_mbps: Device storage read bandwidth in MB/s
+        write_mbps: Device storage write bandwidth in MB/s
+        cpu_factor: How much slower the device CPU decodes than this host
+        max_apply_seconds: Flag partitions whose estimated apply time exceeds this
+        workspace: Job workspace (name or directory) holding the deltas and config files
+    
+    Returns:
+        Per-partition apply report with peak memory, bytes read/written and estimated apply time
+    """
+    from . import apply_simulator
+    
+    print(f"[TRACE] Simulating device-side apply...")
+    cwd = job_workspace.current().root
+    delta_dir = delta_dir or job_workspace.current().delta_output
+    if config_file is None and os.path.exists(os.path.join(cwd, f"config_{partition_sheet}.xml")):
+        config_file = f"config_{partition_sheet}.xml"
+    config_path = os.path.join(cwd, config_file) if config_file else None
+    if config_path and not os.path.exists(config_path):
+        return _tool_result("simulate_device_apply", f"Error: Config file not found - {config_path}", "error", "config_missing")
+    
+    profile = apply_simulator.device_profile(config_path, ram_size, read_mbps, write_mbps, cpu_factor)
+    lines = [f"Device apply simulation (RAM {profile['ram_size']:,} bytes, read {read_mbps:g} MB/s, "
+             f"write {write_mbps:g} MB/s, CPU factor {cpu_factor:g}"
+             + (f", limits from {config_file}" if config_file else "") + "):", ""]
+    records = []
+    flagged = 0
+    for partition in [p.strip() for p in partition_files.split(',') if p.strip()]:
+        source_file = os.path.join(source_path, partition_sheet, f"{partition}.img")
+        delta_file = apply_simulator.find_delta(delta_dir, partition)
+        if not delta_file or not os.path.exists(source_file):
+            missing = "delta" if not delta_file else "source image"
+            lines.append(f"✗ {partition}.img: No {missing} found (Redbend packages are applied by the update agent and cannot be replayed)"
+                         if not delta_file else f"✗ {partition}.img: Source image not found - {source_file}")
+            records.append({"partition": partition, "status": f"{missing.replace(' ', '_')}_missing"})
+            flagged += 1
+            continue
+        try:
+            report = apply_simulator.simulate_apply(source_file, delta_file, profile, partition)
+        except Exception as e:
+            lines.append(f"✗ {partition}.img: Exception - {str(e)}")
+            records.append({"partition": partition, "status": "exception", "detail": str(e)})
+            flagged += 1
+            continue
+        
+        problems = []
+        if report["status"] != "ok":
+            problems.append(f"replay failed under the memory cap: {report.get('error', '')}")
+        elif not report["within_memory"]:
+            problems.append("peak memory above RamSize")
+        if max_apply_seconds is not None and report["estimated_apply_seconds"] > max_apply_seconds:
+            problems.append(f"apply time above {max_apply_seconds:g}s")
+        report["over_budget"] = bool(problems)
+        flagged += bool(problems)
+        
+        peak = f"{report['peak_memory_bytes']:,} bytes" if report["peak_memory_bytes"] is not None else "n/a (full image)"
+        line = (f"{'⚠' if problems else '✓'} {partition}.img ({os.path.basename(delta_file)}{', in-place' if report['in_place'] else ''}): "
+                f"~{report['estimated_apply_seconds']:.1f}s on device\n"
+                f"  Peak memory: {peak}, read {report['bytes_read']:,} bytes, written {report['bytes_written']:,} bytes ({report['io_source']})")
+        if problems:
+            line += "\n  Over budget: " + "; ".join(problems)
+        lines.append(line)
+        records.append(report)
+    
+    summary = "\n".join(lines)
+    if flagged:
+        summary += f"\n\n{flagged} partition(s) need attention."
+    return _tool_result("simulate_device_apply", summary, partitions=records, flagged=flagged,
+                        ram_size=profile["ram_size"])
+
+
+# Secondary compression codecs: name -> (module, level, file extension)
+# Every output is a standard container that xz -d, bunzip2 or gunzip restores.
+SECONDARY_CODECS = {
+    "lzma-6": ("lzma", 6, ".xz"),
+    "lzma-9e": ("lzma", 9, ".xz"),
+    "bz2-9": ("bz2", 9, ".bz2"),
+    "gzip-9": ("gzip", 9, ".gz"),
+}
+
+# Extensions decompress_delta_output understands
+COMPRESSED_DELTA_EXTENSIONS = tuple(dict.fromkeys(extension for _, _, extension in SECONDARY_CODECS.values()))
+
+
+def _compress_with_codec(delta_file: str, codec: str, output_file: str) -> dict:
+    """Compress a delta file with a single codec (runs in a worker process).
+    
+    Args:
+        delta_file: Path of the raw delta file
+        codec: Codec name from SECONDARY_CODECS
+        output_file: Path of the compressed candidate file
+    
+    Returns:
+        Dictionary with codec name, compressed size and elapsed seconds
+    """
+    import time
+    import lzma
+    import bz2
+    import zlib
+    
+    module, level, _ = SECONDARY_CODECS[codec]
+    if module == "lzma":
+        preset = level | lzma.PRESET_EXTREME if codec.endswith("e") else level
+        compressor = lzma.LZMACompressor(preset=preset)
+    elif module == "bz2":
+        compressor = bz2.BZ2Compressor(level)
+    else:
+        # wbits 16 + MAX_WBITS writes a gzip header and trailer
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    
+    start = time.monotonic()
+    with open(delta_file, 'rb') as src, open(output_file, 'wb') as dst:
+        while True:
+            chunk = src.read(1024 * 1024)
+            if not chunk:
+                break
+            dst.write(compressor.compress(chunk))
+        dst.write(compressor.flush())
+    
+    return {
+        "codec": codec,
+        "size": os.path.getsize(output_file),
+        "seconds": time.monotonic() - start
+    }
+
+
+def compress_delta_outputs(delta_files: list, time_budget_seconds: float = 300) -> dict:
+    """Race the secondary compression codecs over delta files in parallel processes.
+    
+    Every (delta file, codec) pair runs in a process pool. When the time budget
+    expires the pool is terminated and only finished candidates are considered.
+    The smallest result replaces the raw delta; if no codec beats the raw file,
+    the raw delta is kept. decompress_delta_output restores a replaced delta.
+    
+    The pool uses the spawn start method: the calling process may run job
+    server, pipeline or hashing threads, and forking it could copy a held lock.
+    
+    Args:
+        delta_files: List of delta file paths
+        time_budget_seconds: Wall-clock budget for the whole compression stage
+    
+    Returns:
+        Dictionary mapping each delta file to its record (codec, ratio, seconds, output)
+    """
+    import time
+    import multiprocessing
+    
+    print(f"[TRACE] Secondary compression of {len(delta_files)} delta file(s), budget {time_budget_seconds}s")
+    
+    deadline = time.monotonic() + time_budget_seconds
+    pending = []
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool(processes=min(os.cpu_count() or 1, len(delta_files) * len(SECONDARY_CODECS)))
+    try:
+        for delta_file in delta_files:
+            for codec in SECONDARY_CODECS:
+                candidate = f"{delta_file}.{codec}.tmp"
+                async_result = pool.apply_async(_compress_with_codec, (delta_file, codec, candidate))
+                pending.append((delta_file, codec, candidate, async_result))
+        
+        finished = {delta_file: [] for delta_file in delta_files}
+        for delta_file, codec, candidate, async_result in pending:
+            remaining = deadline - time.monotonic()
+            try:
+                finished[delta_file].append(async_result.get(timeout=max(remaining, 0)))
+            except multiprocessing.TimeoutError:
+                print(f"[TRACE] Codec {codec} did not finish within budget for {delta_file}")
+            except Exception as e:
+                print(f"[TRACE] Codec {codec} failed for {delta_file}: {e}")
+    finally:
+        pool.terminate()
+        pool.join()
+    
+    results = {}
+    for delta_file in delta_files:
+        raw_size = os.path.getsize(delta_file)
+        candidates = sorted(finished[delta_file], key=lambda r: r["size"])
+        best = candidates[0] if candidates and candidates[0]["size"] < raw_size else None
+        
+        if best:
+            extension = SECONDARY_CODECS[best["codec"]][2]
+            output_file = delta_file + extension
+            os.replace(f"{delta_file}.{best['codec']}.tmp", output_file)
+            os.remove(delta_file)
+            record = {"codec": best["codec"], "ratio": best["size"] / raw_size if raw_size else 1.0,
+                      "seconds": best["seconds"], "output": output_file}
+        else:
+            record = {"codec": "none", "ratio": 1.0, "seconds": 0.0, "output": delta_file}
+        
+        # Remove losing and unfinished candidates
+        for codec in SECONDARY_CODECS:
+            candidate = f"{delta_file}.{codec}.tmp"
+            if os.path.exists(candidate):
+                os.remove(candidate)
+        
+        print(f"[TRACE] {os.path.basename(delta_file)}: codec={record['codec']} ratio={record['ratio']:.3f}")
+        results[delta_file] = record
+    
+    return results
+
+
+def decompress_delta_output(compressed_file: str, output_file: Optional[str] = None) -> str:
+    """Restore a delta replaced by the secondary compression stage.
+    
+    Args:
+        compressed_file: Path of a .xz, .bz2 or .gz delta
+        output_file: Path of the restored delta (default: the name without the extension)
+    
+    Returns:
+        Path of the restored delta
+    """
+    import bz2
+    import gzip
+    import lzma
+    
+    stem, extension = os.path.splitext(compressed_file)
+    if extension not in COMPRESSED_DELTA_EXTENSIONS:
+        raise ValueError(f"Not a compressed delta: {compressed_file}")
+    output_file = output_file or stem
+    
+    opener = {".xz": lzma.open, ".bz2": bz2.open, ".gz": gzip.open}[extension]
+    with opener(compressed_file, 'rb') as src, open(output_file, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 4 * 1024 * 1024)
+    return output_file
+
+
+# Session state keys used by the multi-sheet fan-out workflow (multi_sheet_tool)
+MULTI_SHEET_STATE_KEY = "multi_sheet_request"
+MULTI_SHEET_RESULT_PREFIX = "multi_sheet_result:"
+
+
+def _is_error_result(result) -> bool:
+    """Check a tool result for failure in either result mode."""
+    if isinstance(result, dict):
+        return result.get("status") != "ok"
+    return str(result).startswith("Error")
+
+
+@job_workspace.scoped
+def prepare_multi_sheet_run(
+    partition_sheets: str,
+    source_path: str,
+    target_path: str,
+    ecu_type: str,
+    delta_tool: str,
+    partition_files: str = "all",
+    tool_context: Optional[Any] = None,
+    workspace: Optional[str] = None
+) -> str:
+    """Store the parameters of a concurrent multi-sheet delta run in the session state.
+    
+    After this tool succeeds, transfer to the multi_sheet_tool agent, which runs one
+    deterministic pipeline (config XML, partition list, delta generation) per sheet
+    concurrently and merges the results into a single report.
+    
+    Args:
+        partition_sheets: Comma-separated list of partition sheet names (e.g., "QNX,Android")
+        source_path: Path to the extracted source folder
+        target_path: Path to the extracted target folder
+        ecu_type: ECU type/name to find the partition file
+        delta_tool: Delta tool type ("redbend" or "xdelta")
+        partition_files: Comma-separated partition names, or "all" for every partition of each sheet
+        tool_context: ADK tool context (injected by ADK)
+        workspace: Job workspace (name or directory) the sheet pipelines run in
+    
+    Returns:
+        Status message
+    """
+    sheets = [sheet.strip() for sheet in partition_sheets.split(',') if sheet.strip()]
+    if not sheets:
+        return "Error: No partition sheets specified"
+    if tool_context is None:
+        return "Error: prepare_multi_sheet_run must be called from an ADK agent session"
+    
+    tool_context.state[MULTI_SHEET_STATE_KEY] = {
+        "sheets": sheets,
+        "source_path": source_path,
+        "target_path": target_path,
+        "ecu_type": ecu_type,
+        "delta_tool": delta_tool,
+        "partition_files": partition_files,
+        "workspace": job_workspace.current().to_dict(),
+    }
+    print(f"[TRACE] Prepared multi-sheet run for sheets: {sheets}")
+    return f"Prepared concurrent delta generation for {len(sheets)} partition sheet(s): {', '.join(sheets)}. Transfer to multi_sheet_tool to run it."
+
+
+def run_sheet_pipeline(request: dict, partition_sheet: str) -> dict:
+    """Run config generation and delta generation for one partition sheet.
+    
+    This is the deterministic per-sheet pipeline used by the multi-sheet fan-out.
+    Outputs are kept apart per sheet (config_<sheet>.xml, delta_output/<sheet>,
+    <sheet>_source_target.mld) so several sheets can run at the same time.
+    
+    Args:
+        request: Run parameters as stored by prepare_multi_sheet_run
+        partition_sheet: Sheet name to process
+    
+    Returns:
+        Dictionary with sheet, status, elapsed seconds and the final tool result
+    """
+    import time
+    
+    start = time.monotonic()
+    print(f"[TRACE] Sheet pipeline started: {partition_sheet}")
+    is_redbend = str(request["delta_tool"]).strip().lower() == "redbend"
+    # Session state only holds plain data; rebuild the workspace the run was prepared in
+    workspace = job_workspace.Workspace.from_dict(request["workspace"]) if request.get("workspace") else job_workspace.current()
+    
+    def finish(status, step, result):
+        elapsed = time.monotonic() - start
+        print(f"[TRACE] Sheet pipeline {partition_sheet} finished: {status} ({elapsed:.1f}s)")
+        return {"sheet": partition_sheet, "status": status, "step": step,
+                "seconds": round(elapsed, 2), "result": result}
+    
+    # Config reads, tool results and the side log all belong to the sheet's workspace
+    with job_workspace.use(workspace):
+        config_result = generate_config_xml(
+            request["ecu_type"],
+            request["source_path"],
+            request["target_path"],
+            component_delta_filename=f"{partition_sheet}_source_target.mld" if is_redbend else "source_target.mld",
+            partition_sheet=partition_sheet,
+            workspace=workspace
+        )
+        if _is_error_result(config_result):
+            return finish("error", "generate_config_xml", config_result)
+        
+        config_file = f"config_{partition_sheet}.xml"
+        if is_redbend:
+            delta_result = generate_delta(config_file, workspace=workspace)
+            return finish("error" if _is_error_result(delta_result) else "ok", "generate_delta", delta_result)
+        
+        partition_files = request.get("partition_files") or "all"
+        if partition_files.strip().lower() == "all":
+            parsed = _parse_config_xml(workspace.path(config_file))
+            if _is_error_result(parsed):
+                return finish("error", "parse_config_xml", parsed)
+            partition_files = parsed["partitions"] if isinstance(parsed, dict) else parsed
+        
+        delta_result = generate_xdelta(
+            partition_files,
+            request["source_path"],
+            request["target_path"],
+            partition_sheet,
+            output_path=os.path.join(workspace.delta_output, partition_sheet),
+            workspace=workspace
+        )
+        return finish("error" if _is_error_result(delta_result) else "ok", "generate_xdelta", delta_result)
@@ -1 +1,11 @@
-from . import agent
+import importlib
+
+
+# The ADK agents are loaded lazily: importing deltaGen_Agent.Utils (delta,
+# extraction and validation functions) must not pull in google.adk.
+def __getattr__(name):
+    if name == "agent":
+        return importlib.import_module(f"{__name__}.agent")
+    if name == "root_agent":
+        return importlib.import_module(f"{__name__}.agent").root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,249 @@
+"""Device-side apply cost simulator.
+
+Replays generated deltas on the build host the way the target ECU would apply
+them and reports, per partition, the peak memory, the bytes read and written
+and an estimated apply time on the device.
+
+Every xdelta3 decode runs with its address space capped at the device RAM
+size (RLIMIT_AS, which is stricter than resident memory). Segmented and
+ext4 block-map deltas are replayed by an uncapped Python child that starts
+the capped xdelta3 processes one segment at a time; capping the interpreter
+itself would count its own mappings and thread stacks against the device.
+Peak resident memory comes from the child's rusage (which includes the
+decoders it waited for) and the I/O counters from /proc/<pid>/io. The device speed is modelled rather than enforced on the
+host: the estimated apply time is
+
+    host CPU time * cpu_factor + bytes read / read bandwidth + bytes written / write bandwidth
+
+In-place partitions write every sector twice (through the backup sectors
+first), so their write volume is doubled.
+
+Device limits come from a Redbend config (RamSize, NumBackupSectors and the
+per-partition InPlace flag) or are given explicitly.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from typing import Optional
+
+from .Utils import COMPRESSED_DELTA_EXTENSIONS, decompress_delta_output
+
+
+DEFAULT_RAM_SIZE = 0xA000000
+DEFAULT_NUM_BACKUP_SECTORS = 1024
+DEFAULT_SECTOR_SIZE = 4096
+# Typical eMMC on an infotainment ECU
+DEFAULT_READ_MBPS = 100.0
+DEFAULT_WRITE_MBPS = 40.0
+# How much slower the device CPU decodes than the build host
+DEFAULT_CPU_FACTOR = 4.0
+
+_POLL_INTERVAL = 0.02
+
+
+def _parse_int(text: Optional[str], default: int) -> int:
+    try:
+        return int((text or '').strip(), 0)
+    except ValueError:
+        return default
+
+
+def device_profile(config_path: Optional[str] = None, ram_size: Optional[int] = None,
+                   read_mbps: float = DEFAULT_READ_MBPS, write_mbps: float = DEFAULT_WRITE_MBPS,
+                   cpu_factor: float = DEFAULT_CPU_FACTOR, sector_size: int = DEFAULT_SECTOR_SIZE) -> dict:
+    """Build a device profile, reading RamSize, NumBackupSectors and InPlace from a config if given.
+
+    Args:
+        config_path: Redbend config XML (optional)
+        ram_size: RAM available to the update agent in bytes (overrides the config)
+        read_mbps: Storage read bandwidth in MB/s
+        write_mbps: Storage write bandwidth in MB/s
+        cpu_factor: Device decode time relative to the build host
+        sector_size: Storage sector size in bytes
+
+    Returns:
+        Dictionary describing the device limits
+    """
+    profile = {
+        "ram_size": DEFAULT_RAM_SIZE,
+        "num_backup_sectors": DEFAULT_NUM_BACKUP_SECTORS,
+        "sector_size": sector_size,
+        "read_bandwidth": read_mbps * 1e6,
+        "write_bandwidth": write_mbps * 1e6,
+        "cpu_factor": cpu_factor,
+        "in_place": {},
+        "config": config_path,
+    }
+    if config_path:
+        root = ET.parse(config_path).getroot()
+        profile["ram_size"] = _parse_int(root.findtext('RamSize'), DEFAULT_RAM_SIZE)
+        profile["num_backup_sectors"] = _parse_int(root.findtext('NumBackupSectors'), DEFAULT_NUM_BACKUP_SECTORS)
+        for element in root.findall('Partition'):
+            name = (element.findtext('PartitionName') or '').strip()
+            profile["in_place"][name] = (element.findtext('InPlace') or '').strip().lower() in ("true", "yes", "1")
+    if ram_size:
+        profile["ram_size"] = ram_size
+    return profile
+
+
+def find_delta(delta_dir: str, partition: str) -> Optional[str]:
+    """Return the generated file of a partition (segmented, plain or full image, possibly compressed)."""
+    names = [f"{partition}{kind}{extension}" for extension in ("",) + COMPRESSED_DELTA_EXTENSIONS
+             for kind in (".segdelta", ".delta", ".full.img")]
+    for name in names:
+        path = os.path.join(delta_dir, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _read_proc_io(pid: int) -> Optional[dict]:
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            return {key: int(value) for key, value in (line.split(': ') for line in f.read().splitlines())}
+    except (OSError, ValueError):
+        return None
+
+
+# Stands in for xdelta3: caps its own address space, then execs the real decoder
+_CAPPED_XDELTA = """#!{python}
+import os, resource, sys
+resource.setrlimit(resource.RLIMIT_AS, ({cap}, {cap}))
+os.execvp({xdelta!r}, [{xdelta!r}] + sys.argv[1:])
+"""
+
+
+def _capped_xdelta(work_dir: str, memory_cap: int) -> str:
+    """Write an xdelta3 launcher whose decodes run under the memory cap and return its path."""
+    from .Utils import find_xdelta_executable
+
+    launcher = os.path.join(work_dir, "xdelta3-capped")
+    with open(launcher, 'w') as f:
+        f.write(_CAPPED_XDELTA.format(python=sys.executable, cap=memory_cap,
+                                      xdelta=find_xdelta_executable() or "xdelta3"))
+    os.chmod(launcher, 0o755)
+    return launcher
+
+
+def _run_sampled(command: list, timeout: float = 3600) -> dict:
+    """Run a command, sampling its I/O counters.
+
+    Returns:
+        Dictionary with returncode, stderr, wall and CPU seconds, peak RSS in KiB and the last /proc io counters
+    """
+    start = time.monotonic()
+    io_counters = None
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=stderr)
+        while True:
+            pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                process.returncode = os.waitstatus_to_exitcode(status)
+                break
+            io_counters = _read_proc_io(process.pid) or io_counters
+            if time.monotonic() - start > timeout:
+                process.kill()
+                process.wait()
+                raise subprocess.TimeoutExpired(command, timeout)
+            time.sleep(_POLL_INTERVAL)
+        stderr.seek(0)
+        error_output = stderr.read().decode(errors='replace')
+    return {
+        "returncode": process.returncode,
+        "stderr": error_output,
+        "wall_seconds": time.monotonic() - start,
+        "cpu_seconds": rusage.ru_utime + rusage.ru_stime,
+        "peak_rss_kb": rusage.ru_maxrss,
+        "io": io_counters,
+    }
+
+
+def _decode_command(source_file: str, delta_file: str, output_file: str, block_map: Optional[str],
+                    xdelta_exe: str) -> list:
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if delta_file.endswith('.segdelta'):
+        # One segment at a time, like the single decoder on the device
+        return [sys.executable, "-c",
+                "import sys; sys.path.insert(0, sys.argv[1]); from deltaGen_Agent.segmented_delta import apply_segmented; "
+                "apply_segmented(sys.argv[2], sys.argv[3], sys.argv[4], workers=1, xdelta_exe=sys.argv[5])",
+                package_root, source_file, delta_file, output_file, xdelta_exe]
+    if block_map:
+        return [sys.executable, "-c",
+                "import sys; sys.path.insert(0, sys.argv[1]); from deltaGen_Agent.ext4_blockmap import apply_masked_delta; "
+                "apply_masked_delta(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], sys.argv[6])",
+                package_root, source_file, delta_file, block_map, output_file, xdelta_exe]
+    return [xdelta_exe, "-d", "-f", "-s", source_file, delta_file, output_file]
+
+
+def simulate_apply(source_file: str, delta_file: str, profile: dict, partition: str) -> dict:
+    """Replay one delta under the device memory cap and estimate its device apply time.
+
+    Args:
+        source_file: Source partition image (the image on the device before the update)
+        delta_file: Generated delta, full image or compressed delta
+        profile: Device profile from device_profile
+        partition: Partition name (for the InPlace flag and block map lookup)
+
+    Returns:
+        Per-partition report
+    """
+    in_place = profile["in_place"].get(partition, False)
+    report = {"partition": partition, "delta_file": delta_file, "in_place": in_place,
+              "delta_size": os.path.getsize(delta_file)}
+
+    with tempfile.TemporaryDirectory(prefix="apply_sim_") as work_dir:
+        output_file = os.path.join(work_dir, f"{partition}.img")
+
+        if delta_file.endswith(COMPRESSED_DELTA_EXTENSIONS):
+            plain_delta = os.path.join(work_dir, os.path.splitext(os.path.basename(delta_file))[0])
+            decompress_delta_output(delta_file, plain_delta)
+            report["decompressed_delta_size"] = os.path.getsize(plain_delta)
+        else:
+            plain_delta = delta_file
+
+        if plain_delta.endswith('.full.img'):
+            # A full image is only written
+            target_size = os.path.getsize(plain_delta)
+            run = {"returncode": 0, "stderr": "", "cpu_seconds": 0.0, "wall_seconds": 0.0,
+                   "peak_rss_kb": None, "io": None}
+            bytes_read, bytes_written = target_size, target_size
+        else:
+            block_map = os.path.join(os.path.dirname(delta_file), f"{partition}.blockmap.json")
+            command = _decode_command(source_file, plain_delta, output_file,
+                                      block_map if os.path.isfile(block_map) else None,
+                                      _capped_xdelta(work_dir, profile["ram_size"]))
+            print(f"[TRACE] Replaying {partition} under {profile['ram_size']:,} byte memory cap")
+            run = _run_sampled(command)
+            target_size = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+            # /proc is sampled while the decoder runs, so its counters can miss the last writes;
+            # the output size is a lower bound for the writes
+            bytes_read = run["io"]["rchar"] if run["io"] else os.path.getsize(source_file) + os.path.getsize(plain_delta)
+            bytes_written = max(run["io"]["wchar"] if run["io"] else 0, target_size)
+
+    if in_place:
+        bytes_written *= 2
+        backup_bytes = profile["num_backup_sectors"] * profile["sector_size"]
+        report["backup_cycles"] = -(-target_size // backup_bytes) if backup_bytes else None
+
+    peak_bytes = run["peak_rss_kb"] * 1024 if run["peak_rss_kb"] is not None else None
+    within_memory = run["returncode"] == 0 and (peak_bytes is None or peak_bytes <= profile["ram_size"])
+    estimated_seconds = (run["cpu_seconds"] * profile["cpu_factor"]
+                         + bytes_read / profile["read_bandwidth"]
+                         + bytes_written / profile["write_bandwidth"])
+    report.update(
+        status="ok" if run["returncode"] == 0 else "failed",
+        within_memory=within_memory,
+        peak_memory_bytes=peak_bytes,
+        bytes_read=bytes_read,
+        bytes_written=bytes_written,
+        target_size=target_size,
+        host_cpu_seconds=round(run["cpu_seconds"], 3),
+        estimated_apply_seconds=round(estimated_seconds, 2),
+        io_source="proc" if run["io"] else "model",
+    )
+    if run["returncode"] != 0:
+        report["error"] = run["stderr"].strip()[-300:] or f"exit code {run['returncode']}"
+    return report
@@ -0,0 +1,199 @@
+"""Single-pass streaming extraction of tar, tar.gz, tar.xz and tar.bz2 archives.
+
+The archive is read strictly sequentially (tarfile stream mode), so it can
+come from a pipe ("-" reads standard input). While streaming, every member is
+
+    filtered   only <sheet>/<file> entries listed in the partition file are kept
+               (when a filter is given); __MACOSX and hidden top-level files are skipped
+    flattened  a single top-level folder is stripped, as flatten_extracted_folder
+               does after a zip extraction; if a member outside that folder shows
+               up later, the files written so far are moved back under it
+    hashed     SHA-256 of every extracted file, written to <extract_path>/.sha256sums
+    deduplicated  a member whose bytes match the file at the same relative path in
+               a reference tree (the extracted source) is linked to it instead of
+               written; bytes are only written from the first difference on
+"""
+import hashlib
+import os
+import shutil
+import sys
+import tarfile
+from typing import Callable, Optional
+
+from .Utils import _is_safe_member_name, _clone_or_link
+from .artifact_hashing import SUMS_FILENAME, write_sums
+
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.xz", ".txz", ".tar.bz2", ".tbz2")
+ARCHIVE_SUFFIXES = TAR_SUFFIXES + (".zip",)
+HASH_MANIFEST = SUMS_FILENAME
+
+_STREAM_CHUNK = 1024 * 1024
+
+
+def is_tar_archive(path: str) -> bool:
+    """Check whether a path names a tar-family archive ("-" is a tar stream on standard input)."""
+    if path == "-":
+        return True
+    if path.lower().endswith(TAR_SUFFIXES):
+        return True
+    return os.path.isfile(path) and not path.lower().endswith(".zip") and tarfile.is_tarfile(path)
+
+
+def archive_base_name(path: str, default: str) -> str:
+    """Return the archive file name without its archive suffix (default for standard input)."""
+    if path == "-":
+        return default
+    name = os.path.basename(path)
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+def _member_parts(name: str) -> list:
+    return [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+
+
+def _write_member(stream, destination: str, size: int, reference: Optional[str]) -> tuple:
+    """Stream one member to disk, hashing it and skipping the write if it matches the reference.
+
+    Returns:
+        Tuple of (sha256 hex digest, True if the file was linked to the reference)
+    """
+    digest = hashlib.sha256()
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    # Never write through a link left by an earlier deduplicated extraction
+    if os.path.lexists(destination):
+        os.remove(destination)
+    ref = open(reference, 'rb') if reference and os.path.getsize(reference) == size else None
+    out = None
+    matched = 0
+    try:
+        for chunk in iter(lambda: stream.read(_STREAM_CHUNK), b''):
+            digest.update(chunk)
+            if out is None and ref is not None:
+                if ref.read(len(chunk)) == chunk:
+                    matched += len(chunk)
+                    continue
+                # First difference: copy the matching prefix from the reference, then keep streaming
+                out = open(destination, 'wb')
+                ref.seek(0)
+                remaining = matched
+                while remaining:
+                    block = ref.read(min(_STREAM_CHUNK, remaining))
+                    out.write(block)
+                    remaining -= len(block)
+            if out is None:
+                out = open(destination, 'wb')
+            out.write(chunk)
+        if out is None and ref is not None:
+            ref.close()
+            ref = None
+            if _clone_or_link(reference, destination):
+                return digest.hexdigest(), True
+            shutil.copyfile(reference, destination)
+        elif out is None:
+            open(destination, 'wb').close()
+    finally:
+        if out is not None:
+            out.close()
+        if ref is not None:
+            ref.close()
+    return digest.hexdigest(), False
+
+
+def extract_tar_stream(
+    archive_path: str,
+    extract_path: str,
+    keep: Optional[Callable[[list], bool]] = None,
+    reference_root: Optional[str] = None
+) -> dict:
+    """Extract a tar-family archive in one sequential pass.
+
+    Args:
+        archive_path: Archive path, or "-" for standard input
+        extract_path: Directory to extract into (flattened)
+        keep: Filter called with the member path parts (after flattening); False skips the member
+        reference_root: Extracted tree whose identical files are linked instead of rewritten
+
+    Returns:
+        Dictionary with extracted/skipped/deduplicated counts, bytes and the hash manifest path
+    """
+    os.makedirs(extract_path, exist_ok=True)
+    fileobj = sys.stdin.buffer if archive_path == "-" else None
+    prefix = None          # top-level folder being stripped, "" once flattening is off
+    extracted = {}         # relative path -> sha256
+    stats = {"extracted_files": 0, "extracted_bytes": 0, "skipped_members": 0,
+             "deduplicated_files": 0, "deduplicated_bytes": 0}
+
+    def stop_flattening():
+        # A member outside the stripped folder: move everything written so far back under it
+        nonlocal prefix, extracted
+        holding = os.path.join(extract_path, ".unflatten")
+        os.makedirs(holding)
+        for entry in os.listdir(extract_path):
+            if entry != ".unflatten" and entry != HASH_MANIFEST:
+                os.rename(os.path.join(extract_path, entry), os.path.join(holding, entry))
+        os.rename(holding, os.path.join(extract_path, prefix))
+        print(f"[TRACE] Archive has more than one top-level entry, keeping folder: {prefix}")
+        extracted = {f"{prefix}/{path}": digest for path, digest in extracted.items()}
+        prefix = ""
+
+    with tarfile.open(archive_path if fileobj is None else None, mode="r|*", fileobj=fileobj) as tar:
+        for member in tar:
+            parts = _member_parts(member.name)
+            if not parts or parts[0].startswith('__MACOSX') or not _is_safe_member_name('/'.join(parts)):
+                stats["skipped_members"] += 1
+                continue
+            if member.isdir():
+                if prefix is None and len(parts) == 1 and not parts[0].startswith('.'):
+                    prefix = parts[0]
+                continue
+            if len(parts) == 1 and parts[0].startswith('.'):
+                stats["skipped_members"] += 1
+                continue
+
+            # Flatten a single top-level folder while streaming
+            if prefix is None:
+                prefix = parts[0] if len(parts) > 1 else ""
+            if prefix:
+                if len(parts) > 1 and parts[0] == prefix:
+                    parts = parts[1:]
+                else:
+                    stop_flattening()
+            relative = '/'.join(parts)
+
+            if not (member.isfile() or member.islnk()) or (keep is not None and not keep(parts)):
+                stats["skipped_members"] += 1
+                continue
+
+            destination = os.path.join(extract_path, *parts)
+            if member.islnk():
+                # Hard link to an earlier member of the same archive
+                link_parts = _member_parts(member.linkname)
+                if prefix and link_parts and link_parts[0] == prefix:
+                    link_parts = link_parts[1:]
+                link_relative = '/'.join(link_parts)
+                if link_relative not in extracted:
+                    stats["skipped_members"] += 1
+                    continue
+                _clone_or_link(os.path.join(extract_path, *link_parts), destination)
+                extracted[relative] = extracted[link_relative]
+                continue
+
+            reference = os.path.join(reference_root, *parts) if reference_root else None
+            if reference and not os.path.isfile(reference):
+                reference = None
+            digest, linked = _write_member(tar.extractfile(member), destination, member.size, reference)
+            extracted[relative] = digest
+            if linked:
+                stats["deduplicated_files"] += 1
+                stats["deduplicated_bytes"] += member.size
+            else:
+                stats["extracted_files"] += 1
+                stats["extracted_bytes"] += member.size
+
+    manifest = write_sums(extract_path, extracted)
+    stats.update(hashed_files=len(extracted), hash_manifest=manifest)
+    return stats
@@ -0,0 +1,247 @@
+"""SHA-256 digests of source images, target images and generated deltas.
+
+Files are hashed on a thread pool while extraction and delta generation go
+on. Each file is read through memory-mapped views of HASH_CHUNK bytes, so
+large images are not copied through Python buffers, and hashlib releases the
+GIL while digesting a view, so several files are hashed on several cores.
+(The chunks of one file are digested in order; SHA-256 is sequential.)
+
+Two kinds of results are written:
+
+    <tree>/.sha256sums               sha256sum-compatible list for an extracted tree
+                                     (also written by archive_stream for tar input)
+    <delta_output>/artifact_manifest.json
+                                     integrity manifest of the inputs and outputs of
+                                     generate_xdelta / generate_delta runs
+
+A digest listed in a tree's .sha256sums is reused when the list is newer
+than the file, so images hashed during extraction are not read again.
+
+    python -m deltaGen_Agent.artifact_hashing FILE...
+"""
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: manifest updates are only serialized within the process
+    fcntl = None
+
+
+HASH_WORKERS_ENV = "DELTAGEN_HASH_WORKERS"
+SUMS_FILENAME = ".sha256sums"
+MANIFEST_FILENAME = "artifact_manifest.json"
+MANIFEST_LOCK_FILENAME = f".{MANIFEST_FILENAME}.lock"
+HASH_CHUNK = 64 * 1024 * 1024
+
+# Manifest updates of concurrent delta workers in this process; flock() on the
+# lock file serializes them with other processes (delta_cluster workers)
+_manifest_lock = threading.Lock()
+
+
+def hash_workers() -> int:
+    """Return the hashing thread count (DELTAGEN_HASH_WORKERS, default min(4, CPUs))."""
+    try:
+        return max(1, int(os.environ[HASH_WORKERS_ENV]))
+    except (KeyError, ValueError):
+        return min(4, os.cpu_count() or 1)
+
+
+def hash_file(path: str, chunk_size: int = HASH_CHUNK) -> str:
+    """Return the SHA-256 hex digest of a file, read through memory-mapped views."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, chunk_size):
+                    digest.update(view[offset:offset + chunk_size])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+def read_sums(root: str) -> dict:
+    """Return {relative path: sha256} from a tree's .sha256sums, or {} if there is none."""
+    sums = {}
+    try:
+        with open(os.path.join(root, SUMS_FILENAME)) as f:
+            for line in f:
+                digest, _, relative = line.rstrip('\n').partition('  ')
+                if relative:
+                    sums[relative] = digest
+    except OSError:
+        pass
+    return sums
+
+
+def write_sums(root: str, digests: dict) -> str:
+    """Write {relative path: sha256} as <root>/.sha256sums and return its path."""
+    path = os.path.join(root, SUMS_FILENAME)
+    with open(path, 'w') as f:
+        for relative in sorted(digests):
+            f.write(f"{digests[relative]}  {relative}\n")
+    return path
+
+
+class HashPool:
+    """Thread pool hashing files in the background.
+
+    submit() returns at once; results() waits for everything submitted so far.
+    Use as a context manager so the threads are shut down.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or hash_workers(), thread_name_prefix="hash")
+        self.futures = []
+        self.lock = threading.Lock()
+        self.sums = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def _known_digest(self, path: str, root: Optional[str], stat: os.stat_result) -> Optional[str]:
+        # Reuse the digest recorded for the tree if the list was written after the file
+        if not root:
+            return None
+        with self.lock:
+            if root not in self.sums:
+                sums_path = os.path.join(root, SUMS_FILENAME)
+                mtime = os.stat(sums_path).st_mtime_ns if os.path.exists(sums_path) else None
+                self.sums[root] = (mtime, read_sums(root) if mtime else {})
+            mtime, sums = self.sums[root]
+        if mtime is None or stat.st_mtime_ns > mtime:
+            return None
+        return sums.get(os.path.relpath(path, root).replace(os.sep, '/'))
+
+    def _hash(self, path: str, root: Optional[str], info: dict) -> dict:
+        started = time.perf_counter()
+        stat = os.stat(path)
+        digest = self._known_digest(path, root, stat)
+        reused = digest is not None
+        if not reused:
+            digest = hash_file(path)
+        return dict(info, path=os.path.abspath(path), size=stat.st_size, sha256=digest,
+                    inode=[stat.st_dev, stat.st_ino], reused=reused,
+                    seconds=round(time.perf_counter() - started, 3))
+
+    def submit(self, path: str, root: Optional[str] = None, **info):
+        """Queue a file for hashing.
+
+        Args:
+            path: File to hash
+            root: Tree the file belongs to; its .sha256sums is consulted first
+            **info: Fields stored with the digest (role, partition, sheet, ...)
+
+        Returns:
+            Future of the digest record
+        """
+        future = self.executor.submit(self._hash, path, root, info)
+        with self.lock:
+            self.futures.append(future)
+        return future
+
+    def wait_for(self, futures: list) -> None:
+        """Block until the given files are hashed (e.g. before they are deleted)."""
+        wait(futures)
+
+    def results(self) -> list:
+        """Wait for all submitted files and return their records (failures carry an error field)."""
+        with self.lock:
+            futures = list(self.futures)
+        wait(futures)
+        records = []
+        for future in futures:
+            try:
+                records.append(future.result())
+            except Exception as e:
+                records.append({"path": getattr(e, "filename", None), "error": str(e)})
+        return records
+
+
+def write_tree_sums(root: str, records: list) -> Optional[str]:
+    """Write .sha256sums for an extracted tree from hash records, matched by inode.
+
+    Matching by inode keeps the digests valid after the tree was flattened (files
+    were moved, not rewritten) and covers files linked from another tree.
+
+    Returns:
+        Path of the written list, or None if the tree holds no hashed file
+    """
+    by_inode = {tuple(record["inode"]): record["sha256"] for record in records if "inode" in record}
+    digests = {}
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name == SUMS_FILENAME:
+                continue
+            path = os.path.join(directory, name)
+            stat = os.stat(path)
+            digest = by_inode.get((stat.st_dev, stat.st_ino))
+            if digest:
+                digests[os.path.relpath(path, root).replace(os.sep, '/')] = digest
+    return write_sums(root, digests) if digests else None
+
+
+def update_manifest(output_dir: str, records: list, tool: str) -> str:
+    """Merge hash records into <output_dir>/artifact_manifest.json.
+
+    Artifacts are keyed by absolute path; a later run replaces the entry of a
+    file it hashed again. The read-merge-write cycle holds an exclusive flock()
+    on <output_dir>/.artifact_manifest.json.lock, so processes sharing the
+    output directory do not lose each other's entries, and the file is
+    replaced atomically.
+
+    Args:
+        output_dir: Delta output directory
+        records: Records from HashPool.results()
+        tool: Tool that produced the records
+
+    Returns:
+        Path of the manifest
+    """
+    path = os.path.join(output_dir, MANIFEST_FILENAME)
+    with _manifest_lock, open(os.path.join(output_dir, MANIFEST_LOCK_FILENAME), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {"algorithm": "sha256", "artifacts": {}}
+        now = time.strftime('%Y-%m-%dT%H:%M:%S')
+        for record in records:
+            if "sha256" not in record:
+                continue
+            entry = {key: value for key, value in record.items() if key not in ("path", "inode", "reused", "seconds")}
+            manifest["artifacts"][record["path"]] = dict(entry, tool=tool, hashed=now)
+        manifest["updated"] = now
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(temporary, path)
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+
+    with HashPool() as pool:
+        for file_path in sys.argv[1:]:
+            pool.submit(file_path)
+        for result in pool.results():
+            print(f"{result['sha256']}  {result['path']}" if "sha256" in result else f"error: {result['error']}")
@@ -0,0 +1,349 @@
+"""Pluggable delta backends.
+
+Every backend implements the same interface:
+
+    is_available(partition, sheet)  capability probe (tool installed, config present)
+    estimate(...)                   expected delta size and encode time
+    generate(...)                   write the delta for one partition image pair
+    apply(...)                      rebuild the target image from source and delta
+    verify(...)                     apply to a temporary file and compare with the target
+
+Implementations: xdelta3, Redbend (vRapidMobileCMD-Linux.exe) and a plain
+full-image copy. select_backend picks the backend with the smallest expected
+delta per partition, which is what the "auto" delta tool uses. Expected sizes
+come from what each backend actually produces:
+
+    xdelta   sampled encodes of the image pair (predict_delta); images too
+             small for sampling are encoded outright
+    redbend  the median delta ratio of its recorded runs (run_history); without
+             history it has no estimate and is not selected
+    full     the target size
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
+from typing import Optional
+
+from . import job_workspace
+from . import run_history
+from .Utils import find_xdelta_executable, _run_measured, _clone_or_link
+
+
+_HASH_CHUNK = 4 * 1024 * 1024
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DeltaBackend:
+    """Base class of a delta backend."""
+
+    name = ""
+    # Encode throughput (bytes/s) assumed when the run history has no data
+    default_throughput = 50e6
+
+    def is_available(self, partition: Optional[str] = None, sheet: Optional[str] = None) -> bool:
+        raise NotImplementedError
+
+    def _seconds(self, partition: str, sheet: Optional[str], target_size: int) -> float:
+        seconds = run_history.estimate_duration(partition, sheet, self.name, target_size)
+        return seconds if seconds is not None else target_size / self.default_throughput
+
+    def estimate(self, source_file: str, target_file: str, partition: str, sheet: Optional[str] = None) -> dict:
+        """Return the expected delta size and encode time of a partition.
+
+        The base implementation scales the target size by the backend's median
+        delta ratio from the run history.
+
+        Returns:
+            Dictionary with delta_bytes (None without history), seconds and basis
+        """
+        target_size = os.path.getsize(target_file)
+        ratio = run_history.delta_ratio(partition, sheet, self.name)
+        return {"delta_bytes": int(target_size * ratio) if ratio is not None else None,
+                "seconds": self._seconds(partition, sheet, target_size),
+                "basis": "run history" if ratio is not None else "no run history"}
+
+    def generate(self, source_file: str, target_file: str, output_dir: str, partition: str,
+                 sheet: Optional[str] = None) -> dict:
+        """Write the delta of one partition.
+
+        Returns:
+            Dictionary with delta_file, delta_size, duration and peak_memory_kb
+        """
+        raise NotImplementedError
+
+    def apply(self, source_file: str, delta_file: str, output_file: str) -> str:
+        raise NotImplementedError
+
+    def verify(self, source_file: str, delta_file: str, target_file: str) -> Optional[bool]:
+        """Apply the delta to a temporary file and compare it with the target (None if not possible)."""
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(delta_file)) as work_dir:
+            rebuilt = os.path.join(work_dir, "rebuilt.img")
+            try:
+                self.apply(source_file, delta_file, rebuilt)
+            except NotImplementedError:
+                return None
+            return _sha256(rebuilt) == _sha256(target_file)
+
+
+class XDeltaBackend(DeltaBackend):
+    name = "xdelta"
+    default_throughput = 40e6
+
+    def is_available(self, partition=None, sheet=None) -> bool:
+        return find_xdelta_executable() is not None
+
+    def estimate(self, source_file, target_file, partition, sheet=None) -> dict:
+        # Sampled encodes also find data that moved (within the sample margin)
+        target_size = os.path.getsize(target_file)
+        window = min(PREDICT_WINDOW, target_size // (2 * PREDICT_SAMPLES) // 4096 * 4096)
+        if window >= MIN_PREDICT_WINDOW:
+            prediction = predict_delta(source_file, target_file, self.name, window=window)
+            return {"delta_bytes": prediction["predicted_delta_bytes"], "seconds": prediction["predicted_seconds"],
+                    "basis": "sampled encode"}
+        # Too small to sample: encoding it outright costs about as much
+        with tempfile.TemporaryDirectory(prefix="delta_estimate_") as work_dir:
+            generated = self.generate(source_file, target_file, work_dir, partition, sheet)
+        return {"delta_bytes": generated["delta_size"], "seconds": generated["duration"], "basis": "encoded"}
+
+    def generate(self, source_file, target_file, output_dir, partition, sheet=None) -> dict:
+        delta_file = os.path.join(output_dir, f"{partition}.delta")
+        command = [find_xdelta_executable(), "-e", "-f", "-s", source_file, target_file, delta_file]
+        print(f"[TRACE] Executing: {' '.join(command)}")
+        result, duration, peak_memory_kb = _run_measured(command, output_dir, 3600)
+        if result.returncode != 0 or not os.path.exists(delta_file):
+            raise RuntimeError(f"xdelta3 failed (exit code {result.returncode}): {result.stderr[:200]}")
+        return {"delta_file": delta_file, "delta_size": os.path.getsize(delta_file),
+                "duration": duration, "peak_memory_kb": peak_memory_kb}
+
+    def apply(self, source_file, delta_file, output_file) -> str:
+        result = subprocess.run([find_xdelta_executable(), "-d", "-f", "-s", source_file, delta_file, output_file],
+                                capture_output=True, text=True, timeout=3600)
+        if result.returncode != 0:
+            raise RuntimeError(f"xdelta3 decode failed (exit code {result.returncode}): {result.stderr[:200]}")
+        return output_file
+
+
+class RedbendBackend(DeltaBackend):
+    """Redbend backend. A partition is available when its entry exists in config_<sheet>.xml."""
+
+    name = "redbend"
+    default_throughput = 20e6
+    executable = "vRapidMobileCMD-Linux.exe"
+
+    def _executable_path(self) -> str:
+        return job_workspace.current().input_path(self.executable)
+
+    def _partition_element(self, partition: str, sheet: Optional[str]):
+        config_path = job_workspace.current().path(f"config_{sheet}.xml" if sheet else "config.xml")
+        if not os.path.exists(config_path):
+            return None, None
+        root = ET.parse(config_path).getroot()
+        for element in root.findall('Partition'):
+            if (element.findtext('PartitionName') or '').strip() == partition:
+                return root, element
+        return root, None
+
+    def is_available(self, partition=None, sheet=None) -> bool:
+        if not os.path.exists(self._executable_path()):
+            return False
+        return partition is None or self._partition_element(partition, sheet)[1] is not None
+
+    def generate(self, source_file, target_file, output_dir, partition, sheet=None) -> dict:
+        root, element = self._partition_element(partition, sheet)
+        if element is None:
+            raise RuntimeError(f"Partition {partition} not found in config_{sheet}.xml")
+
+        # Single-partition copy of the sheet config pointing at the given images
+        for other in root.findall('Partition'):
+            if other is not element:
+                root.remove(other)
+        element.find('SourceVersion').text = source_file
+        element.find('TargetVersion').text = target_file
+        delta_name = f"{partition}.mld"
+        root.find('ComponentDeltaFileName').text = delta_name
+        config_path = os.path.join(output_dir, f".config_{partition}.xml")
+        ET.ElementTree(root).write(config_path, encoding="UTF-8", xml_declaration=True)
+
+        command = [self._executable_path(), "gen", f"/configuration_file={config_path}"]
+        print(f"[TRACE] Executing: {' '.join(command)}")
+        try:
+            result, duration, peak_memory_kb = _run_measured(command, output_dir, 3600)
+        finally:
+            os.remove(config_path)
+        delta_file = os.path.join(output_dir, delta_name)
+        if result.returncode != 0 or not os.path.exists(delta_file):
+            raise RuntimeError(f"Redbend generation failed (exit code {result.returncode}): {result.stderr[:200]}")
+        return {"delta_file": delta_file, "delta_size": os.path.getsize(delta_file),
+                "duration": duration, "peak_memory_kb": peak_memory_kb}
+
+    def apply(self, source_file, delta_file, output_file) -> str:
+        # Redbend packages are installed by the update agent on the device
+        raise NotImplementedError("Redbend deltas can only be applied on the device")
+
+
+class FullImageBackend(DeltaBackend):
+    """Ships the target image as is. Always available, size equals the target."""
+
+    name = "full"
+    default_throughput = 500e6
+
+    def is_available(self, partition=None, sheet=None) -> bool:
+        return True
+
+    def estimate(self, source_file, target_file, partition, sheet=None) -> dict:
+        target_size = os.path.getsize(target_file)
+        return {"delta_bytes": target_size, "seconds": target_size / self.default_throughput, "basis": "target size"}
+
+    def generate(self, source_file, target_file, output_dir, partition, sheet=None) -> dict:
+        import time
+
+        delta_file = os.path.join(output_dir, f"{partition}.full.img")
+        started = time.perf_counter()
+        # A reflink costs nothing on CoW filesystems; hardlinks would tie the output to the extraction
+        if _clone_or_link(target_file, delta_file) != "reflink":
+            if os.path.exists(delta_file):
+                os.remove(delta_file)
+            shutil.copyfile(target_file, delta_file)
+        return {"delta_file": delta_file, "delta_size": os.path.getsize(delta_file),
+                "duration": time.perf_counter() - started, "peak_memory_kb": None}
+
+    def apply(self, source_file, delta_file, output_file) -> str:
+        shutil.copyfile(delta_file, output_file)
+        return output_file
+
+
+BACKENDS = {backend.name: backend for backend in (XDeltaBackend(), RedbendBackend(), FullImageBackend())}
+
+
+def select_backend(source_file: str, target_file: str, partition: str, sheet: Optional[str] = None,
+                   candidates: Optional[list] = None) -> dict:
+    """Pick the cheapest available backend for a partition.
+
+    The cost is the expected delta size; encode time breaks ties. Backends
+    without an estimate (no run history) are only used if no other is available.
+
+    Args:
+        source_file: Source partition image
+        target_file: Target partition image
+        partition: Partition name
+        sheet: Partition sheet
+        candidates: Backend names to consider (default: all)
+
+    Returns:
+        Dictionary with the selected backend name, the target size and the per-backend
+        estimates (None for unavailable backends)
+    """
+    target_size = os.path.getsize(target_file)
+    estimates = {}
+    for name in candidates or list(BACKENDS):
+        backend = BACKENDS[name]
+        if backend.is_available(partition, sheet):
+            estimates[name] = backend.estimate(source_file, target_file, partition, sheet)
+        else:
+            estimates[name] = None
+    available = [name for name, estimate in estimates.items() if estimate is not None]
+    if not available:
+        raise RuntimeError(f"No delta backend available for {partition}")
+    estimated = [name for name in available if estimates[name]["delta_bytes"] is not None]
+    selected = min(estimated or available,
+                   key=lambda name: (estimates[name]["delta_bytes"] or 0, estimates[name]["seconds"]))
+    return {"backend": selected, "target_size": target_size, "estimates": estimates}
+
+
+# Sampled delta-size prediction
+FULL_IMAGE_THRESHOLD_ENV = "DELTAGEN_FULL_IMAGE_THRESHOLD"
+DEFAULT_FULL_IMAGE_THRESHOLD = 0.8
+PREDICT_SAMPLES = 8
+PREDICT_WINDOW = 4 * 1024 * 1024
+# Smallest window select_backend samples with; smaller images are encoded outright
+MIN_PREDICT_WINDOW = 64 * 1024
+# Extra source bytes around each sampled window, so data that moved a little is still matched
+PREDICT_MARGIN = 1024 * 1024
+
+
+def full_image_threshold() -> float:
+    """Return the predicted delta / compressed target ratio above which a full image is shipped."""
+    try:
+        return float(os.environ.get(FULL_IMAGE_THRESHOLD_ENV, DEFAULT_FULL_IMAGE_THRESHOLD))
+    except ValueError:
+        return DEFAULT_FULL_IMAGE_THRESHOLD
+
+
+def predict_delta(source_file: str, target_file: str, backend: str = "xdelta", samples: int = PREDICT_SAMPLES,
+                  window: int = PREDICT_WINDOW, margin: int = PREDICT_MARGIN) -> Optional[dict]:
+    """Predict the delta size and encode time of an image pair from sampled windows.
+
+    The backend encodes evenly spaced target windows against the matching
+    source window (widened by margin); the sampled delta sizes and times are
+    extrapolated to the whole image. The compressed target size is
+    extrapolated from zlib-compressing the same windows. Data that moved
+    further than the margin looks new, so the prediction errs on the large side.
+
+    Args:
+        source_file: Source partition image
+        target_file: Target partition image
+        backend: Backend used for the sample encodes
+        samples: Number of sampled windows
+        window: Size of each target window in bytes
+        margin: Source bytes added on each side of a window
+
+    Returns:
+        Dictionary with predicted_delta_bytes, predicted_seconds, compressed_target_bytes and
+        ratio (predicted delta / compressed target), or None when the image is too small for
+        sampling to be cheaper than encoding it
+    """
+    import time
+    import zlib
+
+    target_size = os.path.getsize(target_file)
+    source_size = os.path.getsize(source_file)
+    if target_size < samples * window * 2:
+        return None
+
+    started = time.perf_counter()
+    last_offset = target_size - window
+    offsets = [(last_offset * index // (samples - 1)) // 4096 * 4096 if samples > 1 else 0 for index in range(samples)]
+    delta_bytes = 0
+    compressed_bytes = 0
+    encode_seconds = 0.0
+    with tempfile.TemporaryDirectory(prefix="delta_predict_") as work_dir, \
+            open(source_file, 'rb') as source, open(target_file, 'rb') as target:
+        for index, offset in enumerate(offsets):
+            target.seek(offset)
+            target_window = target.read(window)
+            source_start = max(0, offset - margin)
+            source.seek(source_start)
+            source_window = source.read(min(window + 2 * margin, max(0, source_size - source_start)))
+
+            sample_target = os.path.join(work_dir, f"sample{index}.target")
+            sample_source = os.path.join(work_dir, f"sample{index}.source")
+            with open(sample_target, 'wb') as f:
+                f.write(target_window)
+            with open(sample_source, 'wb') as f:
+                f.write(source_window)
+
+            compressed_bytes += len(zlib.compress(target_window, 6))
+            generated = BACKENDS[backend].generate(sample_source, sample_target, work_dir, f"sample{index}")
+            delta_bytes += generated["delta_size"]
+            encode_seconds += generated["duration"]
+            os.remove(generated["delta_file"])
+
+    scale = target_size / (samples * window)
+    return {
+        "predicted_delta_bytes": int(delta_bytes * scale),
+        "predicted_seconds": encode_seconds * scale,
+        "compressed_target_bytes": int(compressed_bytes * scale),
+        "ratio": delta_bytes / compressed_bytes if compressed_bytes else 1.0,
+        "sampled_bytes": samples * window,
+        "prediction_seconds": time.perf_counter() - started,
+    }
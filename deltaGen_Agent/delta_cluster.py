@@ -0,0 +1,781 @@
+"""Coordinator/worker mode for distributing partition deltas over several hosts.
+
+A coordinator splits generate_xdelta runs into one job per partition and
+generate_delta runs into one job per config file. Workers register, lease
+jobs, run them with the Utils tools and report results and metrics back.
+Leases are kept alive by worker heartbeats; when a worker stops sending them
+(process or host died) its jobs are queued again, up to max_attempts.
+
+Workers get their inputs in one of two ways:
+    shared  the source/target paths and the output directory are on storage
+            mounted at the same path on every host (NFS, CIFS, ...)
+    stream  the worker downloads the partition images from the coordinator
+            and uploads the generated files back (generate_xdelta jobs only;
+            Redbend configs reference absolute image paths). The worker's
+            artifact manifest is not uploaded: its records are sent with the
+            result, mapped to the coordinator's paths, and merged into the
+            manifest of the output directory
+
+Access control:
+    - Every request carries the shared token (DELTAGEN_CLUSTER_TOKEN) as
+      "Authorization: Bearer <token>". A coordinator started without one
+      generates a token and prints it.
+    - The coordinator binds 127.0.0.1 unless --host says otherwise.
+    - Batches may only read images under the coordinator's --input-root
+      directories and write under its --output-root directories (both
+      default to its working directory).
+    - Inputs and uploads of a job are only served to the worker holding the
+      job's live lease (X-Worker-Id / X-Lease-Id headers).
+    - Workers resolve the Redbend executable and other shared inputs in their
+      own --shared-root, never in a path sent by the coordinator.
+
+Everything runs on one Linux box too, with local worker processes standing
+in for remote nodes:
+
+    export DELTAGEN_CLUSTER_TOKEN=...
+    python -m deltaGen_Agent.delta_cluster coordinator --port 8770 --input-root /data/builds --output-root /data/deltas
+    python -m deltaGen_Agent.delta_cluster worker --coordinator http://127.0.0.1:8770 --input-mode stream
+    python -m deltaGen_Agent.delta_cluster submit --coordinator http://127.0.0.1:8770 \\
+        --tool generate_xdelta --args '{"partition_files": "system,vendor", ...}'
+
+Endpoints:
+    POST /workers                      Register {"name": ...} -> worker id and lease time
+    POST /workers/<id>/heartbeat       Extend the leases of the worker's jobs
+    POST /lease                        Lease the next job {"worker_id": ...}
+    POST /jobs/<id>/result             Report {"worker_id", "lease_id", "status", "result", "metrics", "artifacts"}
+    GET  /jobs/<id>/inputs/<role>      Stream the source or target image of a leased job
+    PUT  /jobs/<id>/outputs/<name>     Upload a generated file of a leased job
+    POST /batches                      Submit {"tool": ..., "args": {...}}
+    GET  /batches/<id>                 Batch status with per-job results
+    GET  /status                       Workers and job counts
+"""
+import collections
+import hmac
+import inspect
+import json
+import os
+import re
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from . import artifact_hashing, job_workspace
+
+
+CLUSTER_TOOLS = ("generate_xdelta", "generate_delta")
+CLUSTER_TOKEN_ENV = "DELTAGEN_CLUSTER_TOKEN"
+DEFAULT_LEASE_SECONDS = 30
+DEFAULT_MAX_ATTEMPTS = 3
+
+_STREAM_CHUNK = 4 * 1024 * 1024
+
+
+def _is_simple_name(name) -> bool:
+    """Check that a partition, sheet or config name cannot leave its directory."""
+    return isinstance(name, str) and re.fullmatch(r"[0-9A-Za-z._-]+", name) is not None and name not in (".", "..")
+
+
+def _tool_arguments(tool: str) -> set:
+    # Arguments a batch may set: the tool's parameters, except the workspace the worker chooses
+    from . import Utils
+
+    return set(inspect.signature(getattr(Utils, tool)).parameters) - {"workspace", "tool_context"}
+
+
+class DeltaCoordinator:
+    """Job table, leases and worker registry of the coordinator."""
+
+    def __init__(self, lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 input_roots: Optional[list] = None, output_roots: Optional[list] = None):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Batches only read images under input_roots and only write under output_roots
+        self.input_roots = [os.path.realpath(root) for root in input_roots or [os.getcwd()]]
+        self.output_roots = [os.path.realpath(root) for root in output_roots or [os.getcwd()]]
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.batches = {}
+        self.workers = {}
+        self.pending = collections.deque()
+        self.started = time.time()
+        self.reaper = threading.Thread(target=self._reap_loop, name="lease-reaper", daemon=True)
+        self.reaper.start()
+
+    def register(self, name: str, info: Optional[dict] = None) -> dict:
+        worker = {"id": uuid.uuid4().hex[:12], "name": name, "info": info or {}, "status": "active",
+                  "registered": time.time(), "last_seen": time.time(), "jobs_done": 0, "jobs_lost": 0}
+        with self.lock:
+            self.workers[worker["id"]] = worker
+        print(f"[TRACE] Worker registered: {name} ({worker['id']})")
+        return {"worker_id": worker["id"], "lease_seconds": self.lease_seconds}
+
+    def heartbeat(self, worker_id: str) -> bool:
+        now = time.time()
+        with self.lock:
+            worker = self.workers.get(worker_id)
+            if worker is None or worker["status"] == "lost":
+                return False
+            worker["last_seen"] = now
+            for job in self.jobs.values():
+                if job["status"] == "leased" and job["worker"] == worker_id:
+                    job["lease_expires"] = now + self.lease_seconds
+        return True
+
+    @staticmethod
+    def _within(path, roots: list, what: str) -> str:
+        """Return the real path of a batch path, or raise ValueError if it is outside the allowed roots."""
+        if not isinstance(path, str) or not path:
+            raise ValueError(f"Invalid {what}: {path!r}")
+        real = os.path.realpath(path)
+        if not any(real == root or real.startswith(root + os.sep) for root in roots):
+            raise ValueError(f"{what} {path} is outside the directories allowed on this coordinator")
+        return real
+
+    def submit_batch(self, tool: str, args: dict) -> dict:
+        """Split a tool run into per-partition (or per-config) jobs and queue them."""
+        if tool not in CLUSTER_TOOLS:
+            raise ValueError(f"Unknown tool '{tool}'. Available tools: {', '.join(CLUSTER_TOOLS)}")
+        if not isinstance(args, dict):
+            raise ValueError("Batch args must be a JSON object")
+
+        if tool == "generate_xdelta":
+            missing = [key for key in ("partition_files", "source_path", "target_path", "partition_sheet") if key not in args]
+            if missing:
+                raise ValueError(f"Missing argument(s): {', '.join(missing)}")
+            unknown = set(args) - _tool_arguments(tool)
+            if unknown:
+                raise ValueError(f"Unsupported argument(s): {', '.join(sorted(unknown))}")
+            if not _is_simple_name(args["partition_sheet"]):
+                raise ValueError(f"Invalid partition_sheet: {args['partition_sheet']!r}")
+            args = dict(args,
+                        source_path=self._within(args["source_path"], self.input_roots, "source_path"),
+                        target_path=self._within(args["target_path"], self.input_roots, "target_path"),
+                        output_path=self._within(args.get("output_path") or os.path.join(self.output_roots[0], "delta_output"),
+                                                 self.output_roots, "output_path"))
+            items = [p.strip() for p in args["partition_files"].split(',') if p.strip()]
+            job_args = [dict(args, partition_files=item) for item in items]
+        else:
+            if "config_file_names" not in args:
+                raise ValueError("Missing argument(s): config_file_names")
+            # Configs are read from (and outputs written to) the job root; each worker
+            # resolves the Redbend executable in its own shared root
+            args = dict(args)
+            root = self._within(args.pop("workspace", None) or self.output_roots[0], self.output_roots, "workspace")
+            unknown = set(args) - _tool_arguments(tool)
+            if unknown:
+                raise ValueError(f"Unsupported argument(s): {', '.join(sorted(unknown))}")
+            items = [c.strip() for c in args["config_file_names"].split(',') if c.strip()]
+            job_args = [dict(args, config_file_names=item, workspace=root) for item in items]
+
+        invalid = [item for item in items if not _is_simple_name(item)]
+        if invalid or not items:
+            raise ValueError(f"Invalid item name(s): {', '.join(invalid) or '(none)'}")
+
+        batch = {"id": uuid.uuid4().hex[:12], "tool": tool, "submitted": time.time(), "jobs": []}
+        with self.lock:
+            for item, item_args in zip(items, job_args):
+                job = {"id": uuid.uuid4().hex[:12], "batch": batch["id"], "tool": tool, "item": item,
+                       "args": item_args, "status": "queued", "attempts": 0, "worker": None, "lease_id": None,
+                       "lease_expires": None, "result": None, "metrics": None, "history": []}
+                self.jobs[job["id"]] = job
+                self.pending.append(job["id"])
+                batch["jobs"].append(job["id"])
+            self.batches[batch["id"]] = batch
+        print(f"[TRACE] Batch {batch['id']} queued: {tool}, {len(items)} job(s)")
+        return self.batch_status(batch["id"])
+
+    def lease(self, worker_id: str) -> dict:
+        with self.lock:
+            worker = self.workers.get(worker_id)
+            if worker is None or worker["status"] == "lost":
+                return {"job": None, "reregister": True}
+            worker["last_seen"] = time.time()
+            if not self.pending:
+                active = any(job["status"] in ("queued", "leased") for job in self.jobs.values())
+                return {"job": None, "idle": not active}
+            job = self.jobs[self.pending.popleft()]
+            # Each lease gets its own id, so a requeued job's retry is told apart from the lost attempt
+            job.update(status="leased", worker=worker_id, lease_id=uuid.uuid4().hex, attempts=job["attempts"] + 1,
+                       lease_expires=time.time() + self.lease_seconds)
+            job["history"].append({"worker": worker_id, "leased": time.time()})
+            print(f"[TRACE] Job {job['id']} ({job['item']}) leased to {worker['name']}, attempt {job['attempts']}")
+            return {"job": {key: job[key] for key in ("id", "tool", "item", "args", "attempts", "lease_id")}}
+
+    def _holds_lease(self, job: Optional[dict], worker_id: Optional[str], lease_id: Optional[str]) -> bool:
+        # Callers hold self.lock
+        return (job is not None and job["status"] == "leased" and bool(worker_id) and bool(lease_id)
+                and job["worker"] == worker_id and hmac.compare_digest(job["lease_id"].encode(), str(lease_id).encode()))
+
+    def holds_lease(self, job_id: str, worker_id: Optional[str], lease_id: Optional[str]) -> bool:
+        """Check that a worker holds the live lease of a job."""
+        with self.lock:
+            return self._holds_lease(self.jobs.get(job_id), worker_id, lease_id)
+
+    def complete(self, worker_id: str, job_id: str, status: str, result, metrics: Optional[dict],
+                 lease_id: Optional[str] = None, artifacts: Optional[list] = None) -> bool:
+        """Store a job result. Results of leases that were already given up are ignored.
+
+        Hash records of a streamed job (artifacts) are merged into the manifest of its output directory.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not self._holds_lease(job, worker_id, lease_id):
+                print(f"[TRACE] Ignoring stale result for job {job_id} from {worker_id}")
+                return False
+            job.update(status="done" if status == "success" else "failed", result=result, metrics=metrics,
+                       lease_id=None, lease_expires=None)
+            job["history"][-1].update(finished=time.time(), status=status)
+            worker = self.workers.get(worker_id)
+            if worker:
+                worker["jobs_done"] += 1
+                worker["last_seen"] = time.time()
+        print(f"[TRACE] Job {job_id} ({job['item']}) {job['status']}")
+        if artifacts and job["tool"] == "generate_xdelta":
+            self._merge_artifacts(job, artifacts)
+        return True
+
+    @staticmethod
+    def _merge_artifacts(job: dict, artifacts: list) -> None:
+        # Only records of the job's own inputs and of files in its output directory are taken
+        args = job["args"]
+        output_dir = args["output_path"]
+        inputs = {os.path.join(args[f"{role}_path"], args["partition_sheet"], f"{job['item']}.img")
+                  for role in ("source", "target")}
+        records = [record for record in artifacts
+                   if isinstance(record, dict) and isinstance(record.get("path"), str)
+                   and isinstance(record.get("sha256"), str)
+                   and (record["path"] in inputs or os.path.dirname(record["path"]) == output_dir)]
+        if records:
+            os.makedirs(output_dir, exist_ok=True)
+            artifact_hashing.update_manifest(output_dir, records, job["tool"])
+            print(f"[TRACE] Merged {len(records)} hash record(s) of job {job['id']} into the artifact manifest")
+
+    def input_path(self, job_id: str, role: str, worker_id: Optional[str] = None,
+                   lease_id: Optional[str] = None) -> Optional[str]:
+        """Return the image a leased job streams, or None for another worker, lease or role."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not self._holds_lease(job, worker_id, lease_id):
+                return None
+        if job["tool"] != "generate_xdelta" or role not in ("source", "target"):
+            return None
+        args = job["args"]
+        path = os.path.join(args[f"{role}_path"], args["partition_sheet"], f"{job['item']}.img")
+        try:
+            return self._within(path, self.input_roots, "input")
+        except ValueError:
+            return None
+
+    def output_dir(self, job_id: str, worker_id: Optional[str] = None, lease_id: Optional[str] = None) -> Optional[str]:
+        """Return the output directory of a leased job, or None unless the caller holds its live lease."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not self._holds_lease(job, worker_id, lease_id):
+                return None
+        return job["args"].get("output_path") if job["tool"] == "generate_xdelta" else None
+
+    def batch_status(self, batch_id: str) -> Optional[dict]:
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            jobs = [dict(self.jobs[job_id], history=list(self.jobs[job_id]["history"])) for job_id in batch["jobs"]]
+        counts = collections.Counter(job["status"] for job in jobs)
+        return {"id": batch_id, "tool": batch["tool"], "finished": counts["queued"] + counts["leased"] == 0,
+                "counts": dict(counts), "jobs": jobs}
+
+    def status(self) -> dict:
+        with self.lock:
+            counts = collections.Counter(job["status"] for job in self.jobs.values())
+            workers = [dict(worker) for worker in self.workers.values()]
+        return {"uptime": time.time() - self.started, "jobs": dict(counts), "workers": workers}
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(0.2, self.lease_seconds / 4))
+            self._reap()
+
+    def _reap(self):
+        """Requeue jobs whose lease expired and mark their workers as lost."""
+        now = time.time()
+        with self.lock:
+            for job in self.jobs.values():
+                if job["status"] != "leased" or job["lease_expires"] > now:
+                    continue
+                worker = self.workers.get(job["worker"])
+                if worker and worker["status"] != "lost":
+                    worker["status"] = "lost"
+                    print(f"[TRACE] Worker {worker['name']} ({worker['id']}) lost: no heartbeat")
+                if worker:
+                    worker["jobs_lost"] += 1
+                job["history"][-1].update(finished=now, status="lease_expired")
+                if job["attempts"] >= self.max_attempts:
+                    job.update(status="failed", lease_id=None, lease_expires=None,
+                               result={"status": "error", "code": "max_attempts",
+                                       "detail": f"Lease expired {job['attempts']} time(s)"})
+                    print(f"[TRACE] Job {job['id']} ({job['item']}) failed after {job['attempts']} attempt(s)")
+                else:
+                    job.update(status="queued", worker=None, lease_id=None, lease_expires=None)
+                    self.pending.appendleft(job["id"])
+                    print(f"[TRACE] Job {job['id']} ({job['item']}) requeued")
+
+
+def _make_handler(coordinator: DeltaCoordinator, token: str):
+    """Build the HTTP request handler bound to a coordinator."""
+    expected = f"Bearer {token}".encode()
+
+    class CoordinatorHandler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+            print(f"[TRACE] HTTP {self.address_string()} {format % args}")
+
+        def _authorized(self) -> bool:
+            if hmac.compare_digest(self.headers.get("Authorization", "").encode(), expected):
+                return True
+            self._reject(401, {"error": "Missing or invalid cluster token"})
+            return False
+
+        def _reject(self, status: int, payload):
+            # Read the unused request body first, so the client gets the answer instead of a reset
+            remaining = int(self.headers.get("Content-Length", 0) or 0)
+            while remaining > 0:
+                chunk = self.rfile.read(min(_STREAM_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+            self._send(status, payload)
+
+        def _lease(self) -> tuple:
+            return self.headers.get("X-Worker-Id"), self.headers.get("X-Lease-Id")
+
+        def _send(self, status: int, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _parts(self) -> list:
+            return [p for p in self.path.split('?')[0].split('/') if p]
+
+        def _body(self) -> dict:
+            length = int(self.headers.get("Content-Length", 0))
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if not self._authorized():
+                return
+            parts = self._parts()
+            if parts == ["status"]:
+                self._send(200, coordinator.status())
+            elif len(parts) == 2 and parts[0] == "batches":
+                batch = coordinator.batch_status(parts[1])
+                self._send(200, batch) if batch else self._send(404, {"error": f"Batch not found: {parts[1]}"})
+            elif len(parts) == 4 and parts[0] == "jobs" and parts[2] == "inputs":
+                path = coordinator.input_path(parts[1], parts[3], *self._lease())
+                if not path or not os.path.isfile(path):
+                    self._send(404, {"error": f"Input not found: {self.path}"})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(os.path.getsize(path)))
+                self.end_headers()
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile, _STREAM_CHUNK)
+            else:
+                self._send(404, {"error": f"Unknown endpoint: {self.path}"})
+
+        def do_POST(self):
+            if not self._authorized():
+                return
+            parts = self._parts()
+            try:
+                body = self._body()
+                if parts == ["workers"]:
+                    self._send(200, coordinator.register(body.get("name", "worker"), body.get("info")))
+                elif len(parts) == 3 and parts[0] == "workers" and parts[2] == "heartbeat":
+                    self._send(200, {"ok": coordinator.heartbeat(parts[1])})
+                elif parts == ["lease"]:
+                    self._send(200, coordinator.lease(body.get("worker_id")))
+                elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+                    accepted = coordinator.complete(body.get("worker_id"), parts[1], body.get("status"),
+                                                    body.get("result"), body.get("metrics"), body.get("lease_id"),
+                                                    body.get("artifacts"))
+                    self._send(200, {"accepted": accepted})
+                elif parts == ["batches"]:
+                    self._send(202, coordinator.submit_batch(body.get("tool"), body.get("args", {})))
+                else:
+                    self._send(404, {"error": f"Unknown endpoint: {self.path}"})
+            except (ValueError, json.JSONDecodeError) as e:
+                self._send(400, {"error": str(e)})
+
+        def do_PUT(self):
+            if not self._authorized():
+                return
+            parts = self._parts()
+            if not (len(parts) == 4 and parts[0] == "jobs" and parts[2] == "outputs"):
+                self._reject(404, {"error": f"Unknown endpoint: {self.path}"})
+                return
+            # Only the worker holding the live lease may write; a requeued job's lost attempt may not
+            output_dir = coordinator.output_dir(parts[1], *self._lease())
+            name = parts[3]
+            if not output_dir:
+                self._reject(409, {"error": f"No live lease on job {parts[1]} for this worker"})
+                return
+            if not _is_simple_name(name) or name.startswith('.') or name == artifact_hashing.MANIFEST_FILENAME:
+                # The manifest is merged from the job result, never replaced by an upload
+                self._reject(400, {"error": f"Invalid output name: {name}"})
+                return
+            os.makedirs(output_dir, exist_ok=True)
+            remaining = int(self.headers.get("Content-Length", 0))
+            partial = os.path.join(output_dir, f".{name}.upload")
+            with open(partial, 'wb') as f:
+                while remaining > 0:
+                    chunk = self.rfile.read(min(_STREAM_CHUNK, remaining))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            if remaining:
+                os.remove(partial)
+                self._send(400, {"error": "Upload incomplete"})
+                return
+            if not coordinator.holds_lease(parts[1], *self._lease()):
+                os.remove(partial)
+                self._send(409, {"error": f"Lease on job {parts[1]} expired during the upload"})
+                return
+            os.replace(partial, os.path.join(output_dir, name))
+            self._send(201, {"stored": os.path.join(output_dir, name)})
+
+    return CoordinatorHandler
+
+
+def serve_coordinator(host: str = "127.0.0.1", port: int = 8770, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                      max_attempts: int = DEFAULT_MAX_ATTEMPTS, input_roots: Optional[list] = None,
+                      output_roots: Optional[list] = None, token: Optional[str] = None):
+    """Start the coordinator and block serving requests.
+
+    Args:
+        host: Address to bind (use a routable address only on a trusted network)
+        port: TCP port
+        lease_seconds: Lease time renewed by worker heartbeats
+        max_attempts: Leases per job before it fails
+        input_roots: Directories batches may read images from (default: working directory)
+        output_roots: Directories batches may write deltas to (default: working directory)
+        token: Shared token (default: DELTAGEN_CLUSTER_TOKEN, else a generated one that is printed)
+    """
+    token = token or os.environ.get(CLUSTER_TOKEN_ENV)
+    if not token:
+        token = secrets.token_urlsafe(24)
+        print(f"[TRACE] No {CLUSTER_TOKEN_ENV} set, generated cluster token: {token}")
+    coordinator = DeltaCoordinator(lease_seconds, max_attempts, input_roots, output_roots)
+    httpd = ThreadingHTTPServer((host, port), _make_handler(coordinator, token))
+    print(f"[TRACE] Delta coordinator listening on http://{host}:{port} "
+          f"(inputs: {', '.join(coordinator.input_roots)}; outputs: {', '.join(coordinator.output_roots)})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+# ---------------------------------------------------------------------------
+# Client side (workers and submitters)
+# ---------------------------------------------------------------------------
+
+def _headers(lease: Optional[tuple] = None, **extra) -> dict:
+    """Request headers: the cluster token and, for job files, the caller's lease."""
+    headers = dict(extra, Authorization=f"Bearer {os.environ.get(CLUSTER_TOKEN_ENV, '')}")
+    if lease:
+        headers["X-Worker-Id"], headers["X-Lease-Id"] = lease
+    return headers
+
+
+def _request(url: str, payload: Optional[dict] = None, method: str = "POST", timeout: float = 60) -> dict:
+    data = json.dumps(payload or {}).encode() if method == "POST" else None
+    request = urllib.request.Request(url, data=data, method=method, headers=_headers(**{"Content-Type": "application/json"}))
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _download(url: str, path: str, lease: tuple) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    request = urllib.request.Request(url, headers=_headers(lease))
+    with urllib.request.urlopen(request, timeout=600) as response, open(path, 'wb') as f:
+        shutil.copyfileobj(response, f, _STREAM_CHUNK)
+
+
+def _upload(url: str, path: str, lease: tuple) -> None:
+    with open(path, 'rb') as f:
+        request = urllib.request.Request(url, data=f, method="PUT",
+                                         headers=_headers(lease, **{"Content-Length": str(os.path.getsize(path)),
+                                                                    "Content-Type": "application/octet-stream"}))
+        with urllib.request.urlopen(request, timeout=600) as response:
+            response.read()
+
+
+def _succeeded(result) -> bool:
+    # Workers run the tools in structured result mode
+    return isinstance(result, dict) and result.get("status") == "ok" and not result.get("failed")
+
+
+def _coordinator_records(job_dir: str, job_args: dict) -> list:
+    """Read a streamed job's local manifest, with worker paths mapped to the coordinator's paths."""
+    try:
+        with open(os.path.join(job_dir, "output", artifact_hashing.MANIFEST_FILENAME)) as f:
+            artifacts = json.load(f)["artifacts"]
+    except (OSError, ValueError, KeyError):
+        return []
+    roots = {os.path.join(job_dir, "output"): job_args["output_path"],
+             os.path.join(job_dir, "source"): job_args["source_path"],
+             os.path.join(job_dir, "target"): job_args["target_path"]}
+    records = []
+    for path, entry in artifacts.items():
+        for local_root, coordinator_root in roots.items():
+            if path.startswith(local_root + os.sep):
+                records.append(dict(entry, path=os.path.join(coordinator_root, os.path.relpath(path, local_root))))
+                break
+    return records
+
+
+def _run_job(coordinator_url: str, job: dict, input_mode: str, work_dir: str, lease: tuple,
+             shared_root: Optional[str] = None) -> tuple:
+    """Run one leased job. Returns (status, result, metrics, artifacts)."""
+    import resource
+    from . import Utils
+
+    args = dict(job["args"])
+    started = time.monotonic()
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    outputs = []
+    artifacts = None
+
+    if job["tool"] == "generate_delta":
+        # Configs come from the submitter's job root; the Redbend executable from this worker's shared root
+        workspace = job_workspace.Workspace(args.pop("workspace"), shared_root or os.getcwd())
+        with job_workspace.use(workspace):
+            result = Utils.generate_delta(**args)
+    elif input_mode == "stream":
+        job_dir = os.path.abspath(tempfile.mkdtemp(prefix=f"job_{job['id']}_", dir=work_dir))
+        try:
+            sheet, partition = args["partition_sheet"], job["item"]
+            for role in ("source", "target"):
+                local_path = os.path.join(job_dir, role, sheet, f"{partition}.img")
+                _download(f"{coordinator_url}/jobs/{job['id']}/inputs/{role}", local_path, lease)
+                args[f"{role}_path"] = os.path.join(job_dir, role)
+            args["output_path"] = os.path.join(job_dir, "output")
+            result = Utils.generate_xdelta(**args)
+            for name in sorted(os.listdir(args["output_path"])):
+                path = os.path.join(args["output_path"], name)
+                if os.path.isfile(path) and not name.startswith('.') and name != artifact_hashing.MANIFEST_FILENAME:
+                    _upload(f"{coordinator_url}/jobs/{job['id']}/outputs/{name}", path, lease)
+                    outputs.append(name)
+            artifacts = _coordinator_records(job_dir, job["args"])
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+    else:
+        result = Utils.generate_xdelta(**args)
+
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    metrics = {
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "seconds": round(time.monotonic() - started, 3),
+        "child_cpu_seconds": round((children.ru_utime + children.ru_stime)
+                                   - (children_before.ru_utime + children_before.ru_stime), 3),
+        # ru_maxrss of RUSAGE_CHILDREN is the largest child since the worker started, not this job's
+        "cumulative_peak_child_memory_kb": children.ru_maxrss,
+        "input_mode": input_mode,
+        "uploaded": outputs,
+    }
+    return ("success" if _succeeded(result) else "failed"), result, metrics, artifacts
+
+
+def run_worker(coordinator_url: str, name: Optional[str] = None, input_mode: str = "shared",
+               work_dir: Optional[str] = None, poll_seconds: float = 2, exit_when_idle: bool = False,
+               shared_root: Optional[str] = None) -> int:
+    """Register with a coordinator and process jobs until stopped.
+
+    Args:
+        coordinator_url: Base URL of the coordinator (http://host:port)
+        name: Worker name shown by the coordinator (default: host:pid)
+        input_mode: "shared" (same paths on every host) or "stream" (download inputs, upload outputs)
+        work_dir: Local directory for streamed inputs (default: system temp directory)
+        shared_root: Directory holding the Redbend executable and other shared inputs
+            (default: working directory)
+        poll_seconds: Wait between lease attempts when no job is queued
+        exit_when_idle: Exit once the coordinator has no queued or running jobs left
+
+    Returns:
+        Number of jobs processed
+    """
+    os.environ["DELTAGEN_RESULT_MODE"] = "structured"
+    coordinator_url = coordinator_url.rstrip('/')
+    shared_root = os.path.abspath(shared_root or os.getcwd())
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    work_dir = work_dir or tempfile.gettempdir()
+    processed = 0
+
+    def register() -> dict:
+        return _request(f"{coordinator_url}/workers", {"name": name, "info": {"input_mode": input_mode, "pid": os.getpid()}})
+
+    registration = register()
+    worker_id = registration["worker_id"]
+    stop_heartbeat = threading.Event()
+
+    def heartbeat_loop():
+        while not stop_heartbeat.wait(registration["lease_seconds"] / 3):
+            try:
+                _request(f"{coordinator_url}/workers/{worker_id}/heartbeat")
+            except (urllib.error.URLError, OSError) as e:
+                print(f"[TRACE] Heartbeat failed: {e}")
+
+    threading.Thread(target=heartbeat_loop, name="heartbeat", daemon=True).start()
+    print(f"[TRACE] Worker {name} registered as {worker_id} ({input_mode} inputs)")
+
+    try:
+        while True:
+            try:
+                lease = _request(f"{coordinator_url}/lease", {"worker_id": worker_id})
+            except (urllib.error.URLError, OSError) as e:
+                print(f"[TRACE] Coordinator unreachable: {e}")
+                time.sleep(poll_seconds)
+                continue
+
+            if lease.get("reregister"):
+                registration = register()
+                worker_id = registration["worker_id"]
+                continue
+            job = lease.get("job")
+            if job is None:
+                if exit_when_idle and lease.get("idle"):
+                    return processed
+                time.sleep(poll_seconds)
+                continue
+
+            print(f"[TRACE] Worker {name}: running {job['tool']} {job['item']} (attempt {job['attempts']})")
+            lease = (worker_id, job["lease_id"])
+            try:
+                status, result, metrics, artifacts = _run_job(coordinator_url, job, input_mode, work_dir, lease,
+                                                              shared_root)
+            except Exception as e:
+                status, result, metrics, artifacts = "failed", {"status": "error", "code": "exception",
+                                                                "detail": str(e)}, None, None
+            report = {"worker_id": worker_id, "lease_id": job["lease_id"], "status": status, "result": result,
+                      "metrics": metrics, "artifacts": artifacts}
+            # Keep the result through a coordinator outage; once the lease expired the coordinator ignores it
+            while True:
+                try:
+                    if not _request(f"{coordinator_url}/jobs/{job['id']}/result", report).get("accepted"):
+                        print(f"[TRACE] Result of job {job['id']} was not accepted (lease given up)")
+                    break
+                except urllib.error.HTTPError as e:
+                    if e.code < 500:
+                        print(f"[TRACE] Result of job {job['id']} rejected: {e}")
+                        break
+                    print(f"[TRACE] Reporting job {job['id']} failed: {e}")
+                except (urllib.error.URLError, OSError) as e:
+                    print(f"[TRACE] Reporting job {job['id']} failed: {e}")
+                time.sleep(poll_seconds)
+            processed += 1
+    finally:
+        stop_heartbeat.set()
+
+
+def start_local_workers(coordinator_url: str, count: int, input_mode: str = "shared",
+                        exit_when_idle: bool = True, cwd: Optional[str] = None) -> list:
+    """Start worker processes on this host, standing in for remote nodes.
+
+    Returns:
+        List of subprocess.Popen objects
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get("PYTHONPATH")])))
+    command = [sys.executable, "-m", "deltaGen_Agent.delta_cluster", "worker",
+               "--coordinator", coordinator_url, "--input-mode", input_mode]
+    if exit_when_idle:
+        command.append("--exit-when-idle")
+    return [subprocess.Popen(command + ["--name", f"local-{index}"], cwd=cwd or os.getcwd(), env=env)
+            for index in range(count)]
+
+
+def submit_batch(coordinator_url: str, tool: str, args: dict) -> dict:
+    """Submit a generate_xdelta or generate_delta run to a coordinator."""
+    return _request(f"{coordinator_url.rstrip('/')}/batches", {"tool": tool, "args": args})
+
+
+def wait_for_batch(coordinator_url: str, batch_id: str, timeout: float = 24 * 3600, poll_seconds: float = 2) -> dict:
+    """Poll a batch until all of its jobs are done or failed (or the timeout passes)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        batch = _request(f"{coordinator_url.rstrip('/')}/batches/{batch_id}", method="GET")
+        if batch["finished"] or time.monotonic() > deadline:
+            return batch
+        time.sleep(poll_seconds)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Distributed delta generation")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    coordinator_parser = commands.add_parser("coordinator", help="Run the coordinator")
+    parser.add_argument("--token", default=None, help=f"Shared cluster token (default: ${CLUSTER_TOKEN_ENV})")
+    coordinator_parser.add_argument("--host", default="127.0.0.1")
+    coordinator_parser.add_argument("--port", type=int, default=8770)
+    coordinator_parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS)
+    coordinator_parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    coordinator_parser.add_argument("--input-root", action="append", default=None,
+                                    help="Directory batches may read images from (repeatable; default: working directory)")
+    coordinator_parser.add_argument("--output-root", action="append", default=None,
+                                    help="Directory batches may write deltas to (repeatable; default: working directory)")
+
+    worker_parser = commands.add_parser("worker", help="Run a worker")
+    worker_parser.add_argument("--coordinator", required=True)
+    worker_parser.add_argument("--name", default=None)
+    worker_parser.add_argument("--input-mode", choices=("shared", "stream"), default="shared")
+    worker_parser.add_argument("--work-dir", default=None)
+    worker_parser.add_argument("--exit-when-idle", action="store_true")
+    worker_parser.add_argument("--shared-root", default=None,
+                               help="Directory with the Redbend executable and shared inputs (default: working directory)")
+
+    submit_parser = commands.add_parser("submit", help="Submit a batch and wait for it")
+    submit_parser.add_argument("--coordinator", required=True)
+    submit_parser.add_argument("--tool", choices=CLUSTER_TOOLS, required=True)
+    submit_parser.add_argument("--args", required=True, help="Tool arguments as a JSON object")
+    submit_parser.add_argument("--local-workers", type=int, default=0,
+                               help="Also start this many local worker processes")
+    submit_parser.add_argument("--input-mode", choices=("shared", "stream"), default="shared")
+
+    options = parser.parse_args()
+    if options.token:
+        # Also inherited by local worker processes
+        os.environ[CLUSTER_TOKEN_ENV] = options.token
+    if options.command == "coordinator":
+        serve_coordinator(options.host, options.port, options.lease_seconds, options.max_attempts,
+                          options.input_root, options.output_root)
+    elif options.command == "worker":
+        run_worker(options.coordinator, options.name, options.input_mode, options.work_dir,
+                   exit_when_idle=options.exit_when_idle, shared_root=options.shared_root)
+    else:
+        batch = submit_batch(options.coordinator, options.tool, json.loads(options.args))
+        workers = start_local_workers(options.coordinator, options.local_workers, options.input_mode)
+        batch = wait_for_batch(options.coordinator, batch["id"])
+        for worker in workers:
+            worker.wait()
+        print(json.dumps({"counts": batch["counts"],
+                          "jobs": [{key: job[key] for key in ("item", "status", "attempts", "metrics")} for job in batch["jobs"]]},
+                         indent=2, default=str))
@@ -0,0 +1,198 @@
+"""Overlapped extraction and delta generation.
+
+Instead of extracting both archives completely before the first delta is
+encoded, extractor threads pull partition images out of the source and target
+zips pair by pair and hand each (sheet, partition) pair to delta workers as
+soon as both images are on disk. The images of a partition are deleted once
+its delta is written.
+
+The pipeline depth (pairs extracted but not yet finished) is bounded: an
+extractor must take a slot before extracting a pair and the slot is released
+when the pair's delta is done. Peak disk use is therefore about max_pending
+partition pairs plus the deltas, independent of the archive size.
+"""
+import contextvars
+import os
+import queue
+import shutil
+import threading
+import time
+import zipfile
+from typing import Optional
+
+from . import Utils
+from . import disk_space
+from . import run_history
+
+
+_STOP = None
+
+
+def _partition_members(zip_path: str, partition_sheet: str) -> dict:
+    """Map partition name -> zip member of <sheet>/<partition>.img (any leading folder)."""
+    members = {}
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        for member in zip_ref.infolist():
+            parts = member.filename.split('/')
+            if member.is_dir() or len(parts) < 2 or parts[0] == '__MACOSX' or not Utils._is_safe_member_name(member.filename):
+                continue
+            sheet, name = parts[-2], parts[-1]
+            if sheet == partition_sheet and name.endswith('.img') and not name.startswith('.'):
+                members.setdefault(name[:-len('.img')], member)
+    return members
+
+
+def _extract_member(zip_path: str, member: zipfile.ZipInfo, destination: str) -> None:
+    """Extract one member straight to its flattened destination path."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    # Never write through a link left by an earlier deduplicated extraction
+    if os.path.lexists(destination):
+        os.remove(destination)
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref, zip_ref.open(member) as src, open(destination, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 4 * 1024 * 1024)
+
+
+def _succeeded(result) -> bool:
+    if isinstance(result, dict):
+        return result.get("status") == "ok" and result.get("succeeded", 0) > 0
+    return str(result).lstrip().startswith("XDelta") and "✓" in str(result)
+
+
+def run_pipeline(
+    source_zip_path: str,
+    target_zip_path: str,
+    partition_sheet: str,
+    partitions: Optional[list] = None,
+    staging_dir: Optional[str] = None,
+    output_path: Optional[str] = None,
+    max_pending: int = 2,
+    extract_workers: int = 1,
+    delta_workers: int = 1,
+    deduplicate: bool = True,
+    xdelta_options: Optional[dict] = None
+) -> dict:
+    """Extract partition pairs and generate their deltas concurrently.
+
+    Args:
+        source_zip_path: Source zip file
+        target_zip_path: Target zip file
+        partition_sheet: Sheet (subdirectory) holding the partition images
+        partitions: Partition names (default: every image of the sheet in the target zip)
+        staging_dir: Directory the images are extracted into, in source/ and target/ folders
+            (default: next to each zip)
+        output_path: Delta output directory (default: delta_output of the job workspace)
+        max_pending: Maximum number of partition pairs on disk at the same time
+        extract_workers: Number of extractor threads
+        delta_workers: Number of delta worker threads
+        deduplicate: Link target images identical to their source image instead of extracting them
+        xdelta_options: Extra keyword arguments for Utils.generate_xdelta
+
+    Returns:
+        Dictionary with per-partition results, missing partitions and timing
+    """
+    source_members = _partition_members(source_zip_path, partition_sheet)
+    target_members = _partition_members(target_zip_path, partition_sheet)
+    if partitions is None:
+        partitions = list(target_members)
+    missing = [p for p in partitions if p not in source_members or p not in target_members]
+    partitions = [p for p in partitions if p not in missing]
+
+    # Separate source/ and target/ folders, so archives with the same name do not share one
+    source_root, target_root = Utils._extraction_paths(source_zip_path, target_zip_path, staging_dir)
+    disk_space.mark_extracted_tree(source_root)
+    disk_space.mark_extracted_tree(target_root)
+
+    # Longest partitions first, so the tail of the pipeline is short; history of runs with the same options
+    partitions = run_history.estimate_run(
+        [{"partition": p, "sheet": partition_sheet, "target_size": target_members[p].file_size} for p in partitions],
+        "xdelta", options=Utils._xdelta_history_options(**(xdelta_options or {})))["order"]
+    print(f"[TRACE] Pipeline: {len(partitions)} partition(s), depth {max_pending}, "
+          f"{extract_workers} extractor(s), {delta_workers} delta worker(s)")
+
+    work = queue.Queue()
+    for partition in partitions:
+        work.put(partition)
+    ready = queue.Queue()
+    slots = threading.Semaphore(max(1, max_pending))
+    results = {}
+    lock = threading.Lock()
+
+    def extractor():
+        while True:
+            try:
+                partition = work.get_nowait()
+            except queue.Empty:
+                return
+            slots.acquire()
+            source_member, target_member = source_members[partition], target_members[partition]
+            source_file = os.path.join(source_root, partition_sheet, f"{partition}.img")
+            target_file = os.path.join(target_root, partition_sheet, f"{partition}.img")
+            try:
+                started = time.perf_counter()
+                _extract_member(source_zip_path, source_member, source_file)
+                identical = deduplicate and (source_member.CRC, source_member.file_size) == (target_member.CRC, target_member.file_size)
+                if not (identical and Utils._clone_or_link(source_file, target_file)):
+                    _extract_member(target_zip_path, target_member, target_file)
+                print(f"[TRACE] Pipeline: extracted {partition} in {time.perf_counter() - started:.1f}s")
+                ready.put(partition)
+            except Exception as e:
+                print(f"[TRACE] Pipeline: extraction of {partition} failed: {e}")
+                with lock:
+                    results[partition] = {"partition": partition, "status": "extract_failed", "detail": str(e)}
+                _remove_images(source_file, target_file)
+                slots.release()
+
+    def delta_worker():
+        while True:
+            partition = ready.get()
+            if partition is _STOP:
+                return
+            source_file = os.path.join(source_root, partition_sheet, f"{partition}.img")
+            target_file = os.path.join(target_root, partition_sheet, f"{partition}.img")
+            try:
+                result = Utils.generate_xdelta(partition, source_root, target_root, partition_sheet,
+                                               output_path=output_path, **(xdelta_options or {}))
+                record = {"partition": partition, "status": "success" if _succeeded(result) else "failed",
+                          "result": result}
+            except Exception as e:
+                record = {"partition": partition, "status": "exception", "detail": str(e)}
+            finally:
+                _remove_images(source_file, target_file)
+                slots.release()
+            print(f"[TRACE] Pipeline: {partition} {record['status']}")
+            with lock:
+                results[partition] = record
+
+    started = time.perf_counter()
+    # Threads run in a copy of the caller's context so they see its job workspace
+    extractors = [threading.Thread(target=contextvars.copy_context().run, args=(extractor,),
+                                   name=f"pipeline-extract-{i}", daemon=True)
+                  for i in range(max(1, extract_workers))]
+    workers = [threading.Thread(target=contextvars.copy_context().run, args=(delta_worker,),
+                                name=f"pipeline-delta-{i}", daemon=True)
+               for i in range(max(1, delta_workers))]
+    for thread in extractors + workers:
+        thread.start()
+    for thread in extractors:
+        thread.join()
+    for _ in workers:
+        ready.put(_STOP)
+    for thread in workers:
+        thread.join()
+
+    # Drop the (now empty) extracted trees
+    disk_space.remove_partition_images(source_root, target_root, partition_sheet, [])
+
+    return {
+        "partitions": [results[p] for p in partitions if p in results],
+        "missing": missing,
+        "seconds": time.perf_counter() - started,
+        "source_path": source_root,
+        "target_path": target_root,
+    }
+
+
+def _remove_images(*paths) -> None:
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
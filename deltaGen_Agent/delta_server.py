@@ -0,0 +1,326 @@
+"""Long-running local delta job server.
+
+Exposes the Utils pipeline over a small JSON/HTTP API (TCP or Unix socket)
+using only the standard library, so CI can submit jobs to a warm process
+instead of starting a fresh agent session per run:
+
+    python -m deltaGen_Agent.delta_server --port 8765
+    python -m deltaGen_Agent.delta_server --unix-socket /tmp/deltagen.sock
+
+Endpoints:
+    GET  /health               Server status and queue length
+    GET  /tools                Tools that can be submitted as jobs
+    POST /jobs                 Submit {"tool": "<name>", "args": {...}}
+    GET  /jobs                 List all jobs (without results)
+    GET  /jobs/<id>            Job status, progress and result
+    GET  /jobs/<id>/progress   Job status and progress only
+    GET  /cache                In-process cache statistics
+
+Jobs run in the workspace named by args["workspace"] (see job_workspace), so
+several workers can run jobs of different workspaces at the same time. With
+--isolate-jobs, a job without a workspace gets its own under ./jobs/<job id>.
+"""
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from . import Utils
+from . import artifact_hashing
+from . import job_workspace
+
+
+# Tools that can be submitted as jobs
+JOB_TOOLS = {
+    "untar_zip_files": Utils.untar_zip_files,
+    "validate_target_folders_with_partition": Utils.validate_target_folders_with_partition,
+    "generate_config_xml": Utils.generate_config_xml,
+    "list_config_files": Utils.list_config_files,
+    "parse_config_xml": Utils.parse_config_xml,
+    "generate_xdelta": Utils.generate_xdelta,
+    "generate_xdelta_pipelined": Utils.generate_xdelta_pipelined,
+    "generate_auto_delta": Utils.generate_auto_delta,
+    "simulate_device_apply": Utils.simulate_device_apply,
+    "preflight_disk_space": Utils.preflight_disk_space,
+    "generate_delta": Utils.generate_delta,
+}
+
+
+class DeltaJobServer:
+    """Job queue with worker threads and in-process caches for the Utils pipeline."""
+
+    def __init__(self, workers: int = 1, isolate_jobs: bool = False):
+        self.isolate_jobs = isolate_jobs
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.extraction_cache = {}
+        # One lock per archive pair: extractions of the same archives share their output folders
+        self.extraction_locks = {}
+        self.started = time.time()
+        self.threads = [
+            threading.Thread(target=self._worker_loop, name=f"delta-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, tool: str, args: dict) -> dict:
+        """Queue a job and return its record."""
+        if tool not in JOB_TOOLS:
+            raise ValueError(f"Unknown tool '{tool}'. Available tools: {', '.join(JOB_TOOLS)}")
+        if not isinstance(args, dict):
+            raise ValueError("Job args must be a JSON object")
+
+        job_id = uuid.uuid4().hex[:12]
+        if self.isolate_jobs and not args.get("workspace"):
+            args = dict(args, workspace=job_workspace.create(job_id).root)
+        job_workspace.resolve(args.get("workspace"))  # reject invalid names at submit time
+
+        job = {
+            "id": job_id,
+            "tool": tool,
+            "args": args,
+            "status": "queued",
+            "progress": {"done": 0, "total": 1, "current": None},
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "result": None,
+            "error": None,
+        }
+        with self.lock:
+            self.jobs[job["id"]] = job
+        self.queue.put(job["id"])
+        print(f"[TRACE] Job {job['id']} queued: {tool}")
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job, progress=dict(job["progress"])) if job else None
+
+    def list_jobs(self) -> list:
+        with self.lock:
+            return [{key: value for key, value in job.items() if key != "result"} for job in self.jobs.values()]
+
+    def cache_info(self) -> dict:
+        return {
+            "xdelta_executable": Utils._xdelta_executable,
+            "partition_workbooks": list(Utils._partition_workbook_cache),
+            "extractions": len(self.extraction_cache),
+        }
+
+    def _update(self, job_id: str, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def _set_progress(self, job_id: str, done: int, total: int, current: Optional[str] = None):
+        with self.lock:
+            self.jobs[job_id]["progress"] = {"done": done, "total": total, "current": current}
+
+    def _worker_loop(self):
+        while True:
+            job_id = self.queue.get()
+            job = self.get(job_id)
+            self._update(job_id, status="running", started=time.time())
+            print(f"[TRACE] Job {job_id} running: {job['tool']}")
+            try:
+                result = self._run_job(job)
+                self._update(job_id, status="done", result=result)
+            except Exception as e:
+                print(f"[TRACE] Job {job_id} failed: {e}")
+                self._update(job_id, status="failed", error=str(e))
+            finally:
+                self._update(job_id, finished=time.time())
+                self.queue.task_done()
+
+    def _run_job(self, job: dict):
+        with job_workspace.use(job["args"].get("workspace")):
+            return self._run_tool(job)
+
+    def _run_tool(self, job: dict):
+        tool, args = job["tool"], job["args"]
+
+        if tool == "untar_zip_files":
+            return self._run_extraction(job["id"], args)
+
+        # Split multi-item jobs so progress can be reported per partition / config file
+        if tool == "generate_xdelta":
+            items = [p.strip() for p in args["partition_files"].split(',') if p.strip()]
+            return self._run_items(job["id"], items, lambda item: Utils.generate_xdelta(**dict(args, partition_files=item)))
+        if tool == "generate_delta":
+            items = [c.strip() for c in args["config_file_names"].split(',') if c.strip()]
+            return self._run_items(job["id"], items, lambda item: Utils.generate_delta(**dict(args, config_file_names=item)))
+
+        result = JOB_TOOLS[tool](**args)
+        self._set_progress(job["id"], 1, 1)
+        return result
+
+    def _run_items(self, job_id: str, items: list, run_item) -> list:
+        results = []
+        for index, item in enumerate(items):
+            self._set_progress(job_id, index, len(items), item)
+            results.append({"item": item, "result": run_item(item)})
+        self._set_progress(job_id, len(items), len(items))
+        return results
+
+    @staticmethod
+    def _extraction_intact(result: dict) -> bool:
+        """Check that every file of a cached extraction is still there (cleanup_inputs deletes images)."""
+        for role in ("source", "target"):
+            root = result[f"{role}_path"]
+            if not os.path.isdir(root):
+                return False
+            if any(not os.path.isfile(os.path.join(root, *relative.split('/')))
+                   for relative in artifact_hashing.read_sums(root)):
+                return False
+        return True
+
+    def _run_extraction(self, job_id: str, args: dict) -> dict:
+        """Run untar_zip_files, reusing a previous extraction of unchanged archives."""
+        key_parts = []
+        for zip_arg in ("source_zip_path", "target_zip_path"):
+            path = os.path.abspath(args[zip_arg])
+            stat = os.stat(path)
+            key_parts.append((path, stat.st_mtime_ns, stat.st_size))
+        key = json.dumps([key_parts, sorted((k, v) for k, v in args.items() if not k.endswith("_zip_path"))])
+
+        # A second job on the same archives waits, then reuses the first job's extraction
+        with self.lock:
+            extraction_lock = self.extraction_locks.setdefault(json.dumps([path for path, _, _ in key_parts]),
+                                                               threading.Lock())
+        with extraction_lock:
+            with self.lock:
+                cached = self.extraction_cache.get(key)
+            if cached and self._extraction_intact(cached):
+                print(f"[TRACE] Job {job_id}: reusing cached extraction")
+                self._set_progress(job_id, 1, 1)
+                return dict(cached, cached=True)
+            if cached:
+                print(f"[TRACE] Job {job_id}: cached extraction is incomplete, extracting again")
+
+            result = Utils.untar_zip_files(**args)
+            with self.lock:
+                if isinstance(result, dict) and result.get("status") == "success":
+                    self.extraction_cache[key] = result
+                else:
+                    self.extraction_cache.pop(key, None)
+        self._set_progress(job_id, 1, 1)
+        return result
+
+
+def _make_handler(server: DeltaJobServer):
+    """Build the HTTP request handler bound to a job server."""
+
+    class DeltaJobHandler(BaseHTTPRequestHandler):
+
+        def address_string(self):
+            # Unix socket clients have no address tuple
+            return self.client_address[0] if self.client_address else "unix"
+
+        def log_message(self, format, *args):
+            print(f"[TRACE] HTTP {self.address_string()} {format % args}")
+
+        def _send(self, status: int, payload):
+            body = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts = [p for p in self.path.split('?')[0].split('/') if p]
+            if parts == ["health"]:
+                self._send(200, {"status": "ok", "uptime": time.time() - server.started,
+                                 "queued": server.queue.qsize(), "jobs": len(server.jobs)})
+            elif parts == ["tools"]:
+                self._send(200, {"tools": list(JOB_TOOLS)})
+            elif parts == ["cache"]:
+                self._send(200, server.cache_info())
+            elif parts == ["jobs"]:
+                self._send(200, {"jobs": server.list_jobs()})
+            elif len(parts) in (2, 3) and parts[0] == "jobs":
+                job = server.get(parts[1])
+                if job is None:
+                    self._send(404, {"error": f"Job not found: {parts[1]}"})
+                elif len(parts) == 3 and parts[2] == "progress":
+                    self._send(200, {"id": job["id"], "status": job["status"], "progress": job["progress"]})
+                elif len(parts) == 2:
+                    self._send(200, job)
+                else:
+                    self._send(404, {"error": f"Unknown endpoint: {self.path}"})
+            else:
+                self._send(404, {"error": f"Unknown endpoint: {self.path}"})
+
+        def do_POST(self):
+            if self.path.split('?')[0].rstrip('/') != "/jobs":
+                self._send(404, {"error": f"Unknown endpoint: {self.path}"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                job = server.submit(request.get("tool"), request.get("args", {}))
+            except (ValueError, json.JSONDecodeError) as e:
+                self._send(400, {"error": str(e)})
+                return
+            self._send(202, {"id": job["id"], "status": job["status"]})
+
+    return DeltaJobHandler
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, unix_socket: Optional[str] = None, workers: int = 1,
+          isolate_jobs: bool = False):
+    """Start the job server and block serving requests.
+
+    Args:
+        host: TCP host to bind (ignored when unix_socket is given)
+        port: TCP port to bind (ignored when unix_socket is given)
+        unix_socket: Path of a Unix socket to listen on instead of TCP
+        workers: Number of job worker threads
+        isolate_jobs: Give every job without a workspace argument its own job workspace
+    """
+    job_server = DeltaJobServer(workers=workers, isolate_jobs=isolate_jobs)
+    handler = _make_handler(job_server)
+
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        httpd = ThreadingUnixHTTPServer(unix_socket, handler)
+        print(f"[TRACE] Delta job server listening on unix socket {unix_socket}")
+    else:
+        httpd = ThreadingHTTPServer((host, port), handler)
+        print(f"[TRACE] Delta job server listening on http://{host}:{port}")
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.remove(unix_socket)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local delta job server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--isolate-jobs", action="store_true",
+                        help="Run each job without a workspace argument in its own job workspace")
+    options = parser.parse_args()
+    serve(options.host, options.port, options.unix_socket, options.workers, options.isolate_jobs)
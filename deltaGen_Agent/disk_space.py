@@ -0,0 +1,214 @@
+"""Disk-space preflight and staging-directory selection.
+
+The space a run needs is estimated from the zip central directories (no
+extraction): the uncompressed size of both archives, minus target members
+that deduplicated extraction links to identical source members, plus the
+expected delta output. A staging root with enough free space is then chosen
+from tmpfs (/dev/shm, only if it fits comfortably), the directories in
+DELTAGEN_STAGING_DIRS, the directory of the input zips and the system
+temporary directory.
+"""
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import Optional
+
+
+STAGING_DIRS_ENV = "DELTAGEN_STAGING_DIRS"
+TMPFS_ROOT = "/dev/shm"
+
+# Written into the root of every tree this tool extracts; only marked trees are ever removed as a whole
+EXTRACTION_MARKER = ".deltagen_extracted"
+
+# Fraction of the target size assumed for a changed partition's delta when no history exists
+DEFAULT_DELTA_RATIO = 0.5
+# Headroom added on top of the estimate
+SAFETY_MARGIN = 0.1
+# tmpfs is RAM: only use it when the run takes at most this fraction of its free space
+TMPFS_MAX_FRACTION = 0.5
+
+
+def _zip_members(zip_path: str) -> list:
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        return [member for member in zip_ref.infolist() if not member.is_dir()]
+
+
+def estimate_required_space(source_zip_path: str, target_zip_path: str, deduplicate: bool = True,
+                            delta_ratio: Optional[float] = None) -> dict:
+    """Estimate the disk space needed to extract both archives and store the deltas.
+
+    Args:
+        source_zip_path: Source zip path
+        target_zip_path: Target zip path
+        deduplicate: Whether identical target members will be linked instead of extracted
+        delta_ratio: Expected delta size as a fraction of a changed target member
+            (default: median from run history, else DEFAULT_DELTA_RATIO)
+
+    Returns:
+        Dictionary with extract_bytes, delta_bytes, required_bytes and member counts
+    """
+    source_members = _zip_members(source_zip_path)
+    target_members = _zip_members(target_zip_path)
+    source_content = {(member.CRC, member.file_size) for member in source_members}
+
+    if delta_ratio is None:
+        delta_ratio = _history_delta_ratio()
+
+    extract_bytes = sum(member.file_size for member in source_members)
+    delta_bytes = 0
+    identical = 0
+    for member in target_members:
+        if (member.CRC, member.file_size) in source_content:
+            identical += 1
+            if not deduplicate:
+                extract_bytes += member.file_size
+        else:
+            extract_bytes += member.file_size
+            delta_bytes += int(member.file_size * delta_ratio)
+
+    required = int((extract_bytes + delta_bytes) * (1 + SAFETY_MARGIN))
+    return {
+        "extract_bytes": extract_bytes,
+        "delta_bytes": delta_bytes,
+        "required_bytes": required,
+        "delta_ratio": delta_ratio,
+        "source_members": len(source_members),
+        "target_members": len(target_members),
+        "identical_members": identical,
+    }
+
+
+def _history_delta_ratio() -> float:
+    """Median delta/target ratio from the run history, or the default."""
+    import sqlite3
+    import statistics
+    from . import run_history
+
+    db_path = run_history.history_db_path()
+    if not os.path.exists(db_path):
+        return DEFAULT_DELTA_RATIO
+    try:
+        connection = sqlite3.connect(db_path)
+        rows = connection.execute(
+            "SELECT CAST(delta_size AS REAL) / target_size FROM runs WHERE status = 'success'"
+            " AND target_size > 0 AND delta_size IS NOT NULL ORDER BY recorded_at DESC LIMIT 200").fetchall()
+        connection.close()
+    except sqlite3.Error:
+        return DEFAULT_DELTA_RATIO
+    return statistics.median(row[0] for row in rows) if rows else DEFAULT_DELTA_RATIO
+
+
+def staging_candidates(zip_dir: str) -> list:
+    """Return candidate staging roots in order of preference."""
+    candidates = []
+    if os.path.isdir(TMPFS_ROOT):
+        candidates.append(TMPFS_ROOT)
+    candidates.extend(path for path in os.environ.get(STAGING_DIRS_ENV, "").split(os.pathsep) if path)
+    candidates.extend([zip_dir, tempfile.gettempdir()])
+
+    unique = []
+    for path in candidates:
+        path = os.path.abspath(path)
+        if path not in unique:
+            unique.append(path)
+    return unique
+
+
+def select_staging_root(required_bytes: int, zip_dir: str) -> dict:
+    """Pick the first candidate staging root with enough free space.
+
+    Args:
+        required_bytes: Space needed for extraction (and deltas, if on the same filesystem)
+        zip_dir: Directory of the input archives (the legacy extraction location)
+
+    Returns:
+        Dictionary with the selected root (None if nothing fits) and the checked candidates
+    """
+    checked = []
+    selected = None
+    for path in staging_candidates(zip_dir):
+        if not os.path.isdir(path) or not os.access(path, os.W_OK):
+            continue
+        free = shutil.disk_usage(path).free
+        limit = free * TMPFS_MAX_FRACTION if path == TMPFS_ROOT else free
+        fits = required_bytes <= limit
+        checked.append({"path": path, "free_bytes": free, "fits": fits})
+        if fits and selected is None:
+            selected = path
+    return {"staging_root": selected, "candidates": checked}
+
+
+def mark_extracted_tree(path: str) -> None:
+    """Mark a directory as an extracted tree that cleanup may remove once it is empty."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, EXTRACTION_MARKER), 'w'):
+        pass
+
+
+def is_extracted_tree(path: str) -> bool:
+    """Check whether a directory was extracted by this tool (see mark_extracted_tree)."""
+    return os.path.isfile(os.path.join(path, EXTRACTION_MARKER))
+
+
+def remove_partition_images(source_path: str, target_path: str, partition_sheet: str, partitions: list) -> int:
+    """Delete extracted images whose deltas are done and prune empty directories.
+
+    When nothing but hidden/system files remains in a tree extracted by this
+    tool (one holding EXTRACTION_MARKER), the whole tree is removed. Any other
+    directory, e.g. a build folder of the user, only loses the images and a
+    sheet directory that is left completely empty.
+
+    Returns:
+        Number of bytes freed (hardlinked copies count once per unlinked name)
+    """
+    freed = 0
+    for root in (source_path, target_path):
+        for partition in partitions:
+            image = os.path.join(root, partition_sheet, f"{partition}.img")
+            if os.path.isfile(image):
+                stat = os.stat(image)
+                os.remove(image)
+                if stat.st_nlink == 1:
+                    freed += stat.st_size
+        extracted = is_extracted_tree(root)
+        sheet_dir = os.path.join(root, partition_sheet)
+        if os.path.isdir(sheet_dir) and not _has_payload(sheet_dir):
+            if extracted:
+                shutil.rmtree(sheet_dir)
+            elif not os.listdir(sheet_dir):
+                os.rmdir(sheet_dir)
+        if extracted and os.path.isdir(root) and not _has_payload(root):
+            print(f"[TRACE] All partitions done, removing extracted tree: {root}")
+            shutil.rmtree(root)
+    return freed
+
+
+def remove_image_files(image_paths: list) -> int:
+    """Delete image files listed in a config and prune their directories.
+
+    Images are expected at <tree>/<sheet>/<partition>.img; empty directories
+    are pruned as in remove_partition_images, so only trees extracted by this
+    tool are removed as a whole.
+
+    Returns:
+        Number of bytes freed
+    """
+    freed = 0
+    for image in image_paths:
+        if not image or not os.path.isfile(image):
+            continue
+        sheet_dir = os.path.dirname(image)
+        freed += remove_partition_images(os.path.dirname(sheet_dir), os.path.dirname(sheet_dir),
+                                         os.path.basename(sheet_dir),
+                                         [os.path.splitext(os.path.basename(image))[0]])
+    return freed
+
+
+def _has_payload(path: str) -> bool:
+    """Check whether a directory still contains files other than hidden/system files."""
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and not d.startswith('__MACOSX')]
+        if any(not name.startswith('.') for name in filenames):
+            return True
+    return False
@@ -0,0 +1,217 @@
+"""ext4 allocation-aware pre-stage for delta generation.
+
+Raw ext4 partition images contain a lot of unallocated space that may hold
+stale data differing between builds. This module reads the superblock and
+block group bitmaps of an image (pure Python, read-only, memory-mapped) and
+produces a masked copy in which every unallocated block is zero. Diffing the
+masked source against the masked target makes delta size and encode time
+depend on live data only.
+
+The block map of both images is stored next to the delta
+(<partition>.blockmap.json). On the apply side the source image is masked
+with the recorded source block map before decoding, which rebuilds the masked
+target: an image with identical allocated blocks and zeroed free space. Its
+bytes (and SHA-256) differ from the original target image wherever free
+blocks held stale data, so hashes taken over the whole original image
+(AVB/dm-verity hash trees, the target digest of the artifact manifest) do not
+match it. The masked target's digest is recorded in the block map
+(target_sha256) and checked after apply.
+
+Block groups flagged BLOCK_UNINIT have no initialized bitmap and are treated
+as fully allocated, so masking never drops metadata.
+"""
+import json
+import mmap
+import os
+import struct
+import subprocess
+from typing import Optional
+
+
+EXT4_SUPERBLOCK_OFFSET = 1024
+EXT4_MAGIC = 0xEF53
+EXT4_FEATURE_INCOMPAT_64BIT = 0x80
+EXT4_BG_BLOCK_UNINIT = 0x2
+
+_COPY_CHUNK = 4 * 1024 * 1024
+
+
+def read_ext4_layout(image_path: str) -> Optional[dict]:
+    """Read the block allocation map of a raw ext4 image.
+
+    Args:
+        image_path: Path of the partition image
+
+    Returns:
+        Dictionary with block_size, blocks_count, image_size and allocated
+        extents ([start_block, block_count] pairs), or None if the file is not
+        a raw ext4 image (e.g. an Android sparse image)
+    """
+    image_size = os.path.getsize(image_path)
+    if image_size < EXT4_SUPERBLOCK_OFFSET + 1024:
+        return None
+
+    with open(image_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+        sb = image[EXT4_SUPERBLOCK_OFFSET:EXT4_SUPERBLOCK_OFFSET + 1024]
+        if struct.unpack_from("<H", sb, 0x38)[0] != EXT4_MAGIC:
+            return None
+
+        blocks_count_lo, = struct.unpack_from("<I", sb, 0x04)
+        first_data_block, log_block_size, _, blocks_per_group = struct.unpack_from("<IIII", sb, 0x14)
+        feature_incompat, = struct.unpack_from("<I", sb, 0x60)
+        desc_size, = struct.unpack_from("<H", sb, 0xFE)
+        blocks_count_hi, = struct.unpack_from("<I", sb, 0x150)
+
+        is_64bit = bool(feature_incompat & EXT4_FEATURE_INCOMPAT_64BIT)
+        block_size = 1024 << log_block_size
+        blocks_count = blocks_count_lo | ((blocks_count_hi << 32) if is_64bit else 0)
+        desc_size = desc_size if is_64bit and desc_size >= 64 else 32
+
+        if blocks_per_group == 0 or blocks_count * block_size > image_size:
+            print(f"[TRACE] {image_path}: inconsistent ext4 superblock, not masking")
+            return None
+
+        group_count = -(-(blocks_count - first_data_block) // blocks_per_group)
+        gdt_offset = (first_data_block + 1) * block_size
+
+        extents = []
+
+        def add_run(start, count):
+            if extents and extents[-1][0] + extents[-1][1] == start:
+                extents[-1][1] += count
+            else:
+                extents.append([start, count])
+
+        # Blocks before the first group (boot block on 1 KiB block filesystems) are kept
+        if first_data_block:
+            add_run(0, first_data_block)
+
+        for group in range(group_count):
+            desc = image[gdt_offset + group * desc_size:gdt_offset + (group + 1) * desc_size]
+            bitmap_block, = struct.unpack_from("<I", desc, 0x00)
+            flags, = struct.unpack_from("<H", desc, 0x12)
+            if desc_size >= 64:
+                bitmap_block |= struct.unpack_from("<I", desc, 0x20)[0] << 32
+
+            group_start = first_data_block + group * blocks_per_group
+            group_blocks = min(blocks_per_group, blocks_count - group_start)
+
+            if flags & EXT4_BG_BLOCK_UNINIT or (bitmap_block + 1) * block_size > image_size:
+                add_run(group_start, group_blocks)
+                continue
+
+            bitmap = image[bitmap_block * block_size:bitmap_block * block_size + (group_blocks + 7) // 8]
+            run_start = None
+            for byte_index, byte in enumerate(bitmap):
+                # Fast paths for fully free / fully used bytes
+                if byte == 0xFF and run_start is not None:
+                    continue
+                if byte == 0x00 and run_start is None:
+                    continue
+                for bit in range(8):
+                    block = byte_index * 8 + bit
+                    if block >= group_blocks:
+                        break
+                    if byte >> bit & 1:
+                        if run_start is None:
+                            run_start = block
+                    elif run_start is not None:
+                        add_run(group_start + run_start, block - run_start)
+                        run_start = None
+            if run_start is not None:
+                add_run(group_start + run_start, group_blocks - run_start)
+
+    allocated_blocks = sum(count for _, count in extents)
+    return {
+        "block_size": block_size,
+        "blocks_count": blocks_count,
+        "image_size": image_size,
+        "allocated_blocks": allocated_blocks,
+        "allocated": extents,
+    }
+
+
+def mask_unallocated(image_path: str, output_path: str, layout: dict) -> None:
+    """Write a copy of an ext4 image in which all unallocated blocks are zero.
+
+    Only allocated extents are copied; the rest of the output is left as a
+    sparse hole. Bytes past the end of the filesystem are copied unchanged.
+
+    Args:
+        image_path: Path of the ext4 image
+        output_path: Path of the masked copy
+        layout: Layout from read_ext4_layout
+    """
+    block_size = layout["block_size"]
+    fs_end = layout["blocks_count"] * block_size
+    ranges = [(start * block_size, count * block_size) for start, count in layout["allocated"]]
+    if layout["image_size"] > fs_end:
+        ranges.append((fs_end, layout["image_size"] - fs_end))
+
+    with open(image_path, 'rb') as src, mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as image, \
+            open(output_path, 'wb') as dst:
+        dst.truncate(layout["image_size"])
+        for offset, length in ranges:
+            for chunk_offset in range(offset, offset + length, _COPY_CHUNK):
+                chunk = image[chunk_offset:min(chunk_offset + _COPY_CHUNK, offset + length)]
+                # All-zero chunks stay holes in the sparse output
+                if chunk.count(0) != len(chunk):
+                    dst.seek(chunk_offset)
+                    dst.write(chunk)
+
+
+def live_fraction(layout: dict) -> float:
+    """Return the fraction of filesystem blocks that are allocated."""
+    return layout["allocated_blocks"] / layout["blocks_count"] if layout["blocks_count"] else 1.0
+
+
+def write_block_map(path: str, source_layout: dict, target_layout: dict, target_sha256: Optional[str] = None) -> None:
+    """Store the source and target block maps, and the masked target's SHA-256, next to a delta."""
+    with open(path, 'w') as f:
+        json.dump({"version": 1, "source": source_layout, "target": target_layout, "target_sha256": target_sha256}, f)
+
+
+def apply_masked_delta(source_image: str, delta_file: str, block_map_file: str, output_file: str,
+                       xdelta_exe: str = "xdelta3") -> dict:
+    """Apply an ext4 allocation-aware delta.
+
+    The source image is masked with the recorded source block map, then the
+    delta is decoded against it. The output is the masked target image; it is
+    checked against the target_sha256 of the block map when one is recorded.
+
+    Args:
+        source_image: Source partition image (may contain different stale data in free blocks)
+        delta_file: Delta produced from the masked images
+        block_map_file: <partition>.blockmap.json written at generation time
+        output_file: Path of the rebuilt target image
+        xdelta_exe: XDelta executable
+
+    Returns:
+        Dictionary with output path, target size and SHA-256
+
+    Raises:
+        ValueError: If the source size or the rebuilt target's digest does not match the block map
+    """
+    from .artifact_hashing import hash_file
+
+    with open(block_map_file) as f:
+        block_map = json.load(f)
+    if os.path.getsize(source_image) != block_map["source"]["image_size"]:
+        raise ValueError(f"Source size mismatch: expected {block_map['source']['image_size']} bytes")
+
+    masked_source = f"{output_file}.masked_source"
+    try:
+        mask_unallocated(source_image, masked_source, block_map["source"])
+        result = subprocess.run([xdelta_exe, "-d", "-f", "-s", masked_source, delta_file, output_file],
+                                capture_output=True, text=True, timeout=3600)
+        if result.returncode != 0:
+            raise RuntimeError(f"xdelta3 decode failed (exit code {result.returncode}): {result.stderr[:200]}")
+    finally:
+        if os.path.exists(masked_source):
+            os.remove(masked_source)
+
+    digest = hash_file(output_file)
+    if block_map.get("target_sha256") and digest != block_map["target_sha256"]:
+        raise ValueError(f"Rebuilt target digest {digest} does not match the masked target {block_map['target_sha256']}")
+    print(f"[TRACE] Applied ext4 allocation-aware delta: {output_file}")
+    return {"output": output_file, "target_size": os.path.getsize(output_file), "sha256": digest}
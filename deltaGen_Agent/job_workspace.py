@@ -0,0 +1,165 @@
+"""Per-job workspaces.
+
+A workspace separates the files a job writes from the inputs it only reads:
+
+    shared_root   read-only inputs: Input_data.json, <ECU>_Partition_file.xlsx/.csv,
+                  the Redbend executable, the run history database
+    root          files of one job: config*.xml, delta_output/, the Redbend
+                  <partition>_full.csv statistics and the tool log
+
+Inputs are looked up in the job root first and then in the shared root, so a
+job can override a shared input (e.g. its own Input_data.json) by placing a
+copy in its root.
+
+Tools take an optional ``workspace`` argument: a job name that maps to
+<shared_root>/jobs/<name>, or an absolute directory under <shared_root>/jobs. The workspace is active for
+the duration of the tool call and held in a context variable, so jobs running
+in different threads of one process (delta_server workers, multi-sheet
+pipelines) each see their own workspace. Without a workspace, both roots are
+the current working directory, which is the single-run behaviour.
+"""
+import contextlib
+import contextvars
+import functools
+import inspect
+import os
+import re
+import uuid
+from typing import Optional, Union
+
+
+JOBS_DIRNAME = "jobs"
+
+_active = contextvars.ContextVar("deltagen_workspace", default=None)
+
+
+class Workspace:
+    """Job root for outputs plus a shared root for read-only inputs."""
+
+    def __init__(self, root: str, shared_root: Optional[str] = None, job_id: Optional[str] = None):
+        self.root = os.path.abspath(root)
+        self.shared_root = os.path.abspath(shared_root or root)
+        self.job_id = job_id
+
+    def path(self, *parts: str) -> str:
+        """Path of a job file (configs, outputs, statistics)."""
+        return os.path.join(self.root, *parts)
+
+    def input_path(self, name: str) -> str:
+        """Path of an input: the job's own copy if it has one, else the shared one."""
+        own = os.path.join(self.root, name)
+        if os.path.exists(own) or self.root == self.shared_root:
+            return own
+        return os.path.join(self.shared_root, name)
+
+    @property
+    def delta_output(self) -> str:
+        return self.path("delta_output")
+
+    @property
+    def isolated(self) -> bool:
+        """True for a job workspace (outputs kept apart from the shared root)."""
+        return self.root != self.shared_root
+
+    def staging_dir(self, staging_root: str) -> str:
+        """Extraction directory under a staging root, kept apart per job."""
+        if self.isolated and os.path.abspath(staging_root) != self.root:
+            return os.path.join(staging_root, "deltagen_staging", self.job_id or os.path.basename(self.root))
+        return os.path.join(staging_root, "deltagen_staging")
+
+    def to_dict(self) -> dict:
+        return {"job_id": self.job_id, "root": self.root, "shared_root": self.shared_root}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Workspace":
+        return cls(data["root"], data.get("shared_root"), data.get("job_id"))
+
+    def __repr__(self):
+        return f"Workspace(root={self.root!r}, shared_root={self.shared_root!r})"
+
+
+def current() -> Workspace:
+    """Return the active workspace (the current working directory if none is active)."""
+    return _active.get() or Workspace(os.getcwd())
+
+
+def resolve(workspace: Union[None, str, Workspace]) -> Workspace:
+    """Turn a tool's workspace argument into a Workspace.
+
+    Args:
+        workspace: None (active workspace), a Workspace, an absolute job directory
+            under <shared_root>/jobs, or a job name under <shared_root>/jobs
+
+    Returns:
+        The workspace; its job root is created if missing
+
+    Raises:
+        ValueError: For an invalid job name or a directory outside <shared_root>/jobs
+    """
+    if workspace is None or workspace == "":
+        return current()
+    if isinstance(workspace, Workspace):
+        return workspace
+    active = current()
+    shared_root = active.shared_root
+    if os.path.isabs(workspace):
+        # Tool arguments may come from an agent prompt: never create directories outside the job area
+        root = os.path.realpath(workspace)
+        if root == os.path.realpath(active.root):
+            return active
+        jobs_dir = os.path.realpath(os.path.join(shared_root, JOBS_DIRNAME))
+        if not root.startswith(jobs_dir + os.sep):
+            raise ValueError(f"Workspace {workspace} is outside the job directory {jobs_dir}")
+        job_id = os.path.basename(root)
+    else:
+        if not re.fullmatch(r"[0-9A-Za-z._-]+", workspace) or workspace in (".", ".."):
+            raise ValueError(f"Invalid workspace name: {workspace!r}")
+        root, job_id = os.path.join(shared_root, JOBS_DIRNAME, workspace), workspace
+    os.makedirs(root, exist_ok=True)
+    return Workspace(root, shared_root, job_id)
+
+
+@contextlib.contextmanager
+def use(workspace: Union[None, str, Workspace]):
+    """Activate a workspace for the duration of a with-block."""
+    token = _active.set(resolve(workspace))
+    try:
+        yield _active.get()
+    finally:
+        _active.reset(token)
+
+
+def create(job_id: Optional[str] = None, shared_root: Optional[str] = None) -> Workspace:
+    """Create a fresh job workspace under <shared_root>/jobs.
+
+    Args:
+        job_id: Job name (default: random id)
+        shared_root: Directory holding the shared inputs (default: the active shared root)
+
+    Returns:
+        The new workspace
+    """
+    job_id = job_id or uuid.uuid4().hex[:12]
+    with use(Workspace(shared_root) if shared_root else None):
+        return resolve(job_id)
+
+
+def scoped(func):
+    """Run a tool inside the workspace named by its ``workspace`` argument.
+
+    The tool declares ``workspace: Optional[str] = None`` itself, so ADK still
+    sees (and documents) the argument through functools.wraps. An invalid
+    workspace is returned as a tool error instead of raising out of the tool.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            workspace = resolve(signature.bind_partial(*args, **kwargs).arguments.get("workspace"))
+        except ValueError as e:
+            from .Utils import _tool_result
+            return _tool_result(func.__name__, f"Error: {e}", "error", "invalid_workspace")
+        with use(workspace):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,104 @@
+import asyncio
+import re
+import textwrap
+from typing import AsyncGenerator
+
+from google.adk.agents import BaseAgent, ParallelAgent, SequentialAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types
+
+from .Utils import MULTI_SHEET_STATE_KEY, MULTI_SHEET_RESULT_PREFIX, run_sheet_pipeline
+
+
+def _text_event(agent: BaseAgent, ctx: InvocationContext, text: str, state_delta: dict = None) -> Event:
+    """Build a model event carrying text and an optional state delta."""
+    return Event(
+        author=agent.name,
+        invocation_id=ctx.invocation_id,
+        branch=ctx.branch,
+        content=types.Content(role='model', parts=[types.Part(text=text)]),
+        actions=EventActions(state_delta=state_delta or {}),
+    )
+
+
+def _result_text(result) -> str:
+    """Render a tool result (text or structured dict) for the merged report."""
+    if isinstance(result, dict):
+        return ", ".join(f"{key}={value}" for key, value in result.items() if key not in ("log", "partitions"))
+    return str(result)
+
+
+class SheetPipelineAgent(BaseAgent):
+    """Deterministic (no LLM) delta pipeline for a single partition sheet."""
+    
+    sheet: str
+    
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        request = ctx.session.state.get(MULTI_SHEET_STATE_KEY)
+        # The pipeline blocks on subprocesses; run it in a thread so sheets overlap
+        result = await asyncio.to_thread(run_sheet_pipeline, request, self.sheet)
+        yield _text_event(
+            self, ctx,
+            f"[{self.sheet}] {result['step']}: {result['status']} ({result['seconds']}s)",
+            {f"{MULTI_SHEET_RESULT_PREFIX}{self.sheet}": result},
+        )
+
+
+class SheetFanOutAgent(BaseAgent):
+    """Runs one SheetPipelineAgent per requested sheet concurrently via ParallelAgent."""
+    
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        request = ctx.session.state.get(MULTI_SHEET_STATE_KEY)
+        if not request or not request.get("sheets"):
+            yield _text_event(self, ctx, "Error: No multi-sheet run prepared. Call prepare_multi_sheet_run first.")
+            return
+        
+        print(f"[TRACE] Fanning out delta generation over sheets: {request['sheets']}")
+        # Sub-agents are built per run because the sheets are chosen by the user
+        fan_out = ParallelAgent(
+            name='sheet_pipelines',
+            sub_agents=[
+                SheetPipelineAgent(name=f"sheet_{index}_{re.sub(r'[^0-9A-Za-z_]', '_', sheet)}", sheet=sheet)
+                for index, sheet in enumerate(request["sheets"])
+            ],
+        )
+        async for event in fan_out.run_async(ctx):
+            yield event
+
+
+class SheetReportAgent(BaseAgent):
+    """Merges the per-sheet results into a single report."""
+    
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        request = ctx.session.state.get(MULTI_SHEET_STATE_KEY) or {}
+        sheets = request.get("sheets", [])
+        
+        lines = [f"Multi-sheet delta generation report ({request.get('delta_tool', 'unknown')}):", ""]
+        slowest = 0.0
+        for sheet in sheets:
+            result = ctx.session.state.get(f"{MULTI_SHEET_RESULT_PREFIX}{sheet}")
+            if not result:
+                lines.append(f"✗ {sheet}: no result")
+                continue
+            slowest = max(slowest, result["seconds"])
+            mark = "✓" if result["status"] == "ok" else "✗"
+            lines.append(f"{mark} {sheet}: {result['status']} at {result['step']} ({result['seconds']}s)")
+            lines.append(textwrap.indent(_result_text(result['result']).strip(), "    "))
+        lines.append("")
+        lines.append(f"Wall time (slowest sheet): {slowest:.1f}s")
+        
+        # Clear the request so a later run starts from a fresh selection
+        state_delta = {MULTI_SHEET_STATE_KEY: None}
+        state_delta.update({f"{MULTI_SHEET_RESULT_PREFIX}{sheet}": None for sheet in sheets})
+        yield _text_event(self, ctx, "\n".join(lines), state_delta)
+
+
+multi_sheet_tool = SequentialAgent(
+    name='multi_sheet_tool',
+    description='Runs delta generation for several partition sheets concurrently (one deterministic pipeline per sheet) and returns a merged report. Requires prepare_multi_sheet_run to be called first.',
+    sub_agents=[
+        SheetFanOutAgent(name='sheet_fan_out'),
+        SheetReportAgent(name='sheet_report'),
+    ],
+)
@@ -1,5 +1,5 @@
 from google.adk.agents.llm_agent import Agent
-from .Utils import untar_zip_files, validate_target_folders_with_partition, generate_config_xml, list_config_files, parse_config_xml, generate_delta
+from .Utils import preflight_disk_space, untar_zip_files, validate_target_folders_with_partition, generate_config_xml, list_config_files, parse_config_xml, generate_delta, prepare_multi_sheet_run, generate_deltas_distributed
 
 redbend_tool = Agent(
     model='gemini-2.5-flash',
@@ -11,9 +11,13 @@ When called, you will receive information about:
 - source_path: Absolute path of source zip file
 - target_path: Absolute path of target zip file
 - ecu_type: ECU type/name
+- workspace (optional): Job workspace name. If given, pass it as the workspace argument to every tool call so this run's configs, deltas and statistics stay apart from other runs
 
 Your task:
-1. Use the untar_zip_files tool to extract source and target zip files
+1. Use the preflight_disk_space tool to check that the run fits on disk, then use the untar_zip_files tool to extract source and target zip files
+   - If the preflight fails, stop and report the space required and the checked locations
+   - Pass staging_root="auto" to untar_zip_files to extract into the staging root selected by the preflight
+   - untar_zip_files also accepts .tar, .tar.gz and .tar.xz archives ("-" reads a tar stream from standard input); they are streamed in one pass and only the partitions listed in the partition file are kept when ecu_type is given. The disk space preflight and staging_root="auto" need zip archives
 2. The tool will return the extracted directory paths - use these as the actual source and target paths
 3. Use validate_target_folders_with_partition tool to verify target folder structure matches partition file
 4. If validation fails, stop and return the error message
@@ -23,6 +27,7 @@ Your task:
    - Call again with the selected partition_sheet parameter
 6. Ask user if they want to change the ComponentDeltaFileName (default: source_target.mld)
 7. If user wants to generate delta for multiple partition sheets, call generate_config_xml for each sheet separately
+   - If the user wants several sheets generated in one go (e.g. QNX and Android), call prepare_multi_sheet_run with the comma-separated sheets, source path, target path, ECU type and delta_tool "redbend", then transfer to multi_sheet_tool. It runs all sheets concurrently and returns a merged report
 8. After generating config files, provide the path(s) and ask user to review them
 9. When user confirms to generate delta:
    - Use list_config_files tool to find all config XML files in current directory
@@ -40,14 +45,19 @@ Your task:
 13. Print "ECU Type: <ecu_type>"
 14. Return status message of delta generation
 
+Tool results may be compact dictionaries (structured result mode). Check the status field ('ok', 'error' or 'needs_input') and the code field; the full human-readable output is in the file referenced by the log field.
+
 Available tools:
-- untar_zip_files: Extracts source and target zip files and returns extracted paths
+- generate_deltas_distributed: Runs delta generation on the workers of a delta coordinator (only when the user provides a coordinator URL) and reports per-job results
+- preflight_disk_space: Estimates the disk space of the run from the zip files and selects a staging root with enough free space
+- untar_zip_files: Extracts source and target zip or tar archives and returns extracted paths
 - validate_target_folders_with_partition: Validates target and source folder structure against partition file sheets
 - generate_config_xml: Generates config.xml based on partition file data. Use partition_sheet parameter to specify which sheet to process when multiple sheets exist
 - list_config_files: Lists all config XML files in current directory
 - parse_config_xml: Extracts all partition names from a config XML file. Returns comma-separated partition names
-- generate_delta: Validates Redbend executable and prepares delta generation for specified config files
+- generate_delta: Validates Redbend executable and prepares delta generation for specified config files. Set cleanup_inputs=True to delete the images of a config once its delta is done. The SHA-256 digests of the images and packages are recorded in delta_output/artifact_manifest.json; report its path to the user
+- prepare_multi_sheet_run: Stores a concurrent multi-sheet run; transfer to multi_sheet_tool afterwards
 
 Return a confirmation message that Redbend delta generation was initiated with the extracted paths and ECU type.''',
-    tools=[untar_zip_files, validate_target_folders_with_partition, generate_config_xml, list_config_files, parse_config_xml, generate_delta],
+    tools=[preflight_disk_space, untar_zip_files, validate_target_folders_with_partition, generate_config_xml, list_config_files, parse_config_xml, generate_delta, prepare_multi_sheet_run, generate_deltas_distributed],
 )
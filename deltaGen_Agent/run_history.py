@@ -0,0 +1,259 @@
+"""Local SQLite history of delta runs.
+
+Every partition run of generate_xdelta (and every config file run of
+generate_delta) is recorded with its input sizes, backend, options, duration,
+peak memory and delta size. The history is used to estimate run time before a
+run starts, to order partitions longest first, and to flag partitions whose
+throughput or delta ratio moved away from their history. Regression checks
+only compare runs recorded with the same options (ext4_aware, segmented,
+secondary compression, ...), since those change both speed and delta size.
+
+Estimates and regression checks only read the database; without one they
+report no history instead of creating it.
+"""
+import json
+import os
+import sqlite3
+import statistics
+import time
+from typing import Optional
+
+from . import job_workspace
+
+
+HISTORY_DB_ENV = "DELTAGEN_HISTORY_DB"
+HISTORY_DB_FILENAME = "delta_history.sqlite"
+TOLERANCE_ENV = "DELTAGEN_REGRESSION_TOLERANCE"
+DEFAULT_TOLERANCE = 0.3
+
+# Only the most recent successful runs are used for estimates
+HISTORY_WINDOW = 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at REAL NOT NULL,
+    partition TEXT NOT NULL,
+    sheet TEXT,
+    backend TEXT NOT NULL,
+    source_size INTEGER,
+    target_size INTEGER,
+    options TEXT,
+    duration REAL,
+    peak_memory_kb INTEGER,
+    delta_size INTEGER,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_partition ON runs (backend, partition, sheet);
+"""
+
+
+def history_db_path() -> str:
+    """Return the history database path (DELTAGEN_HISTORY_DB or delta_history.sqlite in the shared root)."""
+    return os.environ.get(HISTORY_DB_ENV) or os.path.join(job_workspace.current().shared_root, HISTORY_DB_FILENAME)
+
+
+def regression_tolerance() -> float:
+    """Return the relative tolerance used for regression alerts."""
+    try:
+        return float(os.environ.get(TOLERANCE_ENV, DEFAULT_TOLERANCE))
+    except ValueError:
+        return DEFAULT_TOLERANCE
+
+
+def _connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_path or history_db_path(), timeout=30)
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def _connect_read_only(db_path: Optional[str] = None) -> Optional[sqlite3.Connection]:
+    """Open the database for reading, or return None if it does not exist yet."""
+    import urllib.request
+
+    db_path = os.path.abspath(db_path or history_db_path())
+    if not os.path.exists(db_path):
+        return None
+    return sqlite3.connect(f"file:{urllib.request.pathname2url(db_path)}?mode=ro", uri=True, timeout=30)
+
+
+def _options_key(options: Optional[dict]) -> Optional[str]:
+    # Stored the same way by record_run, so runs with equal options compare equal
+    return json.dumps(options, sort_keys=True) if options is not None else None
+
+
+def record_run(
+    partition: str,
+    sheet: Optional[str],
+    backend: str,
+    source_size: Optional[int],
+    target_size: Optional[int],
+    options: dict,
+    duration: Optional[float],
+    peak_memory_kb: Optional[int],
+    delta_size: Optional[int],
+    status: str,
+    db_path: Optional[str] = None
+) -> None:
+    """Record one partition run in the history database."""
+    try:
+        with _connect(db_path) as connection:
+            connection.execute(
+                "INSERT INTO runs (recorded_at, partition, sheet, backend, source_size, target_size, options,"
+                " duration, peak_memory_kb, delta_size, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), partition, sheet, backend, source_size, target_size,
+                 _options_key(options), duration, peak_memory_kb, delta_size, status)
+            )
+        connection.close()
+    except sqlite3.Error as e:
+        print(f"[TRACE] Could not record run history: {e}")
+
+
+def _history(connection: Optional[sqlite3.Connection], backend: str, partition: Optional[str], sheet: Optional[str],
+             options: Optional[dict] = None) -> list:
+    """Return recent successful (target_size, duration, delta_size) rows, optionally with the same options."""
+    if connection is None:
+        return []
+    query = ("SELECT target_size, duration, delta_size FROM runs WHERE backend = ? AND status = 'success'"
+             " AND duration > 0 AND target_size > 0")
+    params = [backend]
+    if partition is not None:
+        query += " AND partition = ? AND sheet IS ?"
+        params += [partition, sheet]
+    if options is not None:
+        query += " AND options = ?"
+        params.append(_options_key(options))
+    query += " ORDER BY recorded_at DESC LIMIT ?"
+    params.append(HISTORY_WINDOW)
+    return connection.execute(query, params).fetchall()
+
+
+def estimate_duration(
+    partition: str,
+    sheet: Optional[str],
+    backend: str,
+    target_size: int,
+    db_path: Optional[str] = None,
+    options: Optional[dict] = None
+) -> Optional[float]:
+    """Estimate run time from the median historical throughput.
+
+    The partition's runs with the same options are used when available, then
+    all of its runs, then the backend-wide history.
+
+    Returns:
+        Estimated seconds, or None if there is no history
+    """
+    try:
+        connection = _connect_read_only(db_path)
+        rows = ((options is not None and _history(connection, backend, partition, sheet, options))
+                or _history(connection, backend, partition, sheet) or _history(connection, backend, None, None))
+        if connection:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"[TRACE] Could not read run history: {e}")
+        return None
+
+    if not rows:
+        return None
+    throughput = statistics.median(size / duration for size, duration, _ in rows)
+    return target_size / throughput
+
+
+def delta_ratio(partition: str, sheet: Optional[str], backend: str, db_path: Optional[str] = None) -> Optional[float]:
+    """Median delta size / target size of a backend's successful runs.
+
+    The partition's own runs are used when available, otherwise the
+    backend-wide history.
+
+    Returns:
+        The ratio, or None if the backend has no recorded delta sizes
+    """
+    try:
+        connection = _connect_read_only(db_path)
+        ratios = None
+        for rows in (_history(connection, backend, partition, sheet), _history(connection, backend, None, None)):
+            ratios = [delta / size for size, _, delta in rows if delta is not None]
+            if ratios:
+                break
+        if connection:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"[TRACE] Could not read run history: {e}")
+        return None
+    return statistics.median(ratios) if ratios else None
+
+
+def estimate_run(items: list, backend: str, db_path: Optional[str] = None, options: Optional[dict] = None) -> dict:
+    """Estimate the run time of several partitions and order them longest first.
+
+    Args:
+        items: List of dicts with "partition", "sheet", "target_size" and optionally
+            "options" (overrides the run options for that item)
+        backend: Delta backend name
+        db_path: Optional history database path
+        options: Run options; runs recorded with the same options are preferred
+
+    Returns:
+        Dictionary with "order" (partition names, longest first), "estimates"
+        (partition -> seconds or None) and "total_seconds" (None if any estimate is missing)
+    """
+    estimates = {item["partition"]: estimate_duration(item["partition"], item.get("sheet"), backend,
+                                                      item["target_size"], db_path, item.get("options", options))
+                 for item in items}
+    # Unknown partitions go first: they may well be the longest
+    order = sorted(estimates, key=lambda name: -(estimates[name] if estimates[name] is not None else float("inf")))
+    known = [seconds for seconds in estimates.values() if seconds is not None]
+    total = sum(known) if len(known) == len(estimates) else None
+    return {"order": order, "estimates": estimates, "total_seconds": total}
+
+
+def check_regression(
+    partition: str,
+    sheet: Optional[str],
+    backend: str,
+    target_size: int,
+    duration: float,
+    delta_size: Optional[int],
+    tolerance: Optional[float] = None,
+    db_path: Optional[str] = None,
+    options: Optional[dict] = None
+) -> list:
+    """Compare a finished run against the partition's history.
+
+    Call before recording the run, so it is not compared against itself.
+    Only runs recorded with the same options are compared.
+
+    Returns:
+        List of alert strings (empty when within tolerance or without history)
+    """
+    tolerance = regression_tolerance() if tolerance is None else tolerance
+    try:
+        connection = _connect_read_only(db_path)
+        rows = _history(connection, backend, partition, sheet, options if options is not None else {})
+        if connection:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"[TRACE] Could not read run history: {e}")
+        return []
+
+    alerts = []
+    if not rows or not target_size or not duration:
+        return alerts
+
+    baseline_throughput = statistics.median(size / seconds for size, seconds, _ in rows)
+    throughput = target_size / duration
+    change = (throughput - baseline_throughput) / baseline_throughput
+    if abs(change) > tolerance:
+        alerts.append(f"throughput {throughput / 1e6:.2f} MB/s vs history {baseline_throughput / 1e6:.2f} MB/s ({change:+.0%})")
+
+    ratios = [delta / size for size, _, delta in rows if delta is not None]
+    if ratios and delta_size is not None:
+        baseline_ratio = statistics.median(ratios)
+        ratio = delta_size / target_size
+        if baseline_ratio > 0:
+            ratio_change = (ratio - baseline_ratio) / baseline_ratio
+            if abs(ratio_change) > tolerance:
+                alerts.append(f"delta ratio {ratio:.4f} vs history {baseline_ratio:.4f} ({ratio_change:+.0%})")
+
+    return alerts
@@ -0,0 +1,377 @@
+"""Segmented parallel XDelta encoding for very large partition images.
+
+A large target image is split into aligned segments. Each segment is encoded
+by its own xdelta3 process against the matching source window, widened by an
+overlap on both sides so data that moved a little between builds is still
+found. The per-segment deltas are stored in one container file:
+
+    magic (8 bytes) | header length (8 bytes, big endian) | JSON header | deltas
+
+The header lists, per segment, the target range, the source window, the
+length of its delta and the SHA-256 of the target segment. apply_segmented
+rebuilds the full target image from the source image and the container.
+
+    python -m deltaGen_Agent.segmented_delta encode SOURCE TARGET OUTPUT
+    python -m deltaGen_Agent.segmented_delta apply SOURCE CONTAINER OUTPUT
+    python -m deltaGen_Agent.segmented_delta bench SOURCE TARGET
+"""
+import hashlib
+import json
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .Utils import find_xdelta_executable
+
+
+SEGMENT_MAGIC = b"DGSEG001"
+SEGMENT_ALIGNMENT = 1024 * 1024
+DEFAULT_SEGMENT_SIZE = 512 * 1024 * 1024
+DEFAULT_OVERLAP = 64 * 1024 * 1024
+
+# Partitions at least this large are encoded segmented by generate_xdelta(segmented=True)
+SEGMENT_THRESHOLD_ENV = "DELTAGEN_SEGMENT_THRESHOLD_MB"
+DEFAULT_SEGMENT_THRESHOLD_MB = 2048
+
+_COPY_CHUNK = 4 * 1024 * 1024
+
+
+def segment_threshold_bytes() -> int:
+    """Return the minimum target size for segmented encoding."""
+    try:
+        return int(os.environ.get(SEGMENT_THRESHOLD_ENV, DEFAULT_SEGMENT_THRESHOLD_MB)) * 1024 * 1024
+    except ValueError:
+        return DEFAULT_SEGMENT_THRESHOLD_MB * 1024 * 1024
+
+
+def plan_segments(source_size: int, target_size: int, segment_size: int = DEFAULT_SEGMENT_SIZE,
+                  overlap: int = DEFAULT_OVERLAP) -> list:
+    """Split a target image into aligned segments with matching source windows.
+
+    Args:
+        source_size: Size of the source image in bytes
+        target_size: Size of the target image in bytes
+        segment_size: Target segment size (rounded up to SEGMENT_ALIGNMENT)
+        overlap: Extra source bytes on each side of the matching window
+
+    Returns:
+        List of segment dicts with target and source offsets and lengths
+    """
+    segment_size = max(SEGMENT_ALIGNMENT, -(-segment_size // SEGMENT_ALIGNMENT) * SEGMENT_ALIGNMENT)
+    segments = []
+    for index, target_offset in enumerate(range(0, max(target_size, 1), segment_size)):
+        target_length = min(segment_size, target_size - target_offset)
+        source_start = min(max(0, target_offset - overlap), source_size)
+        source_end = min(source_size, target_offset + target_length + overlap)
+        segments.append({
+            "index": index,
+            "target_offset": target_offset,
+            "target_length": target_length,
+            "source_offset": source_start,
+            "source_length": source_end - source_start,
+        })
+    return segments
+
+
+def _copy_range(src_path: str, offset: int, length: int, dst_path: str, digest=None) -> None:
+    """Copy a byte range of a file into a new file, optionally hashing it."""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        src.seek(offset)
+        remaining = length
+        while remaining > 0:
+            chunk = src.read(min(_COPY_CHUNK, remaining))
+            if not chunk:
+                raise IOError(f"Unexpected end of file in {src_path} at offset {offset + length - remaining}")
+            if digest is not None:
+                digest.update(chunk)
+            dst.write(chunk)
+            remaining -= len(chunk)
+
+
+def _run_xdelta(command: list) -> None:
+    result = subprocess.run(command, capture_output=True, text=True, timeout=3600)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)} failed (exit code {result.returncode}): {result.stderr[:200]}")
+
+
+def _encode_segment(xdelta_exe: str, source_file: str, target_file: str, segment: dict, work_dir: str) -> dict:
+    """Encode one target segment against its source window."""
+    start = time.monotonic()
+    prefix = os.path.join(work_dir, f"segment_{segment['index']:05d}")
+    window_file, target_part, delta_file = f"{prefix}.src", f"{prefix}.tgt", f"{prefix}.delta"
+
+    digest = hashlib.sha256()
+    _copy_range(source_file, segment["source_offset"], segment["source_length"], window_file)
+    _copy_range(target_file, segment["target_offset"], segment["target_length"], target_part, digest)
+    try:
+        _run_xdelta([xdelta_exe, "-e", "-f", "-s", window_file, target_part, delta_file])
+    finally:
+        os.remove(window_file)
+        os.remove(target_part)
+
+    return dict(segment, delta_file=delta_file, delta_length=os.path.getsize(delta_file),
+                target_sha256=digest.hexdigest(), seconds=time.monotonic() - start)
+
+
+def encode_segmented(
+    source_file: str,
+    target_file: str,
+    output_file: str,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    overlap: int = DEFAULT_OVERLAP,
+    workers: Optional[int] = None,
+    xdelta_exe: Optional[str] = None
+) -> dict:
+    """Encode a target image as segmented deltas in parallel and write the container.
+
+    Args:
+        source_file: Source image path
+        target_file: Target image path
+        output_file: Container file path
+        segment_size: Target segment size in bytes
+        overlap: Source window overlap in bytes on each side
+        workers: Number of parallel xdelta3 processes (default: CPU count)
+        xdelta_exe: XDelta executable (default: discovered)
+
+    Returns:
+        Dictionary with container path, delta size, segment count and seconds
+    """
+    xdelta_exe = xdelta_exe or find_xdelta_executable()
+    if not xdelta_exe:
+        raise RuntimeError("XDelta executable not found. Please install xdelta3 or ensure it's in PATH.")
+
+    start = time.monotonic()
+    source_size = os.path.getsize(source_file)
+    target_size = os.path.getsize(target_file)
+    segments = plan_segments(source_size, target_size, segment_size, overlap)
+    workers = workers or os.cpu_count() or 1
+    print(f"[TRACE] Segmented encode of {os.path.basename(target_file)}: {len(segments)} segment(s), {workers} worker(s)")
+
+    work_dir = tempfile.mkdtemp(prefix=".segments_", dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            encoded = list(executor.map(
+                lambda segment: _encode_segment(xdelta_exe, source_file, target_file, segment, work_dir), segments))
+
+        header = {
+            "version": 1,
+            "source_size": source_size,
+            "target_size": target_size,
+            "segments": [{key: value for key, value in segment.items() if key not in ("delta_file", "seconds")}
+                         for segment in encoded],
+        }
+        header_bytes = json.dumps(header).encode()
+        with open(output_file, 'wb') as out:
+            out.write(SEGMENT_MAGIC)
+            out.write(struct.pack(">Q", len(header_bytes)))
+            out.write(header_bytes)
+            for segment in encoded:
+                with open(segment["delta_file"], 'rb') as delta:
+                    shutil.copyfileobj(delta, out, _COPY_CHUNK)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = time.monotonic() - start
+    delta_size = os.path.getsize(output_file)
+    print(f"[TRACE] Segmented delta written: {output_file} ({delta_size:,} bytes, {elapsed:.1f}s)")
+    return {
+        "output": output_file,
+        "delta_size": delta_size,
+        "segments": len(encoded),
+        "seconds": elapsed,
+        "segment_seconds": [round(segment["seconds"], 2) for segment in encoded],
+    }
+
+
+def read_container_header(container_file: str) -> tuple:
+    """Read a segmented delta container header.
+
+    Returns:
+        Tuple of (header dict, offset of the first segment delta)
+    """
+    with open(container_file, 'rb') as f:
+        if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"Not a segmented delta container: {container_file}")
+        (header_length,) = struct.unpack(">Q", f.read(8))
+        header = json.loads(f.read(header_length))
+    return header, len(SEGMENT_MAGIC) + 8 + header_length
+
+
+def is_segmented_delta(path: str) -> bool:
+    """Check whether a file is a segmented delta container."""
+    with open(path, 'rb') as f:
+        return f.read(len(SEGMENT_MAGIC)) == SEGMENT_MAGIC
+
+
+def _apply_segment(xdelta_exe: str, source_file: str, container_file: str, delta_offset: int,
+                   segment: dict, output_file: str, work_dir: str) -> None:
+    """Decode one segment and write it at its offset in the output image."""
+    prefix = os.path.join(work_dir, f"segment_{segment['index']:05d}")
+    window_file, delta_file, target_part = f"{prefix}.src", f"{prefix}.delta", f"{prefix}.tgt"
+    try:
+        _copy_range(source_file, segment["source_offset"], segment["source_length"], window_file)
+        _copy_range(container_file, delta_offset, segment["delta_length"], delta_file)
+        _run_xdelta([xdelta_exe, "-d", "-f", "-s", window_file, delta_file, target_part])
+
+        digest = hashlib.sha256()
+        fd = os.open(output_file, os.O_WRONLY)
+        try:
+            with open(target_part, 'rb') as part:
+                position = segment["target_offset"]
+                for chunk in iter(lambda: part.read(_COPY_CHUNK), b""):
+                    digest.update(chunk)
+                    os.pwrite(fd, chunk, position)
+                    position += len(chunk)
+        finally:
+            os.close(fd)
+        if digest.hexdigest() != segment["target_sha256"]:
+            raise ValueError(f"Segment {segment['index']} checksum mismatch")
+    finally:
+        for path in (window_file, delta_file, target_part):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def apply_segmented(source_file: str, container_file: str, output_file: str,
+                    workers: Optional[int] = None, xdelta_exe: Optional[str] = None) -> dict:
+    """Rebuild the full target image from a source image and a segmented delta container.
+
+    Args:
+        source_file: Source image path
+        container_file: Segmented delta container path
+        output_file: Path of the rebuilt target image
+        workers: Number of parallel xdelta3 processes (default: CPU count)
+        xdelta_exe: XDelta executable (default: discovered)
+
+    Returns:
+        Dictionary with output path, size, segment count and seconds
+    """
+    xdelta_exe = xdelta_exe or find_xdelta_executable()
+    if not xdelta_exe:
+        raise RuntimeError("XDelta executable not found. Please install xdelta3 or ensure it's in PATH.")
+
+    start = time.monotonic()
+    header, offset = read_container_header(container_file)
+    if os.path.getsize(source_file) != header["source_size"]:
+        raise ValueError(f"Source size mismatch: expected {header['source_size']} bytes")
+
+    delta_offsets = []
+    for segment in header["segments"]:
+        delta_offsets.append(offset)
+        offset += segment["delta_length"]
+
+    with open(output_file, 'wb') as out:
+        out.truncate(header["target_size"])
+
+    work_dir = tempfile.mkdtemp(prefix=".segments_", dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            list(executor.map(
+                lambda item: _apply_segment(xdelta_exe, source_file, container_file, item[0], item[1], output_file, work_dir),
+                zip(delta_offsets, header["segments"])))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = time.monotonic() - start
+    print(f"[TRACE] Segmented delta applied: {output_file} ({header['target_size']:,} bytes, {elapsed:.1f}s)")
+    return {"output": output_file, "target_size": header["target_size"],
+            "segments": len(header["segments"]), "seconds": elapsed}
+
+
+def benchmark_segmented(source_file: str, target_file: str, segment_sizes_mb: tuple = (128, 256, 512),
+                        overlap_mb: int = 64, workers: Optional[int] = None, work_dir: Optional[str] = None) -> str:
+    """Compare plain xdelta3 with segmented encoding on one image pair.
+
+    Runs a single-process xdelta3 encode, then a segmented encode per segment
+    size, and reports wall time, delta size, speedup and size overhead. Every
+    segmented container is also applied and compared with the target.
+
+    Returns:
+        Human-readable benchmark report
+    """
+    xdelta_exe = find_xdelta_executable()
+    if not xdelta_exe:
+        return "Error: XDelta executable not found. Please install xdelta3 or ensure it's in PATH."
+
+    work_dir = work_dir or tempfile.mkdtemp(prefix="segbench_")
+    os.makedirs(work_dir, exist_ok=True)
+
+    plain_delta = os.path.join(work_dir, "plain.delta")
+    start = time.monotonic()
+    _run_xdelta([xdelta_exe, "-e", "-f", "-s", source_file, target_file, plain_delta])
+    plain_seconds = time.monotonic() - start
+    plain_size = os.path.getsize(plain_delta)
+    os.remove(plain_delta)
+
+    target_digest = hashlib.sha256()
+    with open(target_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(_COPY_CHUNK), b""):
+            target_digest.update(chunk)
+
+    lines = [
+        f"Segmented delta benchmark: {os.path.basename(target_file)} ({os.path.getsize(target_file):,} bytes), "
+        f"workers={workers or os.cpu_count()}, overlap={overlap_mb} MiB",
+        f"  plain xdelta3:      {plain_seconds:8.1f}s  {plain_size:>14,} bytes",
+    ]
+    for segment_mb in segment_sizes_mb:
+        container = os.path.join(work_dir, f"seg_{segment_mb}.segdelta")
+        rebuilt = os.path.join(work_dir, f"seg_{segment_mb}.img")
+        encoded = encode_segmented(source_file, target_file, container, segment_mb * 1024 * 1024,
+                                   overlap_mb * 1024 * 1024, workers, xdelta_exe)
+        apply_segmented(source_file, container, rebuilt, workers, xdelta_exe)
+
+        rebuilt_digest = hashlib.sha256()
+        with open(rebuilt, 'rb') as f:
+            for chunk in iter(lambda: f.read(_COPY_CHUNK), b""):
+                rebuilt_digest.update(chunk)
+        verified = "ok" if rebuilt_digest.digest() == target_digest.digest() else "MISMATCH"
+        os.remove(container)
+        os.remove(rebuilt)
+
+        speedup = plain_seconds / encoded["seconds"] if encoded["seconds"] else float("inf")
+        overhead = (encoded["delta_size"] - plain_size) / plain_size if plain_size else 0.0
+        lines.append(f"  segmented {segment_mb:>5} MiB: {encoded['seconds']:8.1f}s  {encoded['delta_size']:>14,} bytes  "
+                     f"speedup x{speedup:.2f}  size {overhead:+.1%}  segments={encoded['segments']}  apply={verified}")
+
+    report = "\n".join(lines)
+    print(report)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Segmented parallel XDelta encoding")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    encode_parser = subparsers.add_parser("encode")
+    encode_parser.add_argument("source")
+    encode_parser.add_argument("target")
+    encode_parser.add_argument("output")
+    encode_parser.add_argument("--segment-mb", type=int, default=DEFAULT_SEGMENT_SIZE // (1024 * 1024))
+    encode_parser.add_argument("--overlap-mb", type=int, default=DEFAULT_OVERLAP // (1024 * 1024))
+    encode_parser.add_argument("--workers", type=int, default=None)
+    apply_parser = subparsers.add_parser("apply")
+    apply_parser.add_argument("source")
+    apply_parser.add_argument("container")
+    apply_parser.add_argument("output")
+    apply_parser.add_argument("--workers", type=int, default=None)
+    bench_parser = subparsers.add_parser("bench")
+    bench_parser.add_argument("source")
+    bench_parser.add_argument("target")
+    bench_parser.add_argument("--segment-mb", type=int, nargs="+", default=[128, 256, 512])
+    bench_parser.add_argument("--overlap-mb", type=int, default=64)
+    bench_parser.add_argument("--workers", type=int, default=None)
+    options = parser.parse_args()
+
+    if options.command == "encode":
+        print(encode_segmented(options.source, options.target, options.output, options.segment_mb * 1024 * 1024,
+                               options.overlap_mb * 1024 * 1024, options.workers))
+    elif options.command == "apply":
+        print(apply_segmented(options.source, options.container, options.output, options.workers))
+    else:
+        benchmark_segmented(options.source, options.target, tuple(options.segment_mb), options.overlap_mb, options.workers)
@@ -1,5 +1,5 @@
 from google.adk.agents.llm_agent import Agent
-from .Utils import untar_zip_files, validate_target_folders_with_partition, generate_config_xml, list_config_files, parse_config_xml, generate_xdelta
+from .Utils import preflight_disk_space, untar_zip_files, validate_target_folders_with_partition, generate_config_xml, list_config_files, parse_config_xml, generate_xdelta, prepare_multi_sheet_run, estimate_xdelta_run, generate_xdelta_pipelined, generate_auto_delta, generate_deltas_distributed, simulate_device_apply
 
 xdelta_tool = Agent(
     model='gemini-2.5-flash',
@@ -11,9 +11,13 @@ When called, you will receive information about:
 - source_path: Absolute path of source zip file
 - target_path: Absolute path of target zip file
 - ecu_type: ECU type/name
+- workspace (optional): Job workspace name. If given, pass it as the workspace argument to every tool call so this run's configs, deltas and statistics stay apart from other runs
 
 Your task:
-1. Use the untar_zip_files tool to extract source and target zip files
+1. Use the preflight_disk_space tool to check that the run fits on disk, then use the untar_zip_files tool to extract source and target zip files
+   - If the preflight fails, stop and report the space required and the checked locations
+   - Pass staging_root="auto" to untar_zip_files to extract into the staging root selected by the preflight
+   - untar_zip_files also accepts .tar, .tar.gz and .tar.xz archives ("-" reads a tar stream from standard input); they are streamed in one pass and only the partitions listed in the partition file are kept when ecu_type is given. The disk space preflight and staging_root="auto" need zip archives
 2. The tool will return the extracted directory paths - use these as the actual source and target paths
 3. Use validate_target_folders_with_partition tool to verify target folder structure matches partition file
 4. If validation fails, stop and return the error message
@@ -22,6 +26,7 @@ Your task:
    - If multiple sheets are found, ask user which partition sheet to use
    - Call again with the selected partition_sheet parameter
 6. If user wants to generate delta for multiple partition sheets, call generate_config_xml for each sheet separately
+   - If the user wants several sheets generated in one go (e.g. QNX and Android), call prepare_multi_sheet_run with the comma-separated sheets, source path, target path, ECU type, delta_tool "xdelta" and partition_files ("all" or a list), then transfer to multi_sheet_tool. It runs all sheets concurrently and returns a merged report
 7. After generating config files, provide the path(s) and ask user to review them
 8. When user confirms to generate delta:
    - Use list_config_files tool to find all config XML files in current directory (optional)
@@ -32,7 +37,12 @@ Your task:
      * Display the extracted partition names to the user
      * Proceed with delta generation using those partitions
    - Otherwise, use the specific partition names provided by the user
+   - Use estimate_xdelta_run with the same arguments (including secondary_compression, segmented and ext4_aware) to show the user the expected duration before starting
    - Use generate_xdelta tool with the partition names, source path, target path, and partition sheet name
+   - Report any regression alerts from the generate_xdelta result to the user
+   - Offer to run simulate_device_apply on the generated deltas to check that they apply within the device RAM and time budget; report any partitions flagged as over budget
+   - If the delta tool is "auto", use generate_auto_delta instead of generate_xdelta and report the backend chosen for each partition
+   - If the user wants delta generation to start while the archives are still being extracted (e.g. large archives or little disk space), use generate_xdelta_pipelined with the zip paths and partition sheet instead of untar_zip_files + generate_xdelta
    - The tool will validate that xdelta3 is installed and available
    - Execute XDelta commands for each partition using xdelta3 -e -s source target delta
 9. Print trace information: "[TRACE] XDelta tool called with:"
@@ -41,14 +51,23 @@ Your task:
 12. Print "ECU Type: <ecu_type>"
 13. Return status message of delta generation
 
+Tool results may be compact dictionaries (structured result mode). Check the status field ('ok', 'error' or 'needs_input') and the code field; the full human-readable output is in the file referenced by the log field.
+
 Available tools:
-- untar_zip_files: Extracts source and target zip files and returns extracted paths
+- simulate_device_apply: Replays generated deltas under the device memory cap (RamSize from the config) and reports peak memory, bytes read/written and estimated apply time per partition
+- generate_deltas_distributed: Runs delta generation on the workers of a delta coordinator (only when the user provides a coordinator URL) and reports per-job results
+- preflight_disk_space: Estimates the disk space of the run from the zip files and selects a staging root with enough free space
+- untar_zip_files: Extracts source and target zip or tar archives and returns extracted paths
 - validate_target_folders_with_partition: Validates target and source folder structure against partition file sheets
 - generate_config_xml: Generates config.xml based on partition file data (optional for XDelta). Use partition_sheet parameter to specify which sheet to process when multiple sheets exist
 - list_config_files: Lists all config XML files in current directory (optional)
 - parse_config_xml: Extracts all partition names from a config XML file. Returns comma-separated partition names
-- generate_xdelta: Generates XDelta files for specified partitions using xdelta3
+- prepare_multi_sheet_run: Stores a concurrent multi-sheet run; transfer to multi_sheet_tool afterwards
+- estimate_xdelta_run: Estimates the XDelta run time from the local run history
+- generate_xdelta_pipelined: Extracts partition pairs straight from the zip files and generates their XDelta files while extraction continues; extracted images are deleted once their delta is done (max_pending bounds how many pairs are on disk)
+- generate_auto_delta: Generates deltas choosing the cheapest available backend per partition (xdelta3, Redbend, full image copy) and reports the choice. Set verify=True to check each delta by applying it
+- generate_xdelta: Generates XDelta files for specified partitions using xdelta3. Set secondary_compression=True if the user wants the deltas compressed further (the smallest codec result is kept; a compressed delta ends in .xz, .bz2 or .gz and is restored with xz -d, bunzip2 or gunzip). Set segmented=True to encode very large partitions as parallel segments (<partition>.segdelta). Set ext4_aware=True to ignore unallocated blocks of raw ext4 images (block maps are written next to the deltas; the device rebuilds the image with free blocks zeroed, so do not use it for partitions verified by AVB/dm-verity hash trees). Set cleanup_inputs=True to delete each partition's extracted images once its delta is done. Set predict_full_image=True to predict each delta's size from sampled windows first and ship heavily changed partitions as full images (<partition>.full.img) without the full encode. The SHA-256 digests of the source images, target images and deltas are recorded in delta_output/artifact_manifest.json; report its path to the user
 
 Return a confirmation message that XDelta delta generation was initiated with the extracted paths and ECU type.''',
-    tools=[untar_zip_files, validate_target_folders_with_partition, generate_config_xml, list_config_files, parse_config_xml, generate_xdelta],
+    tools=[preflight_disk_space, untar_zip_files, validate_target_folders_with_partition, generate_config_xml, list_config_files, parse_config_xml, generate_xdelta, prepare_multi_sheet_run, estimate_xdelta_run, generate_xdelta_pipelined, generate_auto_delta, generate_deltas_distributed, simulate_device_apply],
 )
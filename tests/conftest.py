@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Import deltaGen_Agent from the checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
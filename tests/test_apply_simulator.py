@@ -0,0 +1,92 @@
+"""Device apply simulator: replays under the device memory cap."""
+import os
+import random
+import subprocess
+
+import pytest
+
+from deltaGen_Agent import apply_simulator, segmented_delta
+from deltaGen_Agent.Utils import find_xdelta_executable
+
+MIB = 1024 * 1024
+
+needs_xdelta = pytest.mark.skipif(find_xdelta_executable() is None, reason="xdelta3 is not installed")
+
+
+@pytest.fixture
+def images(tmp_path):
+    rng = random.Random(41)
+    source = bytearray(rng.randbytes(3 * MIB))
+    target = bytearray(source)
+    for offset in range(0, len(target), 300 * 1024):
+        target[offset:offset + 256] = rng.randbytes(256)
+    source_file, target_file = tmp_path / "source.img", tmp_path / "target.img"
+    source_file.write_bytes(bytes(source))
+    target_file.write_bytes(bytes(target))
+    (tmp_path / "out").mkdir()
+    return str(source_file), str(target_file), str(tmp_path / "out")
+
+
+def test_full_image_is_only_written(images):
+    source_file, target_file, out = images
+    full_image = os.path.join(out, "system.full.img")
+    os.link(target_file, full_image)
+    profile = apply_simulator.device_profile(ram_size=64 * MIB)
+    profile["in_place"]["system"] = True
+
+    report = apply_simulator.simulate_apply(source_file, apply_simulator.find_delta(out, "system"), profile, "system")
+
+    assert report["status"] == "ok" and report["within_memory"]
+    assert report["bytes_read"] == 3 * MIB and report["bytes_written"] == 2 * 3 * MIB
+    assert report["peak_memory_bytes"] is None and report["io_source"] == "model"
+
+
+@needs_xdelta
+def test_delta_replays_under_device_ram(images):
+    source_file, target_file, out = images
+    delta_file = os.path.join(out, "system.delta")
+    subprocess.run([find_xdelta_executable(), "-e", "-s", source_file, target_file, delta_file], check=True)
+
+    report = apply_simulator.simulate_apply(source_file, delta_file, apply_simulator.device_profile(), "system")
+
+    assert report["status"] == "ok" and report["within_memory"], report.get("error")
+    assert report["target_size"] == 3 * MIB
+    assert 0 < report["peak_memory_bytes"] <= apply_simulator.DEFAULT_RAM_SIZE
+
+
+@needs_xdelta
+def test_segmented_delta_replays_under_device_ram(images):
+    source_file, target_file, out = images
+    container = os.path.join(out, "system.segdelta")
+    segmented_delta.encode_segmented(source_file, target_file, container, segment_size=MIB, overlap=256 * 1024)
+
+    report = apply_simulator.simulate_apply(source_file, container, apply_simulator.device_profile(), "system")
+
+    assert report["status"] == "ok", report.get("error")
+    assert report["target_size"] == 3 * MIB
+
+
+@needs_xdelta
+def test_decoder_over_the_cap_fails(images):
+    source_file, target_file, out = images
+    delta_file = os.path.join(out, "system.delta")
+    subprocess.run([find_xdelta_executable(), "-e", "-s", source_file, target_file, delta_file], check=True)
+
+    report = apply_simulator.simulate_apply(source_file, delta_file, apply_simulator.device_profile(ram_size=MIB),
+                                            "system")
+
+    assert report["status"] == "failed" and not report["within_memory"]
+
+
+@needs_xdelta
+def test_cap_applies_to_the_segment_decoder_not_the_interpreter(images):
+    source_file, target_file, out = images
+    container = os.path.join(out, "system.segdelta")
+    segmented_delta.encode_segmented(source_file, target_file, container, segment_size=MIB, overlap=256 * 1024)
+
+    # Too small for xdelta3, but the replaying interpreter and its threads are not held to it
+    report = apply_simulator.simulate_apply(source_file, container, apply_simulator.device_profile(ram_size=32 * MIB),
+                                            "system")
+
+    assert report["status"] == "failed"
+    assert "xdelta3" in report["error"] and "thread" not in report["error"]
@@ -0,0 +1,55 @@
+"""Tar extraction with the ecu_type partition filter."""
+import io
+import os
+import tarfile
+
+import pytest
+
+pytest.importorskip("openpyxl")
+
+import openpyxl
+
+from deltaGen_Agent import Utils
+
+
+def _partition_workbook(path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "IVI"
+    sheet.append(["Partition_Name", "Partition_Filename"])
+    sheet.append(["system", "System.img"])
+    sheet.append(["vendor", "vendor.img"])
+    workbook.save(path)
+
+
+def _tar(path, mode, members):
+    with tarfile.open(path, mode) as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize("suffix, mode", [(".tar", "w"), (".tar.gz", "w:gz"), (".tar.xz", "w:xz")])
+def test_tar_extraction_keeps_listed_partitions(tmp_path, monkeypatch, suffix, mode):
+    monkeypatch.chdir(tmp_path)
+    _partition_workbook(tmp_path / "ECU_Partition_file.xlsx")
+    archives = {}
+    for role, system in (("source", b"old system"), ("target", b"new system")):
+        (tmp_path / role).mkdir()
+        archives[role] = str(tmp_path / role / f"build{suffix}")
+        # Archive names differ in case from the workbook (System.img, IVI)
+        _tar(archives[role], mode, {"build/ivi/system.img": system, "build/ivi/vendor.img": b"vendor",
+                                    "build/ivi/debug.img": b"debug", "build/README.txt": b"notes"})
+
+    result = Utils.untar_zip_files(archives["source"], archives["target"], ecu_type="ECU")
+
+    assert result["status"] == "success"
+    for role, system in (("source", b"old system"), ("target", b"new system")):
+        tree = result[f"{role}_path"]
+        assert sorted(os.listdir(os.path.join(tree, "ivi"))) == ["system.img", "vendor.img"]
+        assert open(os.path.join(tree, "ivi", "system.img"), "rb").read() == system
+        assert not os.path.exists(os.path.join(tree, "README.txt"))
+    assert result["filtered_members"] == {"source": 2, "target": 2}
+    # vendor.img is identical in both builds and linked instead of rewritten
+    assert result["deduplicated_files"] == 1
@@ -0,0 +1,29 @@
+"""Artifact manifest updates from several processes."""
+import json
+import os
+import subprocess
+import sys
+
+from deltaGen_Agent import artifact_hashing
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_WRITER = """
+import sys
+from deltaGen_Agent import artifact_hashing
+output_dir, writer = sys.argv[1], sys.argv[2]
+for index in range(25):
+    record = {"path": f"{output_dir}/{writer}-{index}.delta", "sha256": "0" * 64, "size": index}
+    artifact_hashing.update_manifest(output_dir, [record], "generate_xdelta")
+"""
+
+
+def test_concurrent_processes_keep_every_record(tmp_path):
+    writers = [subprocess.Popen([sys.executable, "-c", _WRITER, str(tmp_path), f"worker{n}"], cwd=REPO_ROOT)
+               for n in range(4)]
+    assert [writer.wait() for writer in writers] == [0] * 4
+
+    with open(tmp_path / artifact_hashing.MANIFEST_FILENAME) as f:
+        artifacts = json.load(f)["artifacts"]
+    assert len(artifacts) == 100
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
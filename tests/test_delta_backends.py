@@ -0,0 +1,87 @@
+"""Backend selection of the auto delta tool."""
+import os
+import random
+
+import pytest
+
+from deltaGen_Agent import delta_backends, job_workspace, run_history
+from deltaGen_Agent.Utils import find_xdelta_executable
+
+MIB = 1024 * 1024
+
+
+@pytest.fixture
+def images(tmp_path):
+    rng = random.Random(38)
+    source = rng.randbytes(4 * MIB)
+    # An insertion at the start shifts every later block of the target
+    target = rng.randbytes(4096) + source
+    source_file, target_file = tmp_path / "source.img", tmp_path / "target.img"
+    source_file.write_bytes(source)
+    target_file.write_bytes(target)
+    return str(source_file), str(target_file)
+
+
+@pytest.fixture
+def redbend_workspace(tmp_path, monkeypatch):
+    (tmp_path / "vRapidMobileCMD-Linux.exe").write_text("")
+    (tmp_path / "config_IVI.xml").write_text(
+        "<Config><Partition><PartitionName>system</PartitionName></Partition></Config>")
+    monkeypatch.setenv(run_history.HISTORY_DB_ENV, str(tmp_path / "history.sqlite"))
+    with job_workspace.use(job_workspace.Workspace(str(tmp_path))):
+        yield tmp_path
+
+
+def test_redbend_without_history_is_not_selected(images, redbend_workspace):
+    selection = delta_backends.select_backend(*images, "system", "IVI", ["redbend", "full"])
+    assert selection["estimates"]["redbend"]["delta_bytes"] is None
+    assert selection["backend"] == "full"
+
+
+def test_redbend_selected_from_its_delta_ratio(images, redbend_workspace):
+    for _ in range(3):
+        run_history.record_run("system", "IVI", "redbend", 4 * MIB, 4 * MIB, {"auto": True}, 10.0, None,
+                               MIB // 10, "success")
+    selection = delta_backends.select_backend(*images, "system", "IVI", ["redbend", "full"])
+    assert selection["estimates"]["redbend"]["basis"] == "run history"
+    assert selection["backend"] == "redbend"
+
+    # A poor ratio in the history makes the full image cheaper
+    for _ in range(5):
+        run_history.record_run("system", "IVI", "redbend", 4 * MIB, 4 * MIB, {"auto": True}, 10.0, None,
+                               5 * MIB, "success")
+    assert delta_backends.select_backend(*images, "system", "IVI", ["redbend", "full"])["backend"] == "full"
+
+
+@pytest.mark.skipif(find_xdelta_executable() is None, reason="xdelta3 is not installed")
+def test_shifted_image_prefers_xdelta(images, tmp_path, monkeypatch):
+    monkeypatch.setenv(run_history.HISTORY_DB_ENV, str(tmp_path / "history.sqlite"))
+    selection = delta_backends.select_backend(*images, "system", "IVI", ["xdelta", "full"])
+    estimate = selection["estimates"]["xdelta"]
+    assert estimate["basis"] == "sampled encode"
+    assert estimate["delta_bytes"] < os.path.getsize(images[1]) // 4
+    assert selection["backend"] == "xdelta"
+
+
+def test_poor_prediction_ships_full_image(tmp_path, monkeypatch):
+    from deltaGen_Agent import Utils
+
+    for role, data in (("source", b"old" * 1000), ("target", b"new" * 1000)):
+        (tmp_path / role / "IVI").mkdir(parents=True)
+        (tmp_path / role / "IVI" / "system.img").write_bytes(data)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv(run_history.HISTORY_DB_ENV, str(tmp_path / "history.sqlite"))
+    monkeypatch.setenv(delta_backends.FULL_IMAGE_THRESHOLD_ENV, "0.5")
+    monkeypatch.setenv("DELTAGEN_RESULT_MODE", "structured")
+    # No xdelta3 needed: the prediction decides and the encode is skipped
+    monkeypatch.setattr(Utils, "find_xdelta_executable", lambda: "xdelta3")
+    monkeypatch.setattr(delta_backends, "predict_delta", lambda source, target: {
+        "predicted_delta_bytes": 2900, "ratio": 0.6, "predicted_seconds": 1.0, "prediction_seconds": 0.1})
+
+    result = Utils.generate_xdelta("system", str(tmp_path / "source"), str(tmp_path / "target"), "IVI",
+                                   output_path=str(tmp_path / "out"), predict_full_image=True)
+
+    record, = result["partitions"]
+    assert record["status"] == "success" and record["full_image"] is True
+    assert record["delta_file"] == str(tmp_path / "out" / "system.full.img")
+    assert (tmp_path / "out" / "system.full.img").read_bytes() == b"new" * 1000
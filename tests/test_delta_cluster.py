@@ -0,0 +1,175 @@
+"""Delta cluster: lease expiry and requeue, access control of the HTTP coordinator."""
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from deltaGen_Agent import delta_cluster
+
+TOKEN = "test-token"
+
+
+def _coordinator(tmp_path, max_attempts=2):
+    # A long lease keeps the background reaper out of the way; the tests expire leases themselves
+    (tmp_path / "src" / "IVI").mkdir(parents=True)
+    (tmp_path / "dst" / "IVI").mkdir(parents=True)
+    (tmp_path / "src" / "IVI" / "system.img").write_bytes(b"source")
+    (tmp_path / "dst" / "IVI" / "system.img").write_bytes(b"target")
+    return delta_cluster.DeltaCoordinator(lease_seconds=3600, max_attempts=max_attempts,
+                                          input_roots=[str(tmp_path)], output_roots=[str(tmp_path / "out")])
+
+
+def _batch_args(tmp_path, **extra):
+    return dict({"partition_files": "system", "source_path": str(tmp_path / "src"),
+                 "target_path": str(tmp_path / "dst"), "partition_sheet": "IVI"}, **extra)
+
+
+def _expire(coordinator, job_id):
+    coordinator.jobs[job_id]["lease_expires"] = 0
+    coordinator._reap()
+
+
+def test_expired_lease_is_requeued_then_fails(tmp_path):
+    coordinator = _coordinator(tmp_path)
+    coordinator.submit_batch("generate_xdelta", _batch_args(tmp_path))
+    first = coordinator.register("first")["worker_id"]
+    second = coordinator.register("second")["worker_id"]
+
+    job = coordinator.lease(first)["job"]
+    _expire(coordinator, job["id"])
+    assert coordinator.jobs[job["id"]]["status"] == "queued"
+    assert coordinator.workers[first]["status"] == "lost"
+    assert coordinator.lease(first) == {"job": None, "reregister": True}
+
+    retry = coordinator.lease(second)["job"]
+    assert retry["id"] == job["id"] and retry["attempts"] == 2
+    assert retry["lease_id"] != job["lease_id"]
+    # The lost attempt can neither report nor write
+    assert not coordinator.complete(first, job["id"], "success", {}, None, job["lease_id"])
+    assert coordinator.output_dir(job["id"], first, job["lease_id"]) is None
+    assert coordinator.output_dir(job["id"], second, retry["lease_id"]) == str(tmp_path / "out" / "delta_output")
+
+    _expire(coordinator, job["id"])
+    failed = coordinator.jobs[job["id"]]
+    assert failed["status"] == "failed" and failed["result"]["code"] == "max_attempts"
+
+
+def test_batches_are_confined_to_the_configured_roots(tmp_path):
+    coordinator = _coordinator(tmp_path)
+    with pytest.raises(ValueError, match="outside"):
+        coordinator.submit_batch("generate_xdelta", _batch_args(tmp_path, output_path="/etc"))
+    with pytest.raises(ValueError, match="outside"):
+        coordinator.submit_batch("generate_xdelta", _batch_args(tmp_path, source_path="/"))
+    with pytest.raises(ValueError, match="Invalid partition_sheet"):
+        coordinator.submit_batch("generate_xdelta", _batch_args(tmp_path, partition_sheet=".."))
+    with pytest.raises(ValueError, match="Invalid item"):
+        coordinator.submit_batch("generate_xdelta", _batch_args(tmp_path, partition_files="../../etc/passwd"))
+    with pytest.raises(ValueError, match="Unsupported"):
+        coordinator.submit_batch("generate_delta", {"config_file_names": "config.xml", "shared_root": "/tmp"})
+
+
+@pytest.fixture
+def server(tmp_path):
+    coordinator = _coordinator(tmp_path)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), delta_cluster._make_handler(coordinator, TOKEN))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield coordinator, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _put(url, data, lease):
+    request = urllib.request.Request(url, data=data, method="PUT",
+                                     headers=delta_cluster._headers(lease, **{"Content-Length": str(len(data))}))
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+
+def test_http_requires_token_and_live_lease(server, tmp_path, monkeypatch):
+    coordinator, url = server
+    monkeypatch.delenv(delta_cluster.CLUSTER_TOKEN_ENV, raising=False)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        delta_cluster._request(f"{url}/status", method="GET")
+    assert error.value.code == 401
+
+    monkeypatch.setenv(delta_cluster.CLUSTER_TOKEN_ENV, TOKEN)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        delta_cluster.submit_batch(url, "generate_xdelta", _batch_args(tmp_path, output_path=str(tmp_path / "src")))
+    assert error.value.code == 400
+    assert "outside" in json.loads(error.value.read())["error"]
+
+    delta_cluster.submit_batch(url, "generate_xdelta", _batch_args(tmp_path))
+    stale_worker = delta_cluster._request(f"{url}/workers", {"name": "stale"})["worker_id"]
+    stale = delta_cluster._request(f"{url}/lease", {"worker_id": stale_worker})["job"]
+    _expire(coordinator, stale["id"])
+    live_worker = delta_cluster._request(f"{url}/workers", {"name": "live"})["worker_id"]
+    live = delta_cluster._request(f"{url}/lease", {"worker_id": live_worker})["job"]
+
+    output = f"{url}/jobs/{live['id']}/outputs/system.xdelta"
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _put(output, b"stale", (stale_worker, stale["lease_id"]))
+    assert error.value.code == 409
+    assert _put(output, b"delta", (live_worker, live["lease_id"])) == 201
+    assert (tmp_path / "out" / "delta_output" / "system.xdelta").read_bytes() == b"delta"
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        _put(f"{url}/jobs/{live['id']}/outputs/artifact_manifest.json", b"{}", (live_worker, live["lease_id"]))
+    assert error.value.code == 400
+
+    local = tmp_path / "worker" / "source.img"
+    delta_cluster._download(f"{url}/jobs/{live['id']}/inputs/source", str(local), (live_worker, live["lease_id"]))
+    assert local.read_bytes() == b"source"
+    with pytest.raises(urllib.error.HTTPError) as error:
+        delta_cluster._download(f"{url}/jobs/{live['id']}/inputs/source", str(local), (stale_worker, stale["lease_id"]))
+    assert error.value.code == 404
+
+
+def test_streamed_hash_records_are_merged_on_the_coordinator(tmp_path):
+    coordinator = _coordinator(tmp_path)
+    coordinator.submit_batch("generate_xdelta", _batch_args(tmp_path))
+    worker = coordinator.register("worker")["worker_id"]
+    job = coordinator.lease(worker)["job"]
+    output_dir = job["args"]["output_path"]
+    artifacts = [
+        {"path": job["args"]["source_path"] + "/IVI/system.img", "sha256": "a" * 64, "role": "source"},
+        {"path": output_dir + "/system.delta", "sha256": "b" * 64, "role": "delta"},
+        # Paths outside the job's inputs and output directory are not taken
+        {"path": "/tmp/job_x/output/system.delta", "sha256": "c" * 64, "role": "delta"},
+    ]
+
+    assert coordinator.complete(worker, job["id"], "success", {}, None, job["lease_id"], artifacts)
+
+    with open(os.path.join(output_dir, "artifact_manifest.json")) as f:
+        manifest = json.load(f)["artifacts"]
+    assert sorted(manifest) == sorted(record["path"] for record in artifacts[:2])
+    assert manifest[output_dir + "/system.delta"]["tool"] == "generate_xdelta"
+
+
+def test_worker_keeps_its_result_through_a_coordinator_outage(monkeypatch):
+    reports = []
+    leases = iter([{"job": {"id": "j1", "lease_id": "l1", "tool": "generate_xdelta", "item": "system",
+                            "attempts": 1}},
+                   {"job": None, "idle": True}])
+
+    def request(url, payload=None, method="POST", timeout=60):
+        if url.endswith("/workers"):
+            return {"worker_id": "w1", "lease_seconds": 3600}
+        if url.endswith("/lease"):
+            return next(leases)
+        reports.append(payload)
+        if len(reports) == 1:
+            raise urllib.error.URLError("connection refused")
+        return {"accepted": True}
+
+    monkeypatch.setattr(delta_cluster, "_request", request)
+    monkeypatch.setattr(delta_cluster, "_run_job", lambda *args: ("success", {"status": "ok"}, None, None))
+    # run_worker switches the process to structured results; restore the mode afterwards
+    monkeypatch.setenv("DELTAGEN_RESULT_MODE", "structured")
+
+    assert delta_cluster.run_worker("http://coordinator", poll_seconds=0, exit_when_idle=True) == 1
+    assert len(reports) == 2 and reports[1]["lease_id"] == "l1" and reports[1]["status"] == "success"
@@ -0,0 +1,41 @@
+"""Overlapped extraction: partition pairs reach the delta workers intact."""
+import os
+import zipfile
+
+from deltaGen_Agent import Utils, delta_pipeline
+
+
+def _zip(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("image/IVI/system.img", data)
+    return str(path)
+
+
+def test_stale_hardlink_from_earlier_run_is_not_written_through(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source_zip = _zip(tmp_path / "Source" / "Source.zip", b"old system")
+    target_zip = _zip(tmp_path / "Target" / "Target.zip", b"new system")
+
+    # An earlier run with identical images left the target linked to the source
+    source_root, target_root = Utils._extraction_paths(source_zip, target_zip)
+    stale_source = os.path.join(source_root, "IVI", "system.img")
+    os.makedirs(os.path.dirname(stale_source))
+    with open(stale_source, "wb") as handle:
+        handle.write(b"earlier")
+    os.makedirs(os.path.join(target_root, "IVI"))
+    os.link(stale_source, os.path.join(target_root, "IVI", "system.img"))
+
+    seen = {}
+
+    def generate_xdelta(partition, source_path, target_path, partition_sheet, **kwargs):
+        for role, root in (("source", source_path), ("target", target_path)):
+            with open(os.path.join(root, partition_sheet, f"{partition}.img"), "rb") as handle:
+                seen[role] = handle.read()
+        return {"status": "ok", "succeeded": 1}
+
+    monkeypatch.setattr(Utils, "generate_xdelta", generate_xdelta)
+    result = delta_pipeline.run_pipeline(source_zip, target_zip, "IVI")
+
+    assert result["partitions"][0]["status"] == "success"
+    assert seen == {"source": b"old system", "target": b"new system"}
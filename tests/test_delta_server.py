@@ -0,0 +1,61 @@
+"""Job server: reuse and serialization of archive extractions."""
+import os
+import time
+import zipfile
+
+from deltaGen_Agent import Utils, delta_server
+
+
+def _archives(tmp_path):
+    archives = {}
+    for role in ("source", "target"):
+        (tmp_path / role).mkdir()
+        archives[f"{role}_zip_path"] = str(tmp_path / role / "image.zip")
+        with zipfile.ZipFile(archives[f"{role}_zip_path"], "w") as archive:
+            archive.writestr("image/IVI/system.img", f"{role} system")
+    return archives
+
+
+def _run(server, args, count=1):
+    jobs = [server.submit("untar_zip_files", args)["id"] for _ in range(count)]
+    deadline = time.monotonic() + 30
+    while any(server.get(job)["status"] in ("queued", "running") for job in jobs):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    return [server.get(job)["result"] for job in jobs]
+
+
+def test_extraction_with_deleted_images_is_not_reused(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = delta_server.DeltaJobServer()
+    args = _archives(tmp_path)
+
+    first, second = _run(server, args, 2)
+    assert "cached" not in first and second["cached"]
+
+    # What generate_xdelta(cleanup_inputs=True) does to the extracted images
+    os.remove(os.path.join(first["source_path"], "IVI", "system.img"))
+    again, = _run(server, args)
+    assert "cached" not in again
+    assert os.path.isfile(os.path.join(again["source_path"], "IVI", "system.img"))
+
+
+def test_concurrent_extractions_of_the_same_archives_run_one_at_a_time(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = delta_server.DeltaJobServer(workers=2)
+    args = _archives(tmp_path)
+    running, overlaps, calls = [], [], []
+
+    def untar_zip_files(**kwargs):
+        running.append(1)
+        overlaps.append(len(running))
+        calls.append(kwargs)
+        time.sleep(0.2)
+        running.pop()
+        return {"status": "success", "source_path": str(tmp_path / "source"), "target_path": str(tmp_path / "target")}
+
+    monkeypatch.setattr(Utils, "untar_zip_files", untar_zip_files)
+    results = _run(server, args, 2)
+
+    assert overlaps == [1] and len(calls) == 1
+    assert sorted(bool(result.get("cached")) for result in results) == [False, True]
@@ -0,0 +1,56 @@
+"""Cleanup of extracted images: only trees extracted by the tool are pruned as a whole."""
+import os
+import zipfile
+
+from deltaGen_Agent import Utils, disk_space
+
+
+def _write(path, data=b"image"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as handle:
+        handle.write(data)
+    return str(path)
+
+
+def test_user_directory_keeps_everything_but_the_image(tmp_path):
+    build = tmp_path / "builds" / "v1"
+    image = _write(build / "IVI" / "system.img")
+    _write(build / ".git" / "HEAD", b"ref: refs/heads/main\n")
+    _write(build / ".notes", b"keep me")
+
+    assert disk_space.remove_image_files([image]) == len(b"image")
+
+    assert not os.path.exists(image)
+    assert not (build / "IVI").exists()
+    assert (build / ".git" / "HEAD").read_bytes() == b"ref: refs/heads/main\n"
+    assert (build / ".notes").exists()
+
+
+def test_user_sheet_directory_with_hidden_files_is_kept(tmp_path):
+    build = tmp_path / "build"
+    image = _write(build / "IVI" / "system.img")
+    _write(build / "IVI" / ".keep", b"")
+
+    disk_space.remove_image_files([image])
+
+    assert (build / "IVI" / ".keep").exists()
+
+
+def test_extracted_tree_is_removed_once_empty(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archives = {}
+    for role in ("source", "target"):
+        (tmp_path / role).mkdir()
+        archives[role] = str(tmp_path / role / "image.zip")
+        with zipfile.ZipFile(archives[role], "w") as archive:
+            archive.writestr("image/IVI/system.img", f"{role} system")
+            archive.writestr("image/IVI/boot.img", f"{role} boot")
+    result = Utils.untar_zip_files(archives["source"], archives["target"])
+    source_path, target_path = result["source_path"], result["target_path"]
+    assert disk_space.is_extracted_tree(source_path) and disk_space.is_extracted_tree(target_path)
+
+    disk_space.remove_partition_images(source_path, target_path, "IVI", ["system"])
+    assert os.path.isfile(os.path.join(source_path, "IVI", "boot.img"))
+
+    disk_space.remove_partition_images(source_path, target_path, "IVI", ["boot"])
+    assert not os.path.exists(source_path) and not os.path.exists(target_path)
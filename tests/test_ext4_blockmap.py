@@ -0,0 +1,115 @@
+"""ext4 block map parsing and masking of small mke2fs -d images."""
+import os
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from deltaGen_Agent import ext4_blockmap
+
+pytestmark = pytest.mark.skipif(not (shutil.which("mke2fs") and shutil.which("debugfs")),
+                                reason="e2fsprogs is not installed")
+
+
+def _debugfs(image, request):
+    return subprocess.run(["debugfs", "-R", request, image], capture_output=True, text=True, check=True).stdout
+
+
+def _make_image(tmp_path, block_size):
+    content = tmp_path / "content"
+    content.mkdir()
+    (content / "data.bin").write_bytes(os.urandom(300 * 1024))
+    (content / "etc").mkdir()
+    (content / "etc" / "build.prop").write_text("ro.build.version=1\n")
+    image = str(tmp_path / f"system_{block_size}.img")
+    subprocess.run(["mke2fs", "-q", "-F", "-t", "ext4", "-b", str(block_size), "-d", str(content), image, "8M"],
+                   check=True, capture_output=True)
+    return image
+
+
+@pytest.mark.parametrize("block_size", [1024, 4096])
+def test_layout_matches_block_bitmaps(tmp_path, block_size):
+    image = _make_image(tmp_path, block_size)
+    layout = ext4_blockmap.read_ext4_layout(image)
+
+    assert layout["block_size"] == block_size
+    assert layout["blocks_count"] * block_size == os.path.getsize(image)
+    assert 0 < layout["allocated_blocks"] < layout["blocks_count"]
+
+    def allocated(block):
+        return any(start <= block < start + count for start, count in layout["allocated"])
+
+    # Every block of a file is in an allocated extent
+    blocks = [int(b) for b in _debugfs(image, "blocks /data.bin").split()]
+    assert blocks and all(allocated(block) for block in blocks)
+
+    # ... and the parsed extents agree with the filesystem's own bitmaps
+    # Per-group lines are indented; the unindented one is the superblock's free count
+    dump = subprocess.run(["dumpe2fs", image], capture_output=True, text=True).stdout
+    free_ranges = re.findall(r"^\s+Free blocks: (.*)$", dump, re.MULTILINE)
+    free = set()
+    for line in free_ranges:
+        for part in filter(None, (p.strip() for p in line.split(','))):
+            first, _, last = part.partition('-')
+            free.update(range(int(first), int(last or first) + 1))
+    assert layout["allocated_blocks"] == layout["blocks_count"] - len(free)
+    assert not any(allocated(block) for block in free)
+
+
+def test_masked_copy_keeps_files(tmp_path):
+    image = _make_image(tmp_path, 4096)
+    layout = ext4_blockmap.read_ext4_layout(image)
+    masked = str(tmp_path / "masked.img")
+    ext4_blockmap.mask_unallocated(image, masked, layout)
+
+    assert os.path.getsize(masked) == os.path.getsize(image)
+    for name in ("data.bin", "etc/build.prop"):
+        original, copy = tmp_path / "original.out", tmp_path / "masked.out"
+        _debugfs(image, f"dump /{name} {original}")
+        _debugfs(masked, f"dump /{name} {copy}")
+        assert copy.read_bytes() == original.read_bytes() == (tmp_path / "content" / name).read_bytes()
+
+
+def test_non_ext4_image_is_skipped(tmp_path):
+    image = tmp_path / "boot.img"
+    image.write_bytes(b"ANDROID!" + bytes(64 * 1024))
+    assert ext4_blockmap.read_ext4_layout(str(image)) is None
+
+
+@pytest.mark.skipif(not shutil.which("xdelta3"), reason="xdelta3 is not installed")
+def test_applied_image_matches_recorded_masked_digest(tmp_path, monkeypatch):
+    import json
+
+    from deltaGen_Agent import Utils, artifact_hashing
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DELTAGEN_RESULT_MODE", "structured")
+    images = {}
+    for role in ("source", "target"):
+        (tmp_path / role).mkdir()
+        image = _make_image(tmp_path / role, 4096)
+        layout = ext4_blockmap.read_ext4_layout(image)
+        # Stale data in a free block, as left behind by a build
+        free_block = next(block for block in range(layout["blocks_count"]) if not any(
+            start <= block < start + count for start, count in layout["allocated"]))
+        with open(image, "r+b") as f:
+            f.seek(free_block * 4096)
+            f.write(os.urandom(4096))
+        (tmp_path / role / "IVI").mkdir()
+        images[role] = str(tmp_path / role / "IVI" / "system.img")
+        os.rename(image, images[role])
+
+    result = Utils.generate_xdelta("system", str(tmp_path / "source"), str(tmp_path / "target"), "IVI",
+                                   output_path=str(tmp_path / "out"), ext4_aware=True)
+    assert result["status"] == "ok"
+    applied_digest = result["partitions"][0]["applied_target_sha256"]
+
+    applied = ext4_blockmap.apply_masked_delta(images["source"], str(tmp_path / "out" / "system.delta"),
+                                               str(tmp_path / "out" / "system.blockmap.json"),
+                                               str(tmp_path / "applied.img"))
+    with open(tmp_path / "out" / artifact_hashing.MANIFEST_FILENAME) as f:
+        target_entry = json.load(f)["artifacts"][images["target"]]
+    assert applied["sha256"] == applied_digest == target_entry["applied_sha256"]
+    assert target_entry["sha256"] != applied_digest
+    assert not (tmp_path / "out" / ".ext4_masked").exists()
@@ -0,0 +1,36 @@
+"""Cold import of the utilities stays fast and does not load ADK or openpyxl."""
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds; override with DELTAGEN_IMPORT_BUDGET on slow CI hosts
+IMPORT_BUDGET = float(os.environ.get("DELTAGEN_IMPORT_BUDGET", "1.0"))
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import deltaGen_Agent.Utils
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def _cold_import() -> dict:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.run([sys.executable, "-c", _PROBE], cwd=REPO_ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_utils_import_skips_heavy_dependencies():
+    modules = _cold_import()["modules"]
+    assert not [name for name in modules if name == "google.adk" or name.startswith("google.adk.")]
+    assert "openpyxl" not in modules
+
+
+def test_utils_import_within_budget():
+    seconds = _cold_import()["seconds"]
+    assert seconds < IMPORT_BUDGET, f"import deltaGen_Agent.Utils took {seconds:.3f}s (budget {IMPORT_BUDGET}s)"
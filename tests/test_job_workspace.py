@@ -0,0 +1,53 @@
+"""Job workspaces: confinement of workspace arguments and per-job extraction."""
+import os
+import zipfile
+
+import pytest
+
+from deltaGen_Agent import Utils, job_workspace
+
+
+def test_absolute_workspace_must_be_under_jobs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    outside = tmp_path / "elsewhere"
+    with pytest.raises(ValueError, match="outside"):
+        job_workspace.resolve(str(outside))
+    with pytest.raises(ValueError, match="outside"):
+        job_workspace.resolve(str(tmp_path / "jobs" / ".." / "elsewhere"))
+    assert not outside.exists()
+    with pytest.raises(ValueError, match="Invalid workspace name"):
+        job_workspace.resolve("..")
+
+    workspace = job_workspace.resolve(str(tmp_path / "jobs" / "build-42"))
+    assert workspace.root == str(tmp_path / "jobs" / "build-42") and workspace.job_id == "build-42"
+    assert job_workspace.resolve("build-42").root == workspace.root
+
+
+def test_job_extracts_same_named_archives_apart(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    archives = {}
+    for role in ("source", "target"):
+        (tmp_path / role).mkdir()
+        archives[role] = str(tmp_path / role / "image.zip")
+        with zipfile.ZipFile(archives[role], "w") as archive:
+            archive.writestr("image/IVI/system.img", f"{role} system")
+
+    result = Utils.untar_zip_files(archives["source"], archives["target"], workspace="job-1")
+
+    assert result["status"] == "success"
+    assert result["source_path"] != result["target_path"]
+    for role in ("source", "target"):
+        assert result[f"{role}_path"].startswith(str(tmp_path / "jobs" / "job-1"))
+        with open(os.path.join(result[f"{role}_path"], "IVI", "system.img")) as f:
+            assert f.read() == f"{role} system"
+
+
+def test_invalid_workspace_is_a_tool_error(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    result = Utils.generate_xdelta("system", str(tmp_path), str(tmp_path), "IVI", workspace="../../etc")
+    assert result.startswith("Error: Invalid workspace name")
+
+    monkeypatch.setenv("DELTAGEN_RESULT_MODE", "structured")
+    result = Utils.list_config_files(workspace=str(tmp_path / "elsewhere"))
+    assert result["status"] == "error" and result["code"] == "invalid_workspace"
+    assert not (tmp_path / "elsewhere").exists()
@@ -0,0 +1,70 @@
+"""Run history: option-aware regression checks and read-only lookups."""
+import os
+
+from deltaGen_Agent import run_history
+
+EXT4 = {"ext4_aware": True, "secondary_compression": False, "segmented": False}
+PLAIN = {"ext4_aware": False, "secondary_compression": False, "segmented": False}
+
+
+def _record(db_path, options, duration, delta_size):
+    run_history.record_run("system", "IVI", "xdelta", 1000, 1000, options, duration, None, delta_size,
+                           "success", db_path=db_path)
+
+
+def test_lookups_do_not_create_database(tmp_path):
+    db_path = str(tmp_path / "history.sqlite")
+    assert run_history.estimate_duration("system", "IVI", "xdelta", 1000, db_path) is None
+    assert run_history.check_regression("system", "IVI", "xdelta", 1000, 1.0, 10, db_path=db_path, options=PLAIN) == []
+    assert not os.path.exists(db_path)
+
+
+def test_regression_only_compares_same_options(tmp_path):
+    db_path = str(tmp_path / "history.sqlite")
+    for _ in range(3):
+        _record(db_path, EXT4, 10.0, 100)
+
+    # A plain run is slower with a larger delta, but has no history of its own
+    assert run_history.check_regression("system", "IVI", "xdelta", 1000, 40.0, 600,
+                                        db_path=db_path, options=PLAIN) == []
+    alerts = run_history.check_regression("system", "IVI", "xdelta", 1000, 40.0, 600,
+                                          db_path=db_path, options=EXT4)
+    assert len(alerts) == 2
+
+
+def test_estimate_prefers_same_options(tmp_path):
+    db_path = str(tmp_path / "history.sqlite")
+    _record(db_path, EXT4, 10.0, 100)
+    _record(db_path, PLAIN, 40.0, 600)
+    assert run_history.estimate_duration("system", "IVI", "xdelta", 1000, db_path, options=EXT4) == 10.0
+    assert run_history.estimate_duration("system", "IVI", "xdelta", 1000, db_path, options=PLAIN) == 40.0
+
+
+def test_redbend_configs_run_longest_first(tmp_path, monkeypatch):
+    from deltaGen_Agent import Utils
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DELTAGEN_RESULT_MODE", "structured")
+    monkeypatch.setenv(run_history.HISTORY_DB_ENV, str(tmp_path / "history.sqlite"))
+    # Stand-in for the Redbend executable: appends the config it was given to a log
+    redbend = tmp_path / "vRapidMobileCMD-Linux.exe"
+    redbend.write_text(f"#!/bin/sh\necho \"$2\" >> {tmp_path}/order.log\n")
+    redbend.chmod(0o755)
+    for name, size in (("small", 1000), ("large", 8000)):
+        for role in ("source", "target"):
+            (tmp_path / f"{name}_{role}.img").write_bytes(b"\0" * size)
+        (tmp_path / f"config_{name}.xml").write_text(
+            f"<Config><ComponentDeltaFileName>{name}.mld</ComponentDeltaFileName><Partition>"
+            f"<PartitionName>{name}</PartitionName><SourceVersion>{tmp_path}/{name}_source.img</SourceVersion>"
+            f"<TargetVersion>{tmp_path}/{name}_target.img</TargetVersion></Partition></Config>")
+        # Same throughput for both configs: the larger one takes longer
+        run_history.record_run(f"config_{name}.xml", None, "redbend", size, size, {"partitions": [name]},
+                               size / 1000, None, None, "success")
+
+    result = Utils.generate_delta("config_small.xml,config_large.xml")
+
+    assert result["status"] == "ok"
+    assert result["order"] == ["config_large.xml", "config_small.xml"]
+    assert result["estimated_seconds"] == 9.0
+    assert [line.rsplit("=", 1)[-1].strip() for line in (tmp_path / "order.log").read_text().splitlines()] == \
+        [str(tmp_path / "config_large.xml"), str(tmp_path / "config_small.xml")]
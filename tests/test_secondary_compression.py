@@ -0,0 +1,42 @@
+"""Secondary compression of delta outputs and restoring them."""
+import os
+
+import pytest
+
+from deltaGen_Agent import Utils
+
+
+def test_compress_then_decompress_restores_the_delta(tmp_path):
+    # Compressible, but not trivially: repeated pseudo-random blocks
+    data = os.urandom(4096) * 64 + b"tail"
+    delta_file = str(tmp_path / "system.delta")
+    with open(delta_file, "wb") as f:
+        f.write(data)
+
+    record = Utils.compress_delta_outputs([delta_file], time_budget_seconds=60)[delta_file]
+
+    assert record["codec"] in Utils.SECONDARY_CODECS and record["ratio"] < 1
+    assert record["output"].endswith(Utils.COMPRESSED_DELTA_EXTENSIONS)
+    assert not os.path.exists(delta_file)
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(record["output"])]
+
+    restored = Utils.decompress_delta_output(record["output"])
+    assert restored == delta_file
+    with open(restored, "rb") as f:
+        assert f.read() == data
+
+
+def test_incompressible_delta_is_kept(tmp_path):
+    delta_file = str(tmp_path / "vendor.delta")
+    with open(delta_file, "wb") as f:
+        f.write(os.urandom(64 * 1024))
+
+    record = Utils.compress_delta_outputs([delta_file], time_budget_seconds=60)[delta_file]
+
+    assert record == {"codec": "none", "ratio": 1.0, "seconds": 0.0, "output": delta_file}
+    assert os.listdir(tmp_path) == ["vendor.delta"]
+
+
+def test_unknown_extension_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="Not a compressed delta"):
+        Utils.decompress_delta_output(str(tmp_path / "system.delta.zz"))
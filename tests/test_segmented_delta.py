@@ -0,0 +1,96 @@
+"""Segmented delta container: plan, encode -> apply round trip and corruption checks."""
+import json
+import os
+import random
+import struct
+
+import pytest
+
+from deltaGen_Agent import segmented_delta
+from deltaGen_Agent.Utils import find_xdelta_executable
+
+MIB = 1024 * 1024
+
+needs_xdelta = pytest.mark.skipif(find_xdelta_executable() is None, reason="xdelta3 is not installed")
+
+
+def _write_images(directory):
+    rng = random.Random(34)
+    source = bytearray(rng.randbytes(5 * MIB + 12345))
+    target = bytearray(source)
+    for offset in range(0, len(target), 700 * 1024):
+        target[offset:offset + 512] = rng.randbytes(512)
+    # Shift the second half by an insertion, as a rebuilt filesystem would
+    target[3 * MIB:3 * MIB] = rng.randbytes(4096)
+    source_file, target_file = directory / "source.img", directory / "target.img"
+    source_file.write_bytes(bytes(source))
+    target_file.write_bytes(bytes(target))
+    return str(source_file), str(target_file)
+
+
+def _encode(tmp_path):
+    source_file, target_file = _write_images(tmp_path)
+    container = str(tmp_path / "target.segdelta")
+    encoded = segmented_delta.encode_segmented(source_file, target_file, container,
+                                               segment_size=MIB, overlap=256 * 1024, workers=2)
+    return source_file, target_file, container, encoded
+
+
+def test_plan_covers_target_once():
+    segments = segmented_delta.plan_segments(10 * MIB, 5 * MIB + 1, segment_size=2 * MIB, overlap=MIB)
+    assert [s["target_offset"] for s in segments] == [0, 2 * MIB, 4 * MIB]
+    assert sum(s["target_length"] for s in segments) == 5 * MIB + 1
+    assert segments[1]["source_offset"] == MIB and segments[1]["source_length"] == 4 * MIB
+
+
+@needs_xdelta
+def test_round_trip(tmp_path):
+    source_file, target_file, container, encoded = _encode(tmp_path)
+    assert encoded["segments"] == 6
+    assert segmented_delta.is_segmented_delta(container)
+
+    rebuilt = str(tmp_path / "rebuilt.img")
+    applied = segmented_delta.apply_segmented(source_file, container, rebuilt, workers=2)
+    assert applied["segments"] == 6
+    with open(rebuilt, 'rb') as a, open(target_file, 'rb') as b:
+        assert a.read() == b.read()
+
+
+@needs_xdelta
+def test_corrupted_segment_delta_is_rejected(tmp_path):
+    source_file, _, container, _ = _encode(tmp_path)
+    header, offset = segmented_delta.read_container_header(container)
+    # Flip bytes in the middle of the third segment's delta
+    position = offset + sum(s["delta_length"] for s in header["segments"][:2]) + header["segments"][2]["delta_length"] // 2
+    with open(container, 'r+b') as f:
+        f.seek(position)
+        data = f.read(16)
+        f.seek(position)
+        f.write(bytes(b ^ 0xFF for b in data))
+
+    with pytest.raises((RuntimeError, ValueError)):
+        segmented_delta.apply_segmented(source_file, container, str(tmp_path / "rebuilt.img"), workers=2)
+
+
+@needs_xdelta
+def test_segment_checksum_mismatch_is_rejected(tmp_path):
+    source_file, _, container, _ = _encode(tmp_path)
+    header, offset = segmented_delta.read_container_header(container)
+    with open(container, 'rb') as f:
+        f.seek(offset)
+        deltas = f.read()
+    header["segments"][4]["target_sha256"] = "0" * 64
+    header_bytes = json.dumps(header).encode()
+    with open(container, 'wb') as f:
+        f.write(segmented_delta.SEGMENT_MAGIC + struct.pack(">Q", len(header_bytes)) + header_bytes + deltas)
+
+    with pytest.raises(ValueError, match="Segment 4 checksum mismatch"):
+        segmented_delta.apply_segmented(source_file, container, str(tmp_path / "rebuilt.img"), workers=2)
+
+
+def test_rejects_non_container(tmp_path):
+    path = tmp_path / "plain.delta"
+    path.write_bytes(b"\xd6\xc3\xc4\x00" + bytes(100))
+    assert not segmented_delta.is_segmented_delta(str(path))
+    with pytest.raises(ValueError):
+        segmented_delta.read_container_header(str(path))